@@ -0,0 +1,609 @@
+"""
+End to end grader throughput on a synthetic corpus of submissions.
+
+Generates python and java submissions of every kind the graders see in a real
+class (good, bad style, infinite loops, code that doesn't compile, very large
+files), grades all of them with ICS3UGrader/ICS4UGrader at a few concurrency
+levels, and writes submissions/second, latency percentiles and the per-stage
+breakdown from each grader's trace as JSON. Save the JSON of one commit and pass
+it to --compare on the next to see what changed.
+
+Every level is also graded with the style checks run after the unit tests
+instead of alongside them, and the latency that overlapping them saves is
+reported as `style_overlap_saving` (skip that with --no-sequential).
+
+Java is skipped (and says so in the results) without javac or the JUnit jar.
+
+usage: python -m benchmarks.bench_graders [--scale N] [--concurrency N [N ...]]
+           [--languages python java] [--zygote] [--jvm] [--junit-jar PATH]
+           [--no-sequential] [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import json
+import math
+from pathlib import Path
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from pycs.grader import (
+    JUNIT_JAR,
+    JvmDaemon,
+    PytestZygote,
+    ResourceLimits,
+    WorkspacePool,
+    build_test_artifacts,
+    get_grader,
+)
+
+# How many submissions of each kind go into the corpus, per --scale.
+# Roughly what a class's submissions to one assignment look like.
+MIX = {
+    "good": 8,
+    "bad_style": 4,
+    "compile_error": 2,
+    "large": 2,
+    "infinite_loop": 1,
+}
+
+# The GradingQueue defaults
+LIMITS = ResourceLimits(
+    cpu_seconds=10,
+    address_space=512 * 1024 * 1024,
+    processes=1024,
+    file_size=16 * 1024 * 1024,
+    output_bytes=64 * 1024,
+)
+
+PY_TEST = '''from stats import largest, mean
+
+
+def test_mean():
+    assert mean([1, 2, 3]) == 2
+
+
+def test_mean_empty():
+    assert mean([]) == 0
+
+
+def test_largest():
+    assert largest([4, 9, 2]) == 9
+
+
+def test_largest_negative():
+    assert largest([-4, -9, -2]) == -2
+'''
+
+PY_GOOD = '''"""
+author: {author}
+date: 01/09/2024
+Finds the average and the largest of some numbers.
+"""
+
+
+def mean(values):
+    # processing
+    if not values:
+        return 0
+    {total} = 0
+    for value in values:
+        {total} += value
+    return {total} / len(values)
+
+
+def largest(values):
+    # processing
+    {best} = values[0]
+    for value in values[1:]:
+        if value > {best}:
+            {best} = value
+    return {best}
+
+
+def main():
+    # input
+    {numbers} = [int(x) for x in input("Numbers: ").split()]
+    # output
+    print(mean({numbers}), largest({numbers}))
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+PY_BAD_STYLE = '''def mean(values):
+    {total}Sum = 0
+    for value in values:
+        {total}Sum += value
+    return {total}Sum / len(values)
+
+
+def largest(values):
+    Best{best} = 0
+    for value in values:
+        if value > Best{best}:
+            Best{best} = value
+    return Best{best}
+'''
+
+PY_INFINITE_LOOP = PY_GOOD.replace(
+    "    for value in values:\n        {total} += value\n",
+    "    while True:\n        {total} += 1\n",
+)
+
+PY_COMPILE_ERROR = PY_GOOD.replace("def largest(values):", "def largest(values)")
+
+PY_HELPER = '''
+
+def helper_{n}(values):
+    # processing
+    {total}_{n} = 0
+    for value in values:
+        if value % {m} == 0:
+            {total}_{n} += value
+    return {total}_{n}
+'''
+
+JAVA_TEST = """import static org.junit.jupiter.api.Assertions.assertEquals;
+
+import org.junit.jupiter.api.Test;
+
+public class TestStats {
+    @Test
+    public void testMean() {
+        assertEquals(2.0, Stats.mean(new int[] {1, 2, 3}));
+    }
+
+    @Test
+    public void testMeanEmpty() {
+        assertEquals(0.0, Stats.mean(new int[] {}));
+    }
+
+    @Test
+    public void testLargest() {
+        assertEquals(9, Stats.largest(new int[] {4, 9, 2}));
+    }
+
+    @Test
+    public void testLargestNegative() {
+        assertEquals(-2, Stats.largest(new int[] {-4, -9, -2}));
+    }
+}
+"""
+
+JAVA_GOOD = """package stats;
+
+import java.util.Scanner;
+
+/**
+ * Author: {author}
+ * Date: 01/09/2024
+ * Finds the average and the largest of some numbers.
+ */
+public class Stats {{
+    public static double mean(int[] values) {{
+        // processing
+        if (values.length == 0) {{
+            return 0;
+        }}
+        int {total} = 0;
+        for (int value : values) {{
+            {total} += value;
+        }}
+        return (double) {total} / values.length;
+    }}
+
+    public static int largest(int[] values) {{
+        // processing
+        int {best} = values[0];
+        for (int value : values) {{
+            if (value > {best}) {{
+                {best} = value;
+            }}
+        }}
+        return {best};
+    }}
+{helpers}
+    public static void main(String[] args) {{
+        // input
+        Scanner in = new Scanner(System.in);
+        int[] {numbers} = {{in.nextInt(), in.nextInt()}};
+        // output
+        System.out.println(mean({numbers}) + " " + largest({numbers}));
+    }}
+}}
+"""
+
+JAVA_BAD_STYLE = """public class Stats {{
+    public static double mean(int[] values) {{
+        int {total}_sum = 0;
+        for (int value : values) {{
+            {total}_sum += value;
+        }}
+        return {total}_sum / values.length;
+    }}
+
+    public static int largest(int[] values) {{
+        int Best{best} = 0;
+        for (int value : values) {{
+            if (value > Best{best}) {{
+                Best{best} = value;
+            }}
+        }}
+        return Best{best};
+    }}
+}}
+"""
+
+JAVA_INFINITE_LOOP = JAVA_GOOD.replace(
+    "        for (int value : values) {{\n            {total} += value;\n",
+    "        while (true) {{\n            {total} += 1;\n",
+)
+
+JAVA_COMPILE_ERROR = JAVA_GOOD.replace("return {best};", "return {best}")
+
+JAVA_HELPER = """
+    public static int helper{n}(int[] values) {{
+        // processing
+        int {total}{n} = 0;
+        for (int value : values) {{
+            if (value % {m} == 0) {{
+                {total}{n} += value;
+            }}
+        }}
+        return {total}{n};
+    }}
+"""
+
+NAMES = ["Ada", "Grace", "Alan", "Linus", "Barbara", "Dennis", "Margaret", "Ken"]
+TOTALS = ["total", "running_sum", "acc", "sum_so_far"]
+BESTS = ["best", "biggest", "champ", "top"]
+NUMBERS = ["numbers", "user_values", "nums", "data"]
+LARGE_HELPERS = 400
+
+
+@dataclass
+class Submission:
+    kind: str
+    language: str
+    code_path: Path
+
+
+def _python_source(kind: str, rng: random.Random) -> str:
+    names = {
+        "author": rng.choice(NAMES),
+        "total": rng.choice(TOTALS),
+        "best": rng.choice(BESTS),
+        "numbers": rng.choice(NUMBERS),
+    }
+    template = {
+        "good": PY_GOOD,
+        "large": PY_GOOD,
+        "bad_style": PY_BAD_STYLE,
+        "infinite_loop": PY_INFINITE_LOOP,
+        "compile_error": PY_COMPILE_ERROR,
+    }[kind]
+    source = template.format(**names)
+    if kind == "large":
+        source += "".join(
+            PY_HELPER.format(n=n, m=n % 7 + 2, total=names["total"])
+            for n in range(LARGE_HELPERS)
+        )
+    return source
+
+
+def _java_source(kind: str, rng: random.Random) -> str:
+    # Java variables are camelCase
+    names = {
+        "author": rng.choice(NAMES),
+        "total": rng.choice(TOTALS).split("_")[0],
+        "best": rng.choice(BESTS),
+        "numbers": rng.choice(NUMBERS).split("_")[0],
+    }
+    template = {
+        "good": JAVA_GOOD,
+        "large": JAVA_GOOD,
+        "bad_style": JAVA_BAD_STYLE,
+        "infinite_loop": JAVA_INFINITE_LOOP,
+        "compile_error": JAVA_COMPILE_ERROR,
+    }[kind]
+    helpers = ""
+    if kind == "large":
+        helpers = "".join(
+            JAVA_HELPER.format(n=n, m=n % 7 + 2, total=names["total"])
+            for n in range(LARGE_HELPERS)
+        )
+    if template is JAVA_BAD_STYLE:
+        return template.format(**names)
+    return template.format(helpers=helpers, **names)
+
+
+def make_corpus(
+    root: Path, languages: list[str], scale: int, seed: int, junit_jar: Path | None
+) -> list[Submission]:
+    """Lay out submissions the way UPLOAD_FOLDER does: one folder per student next
+    to the tests/ (or tests-java/) folder, with the test artifacts built"""
+    rng = random.Random(seed)
+    submissions = []
+    for language in languages:
+        language_root = root / language
+        if language == "python":
+            test_path = language_root / "tests" / "test_stats.py"
+            test_source, code_filename, source_for = PY_TEST, "stats.py", _python_source
+        else:
+            test_path = language_root / "tests-java" / "TestStats.java"
+            test_source, code_filename, source_for = JAVA_TEST, "Stats.java", _java_source
+            (language_root / "lib").mkdir(parents=True)
+            (language_root / "lib" / JUNIT_JAR).symlink_to(junit_jar.resolve())
+        test_path.parent.mkdir(parents=True)
+        test_path.write_text(test_source)
+        build_test_artifacts(test_path)
+
+        student_number = 100000000
+        for kind, count in MIX.items():
+            for _ in range(count * scale):
+                student_number += 1
+                code_path = language_root / str(student_number) / code_filename
+                code_path.parent.mkdir()
+                code_path.write_text(source_for(kind, rng))
+                submissions.append(Submission(kind, language, code_path))
+    # Graded in no particular order, like a real queue
+    rng.shuffle(submissions)
+    return submissions
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _grade(submission: Submission, grader_options: dict, overlap: bool) -> dict:
+    class_id = 1 if submission.language == "python" else 2
+    start = time.perf_counter()
+    try:
+        grader = get_grader(class_id, submission.code_path, **grader_options)
+        grader.overlap_style = overlap
+        score, _ = grader.grade_student()
+    except Exception as e:
+        return {
+            "kind": submission.kind,
+            "seconds": time.perf_counter() - start,
+            "error": repr(e),
+        }
+    return {
+        "kind": submission.kind,
+        "seconds": time.perf_counter() - start,
+        "score": score,
+        "stages": dict(grader.trace.timings),
+    }
+
+
+def _summarize(
+    language: str, concurrency: int, graded: list[dict], elapsed: float
+) -> dict:
+    latencies = [g["seconds"] for g in graded]
+    stages = defaultdict(list)
+    scores = defaultdict(list)
+    for g in graded:
+        for stage, seconds in g.get("stages", {}).items():
+            stages[stage].append(seconds)
+        if "score" in g:
+            scores[g["kind"]].append(g["score"])
+    return {
+        "language": language,
+        "concurrency": concurrency,
+        "submissions": len(graded),
+        "seconds": elapsed,
+        "submissions_per_second": len(graded) / elapsed,
+        "latency": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies),
+        },
+        "stages": {
+            stage: {
+                "p50": percentile(seconds, 50),
+                "p95": percentile(seconds, 95),
+                "total": sum(seconds),
+            }
+            for stage, seconds in sorted(stages.items())
+        },
+        # Scores shouldn't move between commits, a change here is a grading change
+        "mean_score": {
+            kind: round(sum(s) / len(s), 2) for kind, s in sorted(scores.items())
+        },
+        "errors": [g["error"] for g in graded if "error" in g],
+    }
+
+
+def run_level(
+    language: str,
+    submissions: list[Submission],
+    concurrency: int,
+    grader_options: dict,
+    overlap: bool = True,
+) -> dict:
+    """Grade every submission with `concurrency` threads, like the grading queue's
+    worker pool, and summarize how it went"""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        graded = list(
+            pool.map(lambda s: _grade(s, grader_options, overlap), submissions)
+        )
+    elapsed = time.perf_counter() - start
+    return _summarize(language, concurrency, graded, elapsed)
+
+
+def style_overlap_saving(run: dict, sequential: dict) -> dict:
+    """How much latency checking the style alongside the tests saved, in seconds
+    and as a fraction of the sequential latency"""
+    saving = {}
+    for pct in ("p50", "p95"):
+        before, after = sequential["latency"][pct], run["latency"][pct]
+        saving[pct] = before - after
+        saving[f"{pct}_fraction"] = (before - after) / before if before else 0.0
+    saving["sequential_submissions_per_second"] = sequential["submissions_per_second"]
+    return saving
+
+
+def _git_commit() -> str | None:
+    try:
+        process = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return process.stdout.decode().strip()
+
+
+def _print_run(run: dict):
+    latency = run["latency"]
+    print(
+        f"{run['language']:<7} x{run['concurrency']:<3}"
+        f" {run['submissions_per_second']:8.2f} submissions/s"
+        f"  p50 {latency['p50'] * 1000:7.1f} ms  p95 {latency['p95'] * 1000:7.1f} ms"
+        f"  errors {len(run['errors'])}",
+        file=sys.stderr,
+    )
+    saving = run.get("style_overlap_saving")
+    if saving is not None:
+        print(
+            f"{'':<12} overlapping style checks saved"
+            f" p50 {saving['p50'] * 1000:6.1f} ms ({saving['p50_fraction']:.0%})"
+            f"  p95 {saving['p95'] * 1000:6.1f} ms ({saving['p95_fraction']:.0%})",
+            file=sys.stderr,
+        )
+
+
+def compare(results: dict, baseline: dict):
+    """Print how throughput and latency moved against an older run"""
+    old_runs = {(r["language"], r["concurrency"]): r for r in baseline["runs"]}
+    print(
+        f"--- against {baseline.get('commit') or 'baseline'} ---", file=sys.stderr
+    )
+    for run in results["runs"]:
+        old = old_runs.get((run["language"], run["concurrency"]))
+        if old is None:
+            continue
+        throughput = run["submissions_per_second"] / old["submissions_per_second"]
+        p95 = run["latency"]["p95"] / old["latency"]["p95"]
+        scores = "" if run["mean_score"] == old["mean_score"] else "  SCORES CHANGED"
+        print(
+            f"{run['language']:<7} x{run['concurrency']:<3}"
+            f" throughput {throughput:6.2f}x  p95 latency {p95:6.2f}x{scores}",
+            file=sys.stderr,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=int, default=1, help="copies of the mix")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument(
+        "--languages", nargs="+", choices=["python", "java"], default=["python", "java"]
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--zygote", action="store_true", help="fork pytest runs")
+    parser.add_argument("--jvm", action="store_true", help="use the grading daemon")
+    parser.add_argument("--sandbox-pool", type=int, default=4)
+    parser.add_argument("--no-limits", action="store_true")
+    parser.add_argument(
+        "--no-sequential",
+        action="store_true",
+        help="don't also grade with the style checks after the tests",
+    )
+    parser.add_argument(
+        "--junit-jar", type=Path, default=Path("instance/code/lib") / JUNIT_JAR
+    )
+    parser.add_argument("--output", type=Path, help="write the JSON here, not stdout")
+    parser.add_argument("--compare", type=Path, help="JSON from an earlier run")
+    args = parser.parse_args()
+
+    results = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "options": {
+            "scale": args.scale,
+            "seed": args.seed,
+            "zygote": args.zygote,
+            "jvm": args.jvm,
+            "sandbox_pool": args.sandbox_pool,
+            "sequential": not args.no_sequential,
+            "limits": None if args.no_limits else LIMITS.to_dict(),
+        },
+        "mix": MIX,
+        "skipped": {},
+        "runs": [],
+    }
+    languages = list(args.languages)
+    if "java" in languages:
+        if shutil.which("javac") is None:
+            results["skipped"]["java"] = "javac not found"
+        elif not args.junit_jar.is_file():
+            results["skipped"]["java"] = f"{args.junit_jar} not found"
+        if "java" in results["skipped"]:
+            languages.remove("java")
+
+    root = Path(tempfile.mkdtemp(prefix="pycs-bench-"))
+    grader_options = {} if args.no_limits else {"limits": LIMITS}
+    if args.zygote:
+        grader_options["pytest_zygote"] = PytestZygote()
+    if args.jvm and "java" in languages:
+        grader_options["jvm_daemon"] = JvmDaemon(
+            args.junit_jar,
+            size=max(args.concurrency),
+            limits=grader_options.get("limits"),
+        )
+    if args.sandbox_pool:
+        grader_options["workspaces"] = WorkspacePool(None, args.sandbox_pool)
+    try:
+        submissions = make_corpus(
+            root / "code", languages, args.scale, args.seed, args.junit_jar
+        )
+        for language in languages:
+            corpus = [s for s in submissions if s.language == language]
+            # One untimed pass warms up the zygote, the JVMs and the page cache
+            run_level(language, corpus[:2], 1, grader_options)
+            for concurrency in args.concurrency:
+                run = run_level(language, corpus, concurrency, grader_options)
+                if not args.no_sequential:
+                    sequential = run_level(
+                        language, corpus, concurrency, grader_options, overlap=False
+                    )
+                    run["style_overlap_saving"] = style_overlap_saving(run, sequential)
+                results["runs"].append(run)
+                _print_run(run)
+    finally:
+        for option in ("pytest_zygote", "jvm_daemon", "workspaces"):
+            if option in grader_options:
+                grader_options[option].close()
+        shutil.rmtree(root, ignore_errors=True)
+
+    for language, reason in results["skipped"].items():
+        print(f"{language:<7} skipped: {reason}", file=sys.stderr)
+    if args.compare is not None:
+        compare(results, json.loads(args.compare.read_text()))
+
+    output = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Compare the ICS4U style checks: the old per-criterion line regexes vs. one
+pass of the java_style tokenizer, on large synthetic java files.
+
+usage: python -m benchmarks.bench_java_style [--lines N] [--repeat N]
+"""
+
+import argparse
+import itertools
+import re
+import time
+
+from pycs.grader.java_style import analyze
+
+HEADER = """package bench;
+
+import java.util.ArrayList;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Map;
+
+/**
+ * Author: Bench Mark
+ * Date: 01/01/2024
+ * Lots of code.
+ */
+public class Bench {
+    private static final int MAX_SIZE = 100;
+    private List<Map<String, Integer>> tallies = new ArrayList<>();
+"""
+
+METHOD = """
+    /**
+     * Sums a few things, number {n}.
+     */
+    public int method{n}(int[] values, String label) {{
+        // input
+        int total = 0, count{n} = values.length;
+        List<String> names = new ArrayList<>();
+        Map<String, List<Integer>> groups = new HashMap<>();
+        // processing
+        for (int i = 0; i < count{n}; i++) {{
+            total += values[i]; // running total
+            if (values[i] == MAX_SIZE) {{
+                names.add("value = " + i);
+            }}
+        }}
+        for (String name : names) {{
+            groups.put(name, new ArrayList<>());
+        }}
+        double average_{n} = count{n} == 0 ? 0 : (double) total / count{n};
+        // output
+        System.out.println(label + ": " + average_{n});
+        return total;
+    }}
+"""
+
+
+def make_source(lines: int) -> str:
+    """A java class of roughly `lines` lines"""
+    method_lines = METHOD.count("\n")
+    methods = [METHOD.format(n=n) for n in range(max(1, lines // method_lines))]
+    return HEADER + "".join(methods) + "}\n"
+
+
+def legacy_style(file_contents: list[str]) -> tuple[list[str], list[str], list[str]]:
+    """The checks as they were before java_style: one regex pass per criterion"""
+    header_lines = list(
+        itertools.dropwhile(
+            lambda line: (line.strip() == "" or "import" in line or "package" in line),
+            file_contents,
+        )
+    )[:5]
+
+    variables = []
+    for line in file_contents:
+        var_in_line = re.search(r"^\s*[a-zA-Z]+ ([a-zA-Z_$][\w$]*)\s*[=;]", line)
+        if var_in_line:
+            beginning, end = var_in_line.span()
+            variables.append(line[beginning:end].strip().split()[1].removesuffix(";"))
+
+    file_string = "\n".join([line.strip().lower() for line in file_contents])
+    comments = re.findall(r"^\/\/\s?\w+", file_string, re.MULTILINE)
+    return header_lines, variables, comments
+
+
+def _bench(label: str, func, repeat: int) -> tuple[float, int]:
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        found = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<12} {elapsed * 1000:8.2f} ms/file  ({found} variables found)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    for lines in args.lines:
+        source = make_source(lines)
+        file_contents = source.splitlines()
+        print(f"--- {len(file_contents)} lines ---")
+        legacy = _bench(
+            "line regex", lambda: len(legacy_style(file_contents)[1]), args.repeat
+        )
+        tokenized = _bench(
+            "tokenizer",
+            lambda: len(analyze("\n".join(file_contents)).variables),
+            args.repeat,
+        )
+        print(f"{'ratio':<12} {tokenized / legacy:8.2f}x the line regex time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Compare ICS3UGrader pytest throughput: a fresh `pytest` subprocess per
+submission vs. forking from the pre-warmed zygote.
+
+usage: python -m benchmarks.bench_pytest_zygote [--submissions N]
+"""
+
+import argparse
+from pathlib import Path
+import shutil
+import tempfile
+import time
+
+from pycs.grader import ICS3UGrader, PytestZygote
+
+STUDENT_CODE = '''"""
+author: Bench Mark
+date: 01/01/2024
+Adds numbers.
+"""
+
+
+def add(a, b):
+    return a + b
+'''
+
+TEST_CODE = '''from add import add
+
+
+def test_small():
+    assert add(1, 2) == 3
+
+
+def test_negative():
+    assert add(-1, -2) == -3
+
+
+def test_wrong():
+    assert add(2, 2) == 5
+'''
+
+
+def _make_submission(root: Path) -> Path:
+    (root / "tests").mkdir()
+    (root / "tests" / "test_add.py").write_text(TEST_CODE)
+    student_dir = root / "123456789"
+    student_dir.mkdir()
+    (student_dir / "add.py").write_text(STUDENT_CODE)
+    return student_dir / "add.py"
+
+
+def _bench(label: str, code_path: Path, submissions: int, zygote=None) -> float:
+    # One warm-up run so the zygote start-up isn't counted against it
+    ICS3UGrader(code_path, zygote=zygote).grade_unit_test()
+
+    start = time.perf_counter()
+    for _ in range(submissions):
+        score, _ = ICS3UGrader(code_path, zygote=zygote).grade_unit_test()
+    elapsed = time.perf_counter() - start
+    rate = submissions / elapsed
+    print(f"{label:<12} {rate:8.2f} submissions/s  ({elapsed / submissions * 1000:.1f} ms each, score {score})")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--submissions", type=int, default=20)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="pycs-bench-"))
+    zygote = PytestZygote()
+    try:
+        code_path = _make_submission(root)
+        subprocess_rate = _bench("subprocess", code_path, args.submissions)
+        zygote_rate = _bench("zygote", code_path, args.submissions, zygote)
+        print(f"speedup      {zygote_rate / subprocess_rate:8.2f}x")
+    finally:
+        zygote.close()
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Content-addressed storage for submitted files.
+
+Every upload is kept, not just the latest one, so it is stored by the sha256 of
+its contents: identical files (a student uploading the same file twice, or the
+starter code handed in unchanged by half the class) are stored once. Blobs live
+in UPLOAD_FOLDER/blobs/<first 2 hex digits>/<the other 62>, zlib compressed, so
+no directory grows too big to list. A blob is written to a temporary file next
+to its final path and renamed into place, so a crash never leaves half a blob
+behind and readers never see one.
+"""
+
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+import zlib
+
+from flask import current_app
+
+BLOBS_DIR = "blobs"
+
+
+class BlobStore:
+    """Compressed files keyed by the sha256 of their contents"""
+
+    def __init__(self, root: Path):
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:]
+
+    def __contains__(self, digest: str) -> bool:
+        return self.path(digest).is_file()
+
+    def put(self, data: bytes) -> str:
+        """Store some data (unless it is already stored)
+
+        Returns:
+            The sha256 hex digest to get it back with
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if path.is_file():
+            return digest
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=path.parent)
+        try:
+            with os.fdopen(fd, "wb") as f_out:
+                f_out.write(zlib.compress(data))
+                f_out.flush()
+                os.fsync(f_out.fileno())
+            # Whoever renames last wins, and both wrote the same bytes
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        """The data stored under a digest
+
+        Raises:
+            FileNotFoundError if nothing is stored under it
+        """
+        return zlib.decompress(self.path(digest).read_bytes())
+
+
+def blob_store() -> BlobStore:
+    """The app's blob store, in UPLOAD_FOLDER/blobs"""
+    return BlobStore(Path(current_app.config["UPLOAD_FOLDER"]) / BLOBS_DIR)
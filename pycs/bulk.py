@@ -0,0 +1,236 @@
+"""
+Bulk grading of submissions handed in outside of pycs.
+
+When students hand their work in by email or D2L, the teacher collects the files
+into a zip (or a directory) with each file named by the student's number, e.g.
+`123456789.py`, `123456789_Hello.java` or `123456789/hello.py`. Whichever number
+in the path belongs to a student in the class is the one that counts. A bulk grade reads
+the zip one entry at a time, files each submission the way an upload would
+(UPLOAD_FOLDER/<student_number>/<required_filename>, plus the student's
+submission history), grades them all in parallel across a pool of processes and
+saves every score in one transaction.
+
+Run it with `flask grade-bulk <assignment_id> <zip or directory>` or the form on
+the assignment's page.
+"""
+
+from dataclasses import dataclass, field
+import os
+from pathlib import Path
+import re
+import threading
+import time
+from typing import Callable, Iterator
+import zipfile
+
+from flask import current_app
+
+STUDENT_NUMBER = re.compile(r"\d+")
+
+
+@dataclass
+class BulkGrade:
+    """Progress and outcome of bulk grading one zip or directory"""
+
+    assignment_id: int
+    total: int = 0
+    done: int = 0
+    status: str = "running"  # running, done or failed
+    error: str | None = None
+    # (file in the zip or directory, why) of files that weren't submissions
+    skipped: list[tuple[str, str]] = field(default_factory=list)
+    # (file in the zip or directory, the error) of submissions the grader choked on
+    failed: list[tuple[str, str]] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    elapsed: float | None = None
+
+    @property
+    def graded(self) -> int:
+        return self.done - len(self.failed)
+
+
+# The latest bulk grade of each assignment, for the teacher's assignment page
+_bulk_grades: dict[int, BulkGrade] = {}
+_bulk_grades_lock = threading.Lock()
+
+
+def get_bulk_grade(assignment_id: int) -> BulkGrade | None:
+    with _bulk_grades_lock:
+        return _bulk_grades.get(assignment_id)
+
+
+def _entries(source: Path) -> Iterator[tuple[str, Callable[[], bytes]]]:
+    """The `(name, read)` of every file in a zip or directory, without reading
+    any of them until asked to"""
+    if source.is_dir():
+        for path in sorted(source.rglob("*")):
+            if path.is_file():
+                yield str(path.relative_to(source)), path.read_bytes
+        return
+
+    with zipfile.ZipFile(source) as archive:
+        for info in archive.infolist():
+            if not info.is_dir():
+                yield info.filename, lambda info=info: archive.read(info)
+
+
+def _is_junk(name: str) -> bool:
+    """Files zip tools and file managers add that nobody handed in"""
+    parts = Path(name).parts
+    return any(part.startswith(".") or part == "__MACOSX" for part in parts)
+
+
+def grade_bulk(
+    assignment_id: int,
+    source: Path,
+    *,
+    workers: int | None = None,
+    progress: Callable[[BulkGrade], None] | None = None,
+    bulk: BulkGrade | None = None,
+) -> BulkGrade:
+    """File and grade every submission in a zip or directory, and save the scores.
+
+    Files that can't be matched to a student in the assignment's class, or that
+    aren't the assignment's kind of file, are listed in `skipped`. Submissions
+    that fail to grade are listed in `failed`, the rest are still saved.
+
+    Args:
+        assignment_id: The assignment the submissions are for
+        source: A zip file or a directory of submissions
+        workers: How many processes grade at once (GRADING_REGRADE_WORKERS by
+            default). 0 grades everything in this process.
+        progress: Called with the BulkGrade after every graded submission
+        bulk: The BulkGrade to report progress on, if it is already registered
+
+    Returns:
+        The finished BulkGrade
+
+    Raises:
+        ValueError if there is no such assignment, or the assignment takes no
+            submissions
+        TestFileMissingException if the assignment has no test file to grade with
+        zipfile.BadZipFile if `source` is neither a directory nor a zip
+    """
+    from pycs.controllers import assignment as ass_controller
+    from pycs.controllers import commit_change
+    from pycs.regrade import check_test_file, grade_all
+
+    config = current_app.config
+    workers = config["GRADING_REGRADE_WORKERS"] if workers is None else workers
+
+    if bulk is None:
+        bulk = BulkGrade(assignment_id)
+        with _bulk_grades_lock:
+            _bulk_grades[assignment_id] = bulk
+
+    try:
+        assignment = ass_controller.get_assignment_by_id(assignment_id)
+        if assignment is None:
+            raise ValueError(f"No assignment with id {assignment_id}")
+        if not assignment.required_filename:
+            raise ValueError(f"{assignment.name} does not take submissions")
+
+        students = {user.student_number: user for user in assignment.classroom.users}
+        suffix = Path(assignment.required_filename).suffix
+        upload_folder = Path(config["UPLOAD_FOLDER"])
+
+        # The last file of a student wins, like uploading twice
+        submissions: dict[int, tuple[str, Path]] = {}
+        for name, read in _entries(Path(source)):
+            if _is_junk(name):
+                continue
+            # Any number in the path may be it, `2024/Assignment1_123456789.py` too
+            numbers = set(STUDENT_NUMBER.findall(name)) & students.keys()
+            if not numbers:
+                reason = "no student in the class with that number"
+                bulk.skipped.append((name, reason))
+                continue
+            if len(numbers) > 1:
+                reason = "the numbers of more than one student in the class"
+                bulk.skipped.append((name, reason))
+                continue
+            user = students[numbers.pop()]
+            if Path(name).suffix != suffix:
+                bulk.skipped.append((name, f"not a {suffix} file"))
+                continue
+
+            code = read()
+            code_path = upload_folder / user.student_number / assignment.required_filename
+            code_path.parent.mkdir(parents=True, exist_ok=True)
+            code_path.write_bytes(code)
+            ass_controller.add_submission(
+                user.id, assignment.id, assignment.required_filename, code
+            )
+            submissions[user.id] = (name, code_path)
+
+        # Filed like uploads, whether or not they can be graded right now
+        commit_change()
+        bulk.total = len(submissions)
+        if submissions:
+            check_test_file(assignment, next(iter(submissions.values()))[1])
+
+        scores: list[tuple] = []
+
+        def record(user_id: int, *graded):
+            scores.append((user_id, *graded))
+            bulk.done += 1
+            if progress is not None:
+                progress(bulk)
+
+        def failed(user_id: int, error: Exception):
+            bulk.failed.append((submissions[user_id][0], str(error) or repr(error)))
+            bulk.done += 1
+            if progress is not None:
+                progress(bulk)
+
+        grade_all(
+            assignment.class_id,
+            [(user_id, code_path) for user_id, (_, code_path) in submissions.items()],
+            workers,
+            record,
+            failed,
+            shards=assignment.test_shards,
+        )
+        # Every score in one transaction
+        ass_controller.save_scores(assignment, scores)
+        bulk.status = "done"
+    except Exception as e:
+        bulk.status = "failed"
+        bulk.error = str(e)
+        raise
+    finally:
+        bulk.elapsed = time.monotonic() - bulk.started_at
+    return bulk
+
+
+def start_bulk_grade(assignment_id: int, source: Path) -> BulkGrade | None:
+    """Bulk grade an uploaded zip in a background thread (inline if GRADING_WORKERS
+    is 0) and delete it afterwards
+
+    Returns:
+        The bulk grade already running for this assignment, if there is one
+    """
+    # Checked and claimed at once, so two uploads can't both start one
+    with _bulk_grades_lock:
+        running = _bulk_grades.get(assignment_id)
+        if running is not None and running.status == "running":
+            os.unlink(source)
+            return running
+        bulk = _bulk_grades[assignment_id] = BulkGrade(assignment_id)
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                grade_bulk(assignment_id, source, bulk=bulk)
+            except Exception:
+                app.logger.exception("Bulk grading assignment %s failed", assignment_id)
+            finally:
+                os.unlink(source)
+
+    if app.config["GRADING_WORKERS"] == 0:
+        run()
+    else:
+        threading.Thread(target=run, name=f"bulk-{assignment_id}", daemon=True).start()
+    return None
@@ -1,10 +1,23 @@
 from datetime import datetime
+import itertools
+import math
+import time
 
-from flask import flash
+from flask import current_app, flash
+from sqlalchemy import case, func
 from sqlalchemy.exc import IntegrityError
 
+from pycs.blobs import blob_store
 from pycs.extensions import db
-from pycs.models import Assignment, User, UserAssignment, Weighting
+from pycs.models import (
+    Assignment,
+    GradingTiming,
+    Submission,
+    TestResult,
+    User,
+    UserAssignment,
+    Weighting,
+)
 
 
 def create_assignment(new_ass):
@@ -45,20 +58,298 @@ def get_class_assignments_of_user(class_id: int, user_id: int):
     return assignments_scores
 
 
-def score_ass(user, assignment, score, comments):
+def _set_usage(user_assignment, usage):
+    """Keep what grading used, unless nothing ran (like a cached result)"""
+    if usage is not None:
+        user_assignment.cpu_time = usage.cpu_time
+        user_assignment.max_rss = usage.max_rss
+
+
+def score_ass(user, assignment, score, comments, usage=None):
     """Add a new User_Assignment association, thus grading the student's assignment"""
     user_assignment = UserAssignment(user_id=user.id, score=score, comments=comments)
+    _set_usage(user_assignment, usage)
     db.session.commit()
     assignment.user_associations.append(user_assignment)
     user.assignment_associations.append(user_assignment)
     db.session.commit()
 
 
-def update_ass_score(user_assignment, score, comments):
+def update_ass_score(user_assignment, score, comments, usage=None):
     """Update the score and comments on a particular assignment"""
     user_assignment.score = score
     user_assignment.comments = comments
+    _set_usage(user_assignment, usage)
+    db.session.commit()
+
+
+def get_user_assignment(user_id: int, a_id: int):
+    """Get a student's score on an assignment, None if they haven't been graded"""
+    return db.session.execute(
+        db.select(UserAssignment).where(
+            UserAssignment.user_id == user_id, UserAssignment.assignment_id == a_id
+        )
+    ).scalar_one_or_none()
+
+
+def add_submission(user_id: int, assignment_id: int, filename: str, data: bytes):
+    """Keep an uploaded file in the blob store and add it to the student's history,
+    without committing"""
+    submission = Submission(
+        user_id=user_id,
+        assignment_id=assignment_id,
+        filename=filename,
+        blob=blob_store().put(data),
+        size=len(data),
+    )
+    db.session.add(submission)
+    return submission
+
+
+def save_submission(user_id: int, assignment_id: int, filename: str, data: bytes):
+    """Keep an uploaded file in the blob store and record it in the student's history"""
+    submission = add_submission(user_id, assignment_id, filename, data)
     db.session.commit()
+    return submission
+
+
+def get_submissions(user_id: int, a_id: int):
+    """Every version a student uploaded for an assignment, newest first"""
+    return db.session.execute(
+        db.select(Submission)
+        .where(Submission.user_id == user_id, Submission.assignment_id == a_id)
+        .order_by(Submission.submitted_at.desc(), Submission.id.desc())
+    ).scalars()
+
+
+def get_submission(submission_id: int):
+    """Get one uploaded version by id, None if there is no such submission"""
+    return db.session.get(Submission, submission_id)
+
+
+def read_submission(submission) -> bytes:
+    """The contents of an uploaded version
+
+    Raises:
+        FileNotFoundError if its blob is gone
+    """
+    return blob_store().get(submission.blob)
+
+
+def _replace_test_results(assignment_id: int, results: dict[int, list]):
+    """Swap the stored per-test results of some students for new ones, uncommitted
+
+    Args:
+        assignment_id: The assignment that was graded
+        results: The TestCaseResults of each graded student, by user id
+    """
+    db.session.execute(
+        db.delete(TestResult).where(
+            TestResult.assignment_id == assignment_id,
+            TestResult.user_id.in_(list(results)),
+        )
+    )
+    rows = [
+        {
+            "user_id": user_id,
+            "assignment_id": assignment_id,
+            "name": result.full_name,
+            "outcome": result.outcome,
+            "duration": result.duration,
+        }
+        for user_id, test_results in results.items()
+        for result in test_results
+    ]
+    if rows:
+        db.session.execute(db.insert(TestResult), rows)
+
+
+# How often old grading timings are pruned, and when they last were
+PRUNE_TIMINGS_SECONDS = 3600
+_timings_pruned_at = float("-inf")
+
+
+def _timings_since() -> datetime:
+    """The oldest grading timings still kept and counted"""
+    return datetime.now() - current_app.config["GRADING_TIMINGS_WINDOW"]
+
+
+def _prune_timings():
+    """Drop timings older than GRADING_TIMINGS_WINDOW, at most once in a while"""
+    global _timings_pruned_at
+    now = time.monotonic()
+    if now - _timings_pruned_at < PRUNE_TIMINGS_SECONDS:
+        return
+    _timings_pruned_at = now
+    db.session.execute(
+        db.delete(GradingTiming).where(GradingTiming.graded_at < _timings_since())
+    )
+
+
+def _add_timings(assignment_id: int, timings: dict[int, dict[str, float]]):
+    """Keep the stage timings of some grading runs, uncommitted, and drop the ones
+    that are too old to count
+
+    Args:
+        assignment_id: The assignment that was graded
+        timings: The seconds each stage took, by user id
+    """
+    rows = [
+        {
+            "user_id": user_id,
+            "assignment_id": assignment_id,
+            "stage": stage,
+            "seconds": seconds,
+        }
+        for user_id, stages in timings.items()
+        for stage, seconds in stages.items()
+    ]
+    if rows:
+        db.session.execute(db.insert(GradingTiming), rows)
+        _prune_timings()
+
+
+def save_score(
+    user_id: int,
+    assignment,
+    score,
+    comments,
+    test_results=None,
+    usage=None,
+    timings=None,
+):
+    """Score a student's assignment, updating the score if they have already submitted
+
+    The per-test results of the grading run replace the student's previous ones,
+    and the CPU time and memory it used and how long each stage took are kept, if
+    they are given.
+    """
+    if test_results is not None:
+        _replace_test_results(assignment.id, {user_id: test_results})
+    if timings:
+        _add_timings(assignment.id, {user_id: timings})
+    user_assignment = get_user_assignment(user_id, assignment.id)
+    if user_assignment is not None:
+        update_ass_score(user_assignment, score, comments, usage)
+    else:
+        user = db.session.get(User, user_id)
+        score_ass(user, assignment, score, comments, usage)
+
+
+def save_scores(assignment, scores: list[tuple]):
+    """Score many students on an assignment in one transaction
+
+    Args:
+        assignment: The assignment being scored
+        scores: (user_id, score, comments, test_results, usage, timings) of each
+            student
+    """
+    user_ids = [user_id for user_id, *_ in scores]
+    _replace_test_results(
+        assignment.id,
+        {user_id: test_results for user_id, _, _, test_results, _, _ in scores},
+    )
+    _add_timings(
+        assignment.id, {user_id: timings for user_id, *_, timings in scores if timings}
+    )
+    existing = {
+        ua.user_id: ua
+        for ua in db.session.execute(
+            db.select(UserAssignment).where(
+                UserAssignment.assignment_id == assignment.id,
+                UserAssignment.user_id.in_(user_ids),
+            )
+        ).scalars()
+    }
+    for user_id, score, comments, _, usage, _ in scores:
+        user_assignment = existing.get(user_id)
+        if user_assignment is None:
+            user_assignment = UserAssignment(
+                user_id=user_id, assignment_id=assignment.id
+            )
+            db.session.add(user_assignment)
+            existing[user_id] = user_assignment
+        user_assignment.score = score
+        user_assignment.comments = comments
+        _set_usage(user_assignment, usage)
+    db.session.commit()
+
+
+def get_test_pass_rates(class_id: int):
+    """How many students pass each unit test of a class's assignments, hardest first
+
+    Returns:
+        Rows of (assignment_id, assignment name, test name, students, passed)
+    """
+    passed = func.sum(case((TestResult.outcome == "passed", 1), else_=0))
+    students = func.count()
+    # Grouped over the (assignment_id, name, outcome) index, only a class's few
+    # assignments are looked up
+    return db.session.execute(
+        db.select(
+            Assignment.id,
+            Assignment.name,
+            TestResult.name,
+            students.label("students"),
+            passed.label("passed"),
+        )
+        .join(Assignment, Assignment.id == TestResult.assignment_id)
+        .where(Assignment.class_id == class_id)
+        .group_by(Assignment.id, TestResult.name)
+        .order_by(
+            (passed * 1.0 / students),
+            db.desc(Assignment.id),
+            TestResult.name,
+        )
+    ).all()
+
+
+def _percentile(ordered: list[float], percent: int) -> float:
+    """Nearest-rank percentile of some already sorted numbers"""
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def get_stage_percentiles() -> list[dict]:
+    """The median and 95th percentile seconds of every grading stage, per assignment,
+    over the last GRADING_TIMINGS_WINDOW
+
+    Returns:
+        One dict per assignment and stage, newest assignment first and stages in
+        the order they run
+    """
+    from pycs.grader.trace import STAGES
+
+    # Walks the (assignment_id, stage, seconds) index, already in order
+    rows = db.session.execute(
+        db.select(
+            GradingTiming.assignment_id, GradingTiming.stage, GradingTiming.seconds
+        )
+        .where(GradingTiming.graded_at >= _timings_since())
+        .order_by(
+            GradingTiming.assignment_id, GradingTiming.stage, GradingTiming.seconds
+        )
+    )
+    names = dict(db.session.execute(db.select(Assignment.id, Assignment.name)).all())
+
+    percentiles = []
+    for (a_id, stage), group in itertools.groupby(rows, key=lambda row: row[:2]):
+        seconds = [row[2] for row in group]
+        percentiles.append(
+            {
+                "assignment_id": a_id,
+                "assignment_name": names.get(a_id, ""),
+                "stage": stage,
+                "runs": len(seconds),
+                "p50": _percentile(seconds, 50),
+                "p95": _percentile(seconds, 95),
+            }
+        )
+
+    order = {stage: i for i, stage in enumerate(STAGES)}
+    percentiles.sort(
+        key=lambda p: (-p["assignment_id"], order.get(p["stage"], len(order)))
+    )
+    return percentiles
 
 
 def upload_assignment_grades(a_id, grades) -> int:
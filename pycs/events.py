@@ -0,0 +1,104 @@
+"""
+Live grading progress.
+
+The grading queue publishes what is happening to each student's submission
+(waiting in line, checking style, compiling, running tests, done) and the
+assignment page streams it with Server-Sent Events instead of reloading itself
+every few seconds.
+
+Publishing is in-process and never touches the database: every open stream has
+a small queue of its own, and the publisher drops events on a stream that can't
+keep up rather than wait for it. Workers on other machines (`flask
+grading-worker`) publish in their own process, so a stream that hears nothing
+for a while checks the grading_job table once before waiting again.
+"""
+
+from contextlib import contextmanager
+import json
+import queue
+import threading
+from typing import Iterator
+
+from pycs.grader import trace
+
+# What a student sees while their submission is graded
+QUEUED = "queued"
+GRADING = "grading"
+STYLE = "style"
+COMPILING = "compiling"
+TESTING = "testing"
+DONE = "done"
+
+# The progress event each grader stage starts. The style checks run while the
+# tests do, so the tests show up once they are compiling or running
+STAGE_EVENTS = {
+    trace.HEADER: STYLE,
+    trace.IPO: STYLE,
+    trace.VARIABLES: STYLE,
+    trace.COMPILE: COMPILING,
+    trace.TEST_RUN: TESTING,
+}
+
+# How many unread events a stream holds before newer ones are dropped
+STREAM_BUFFER = 32
+
+
+class GradingEvents:
+    """Pub/sub of grading progress, one channel per student's assignment"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: dict[tuple[int, int], set[queue.Queue]] = {}
+
+    def publish(self, user_id: int, assignment_id: int, event: str, **data):
+        """Tell everyone watching a student's assignment what just happened"""
+        message = {"event": event, **data}
+        with self._lock:
+            subscribers = list(self._subscribers.get((user_id, assignment_id), ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # A stalled browser doesn't get to hold up the grader
+                pass
+
+    @contextmanager
+    def subscribe(self, user_id: int, assignment_id: int) -> Iterator[queue.Queue]:
+        """A queue of the events published for a student's assignment while
+        the `with` block runs"""
+        key = (user_id, assignment_id)
+        subscriber = queue.Queue(STREAM_BUFFER)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(subscriber)
+        try:
+            yield subscriber
+        finally:
+            with self._lock:
+                subscribers = self._subscribers[key]
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[key]
+
+    def listener(self, user_id: int, assignment_id: int):
+        """A `Trace.listener` that publishes the stages of one grading run, each
+        progress event once"""
+        published = set()
+        lock = threading.Lock()
+
+        def listen(stage: str):
+            event = STAGE_EVENTS.get(stage)
+            if event is None:
+                return
+            # Stages are reported from the style and the unit test threads
+            with lock:
+                if event in published:
+                    return
+                published.add(event)
+            self.publish(user_id, assignment_id, event)
+
+        return listen
+
+
+def format_event(message: dict) -> str:
+    """One Server-Sent Event"""
+    return f"data: {json.dumps(message)}\n\n"
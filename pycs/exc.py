@@ -6,3 +6,13 @@ class JoinCodeInvalidException(Exception):
     pass
 
 
+class TestFileMissingException(Exception):
+    pass
+
+
+class GradingBacklogFullException(Exception):
+    """The grading queue is full, try again in `retry_after` seconds"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Grading backlog is full, retry after {retry_after}s")
+        self.retry_after = retry_after
@@ -1,10 +1,15 @@
+from pathlib import Path
+
 import click
 from flask import current_app
+from flask.cli import with_appcontext
 from flask_login import LoginManager
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.security import generate_password_hash
 
+from pycs.jobs import GradingQueue
+
 
 # Flask SQLAlchemy
 class Base(DeclarativeBase):
@@ -16,6 +21,9 @@ db = SQLAlchemy(model_class=Base)
 # Flask Login
 login_manager = LoginManager()
 
+# Grading jobs
+grading_queue = GradingQueue()
+
 
 @login_manager.user_loader
 def load_user(user_id):
@@ -28,7 +36,17 @@ def load_user(user_id):
 
 def init_db(teacherpass: str):
     """Clear existing data and create new tables"""
-    from pycs.models import Assignment, Classroom, User, UserAssignment, user_classroom
+    from pycs.models import (
+        Assignment,
+        Classroom,
+        GradingJob,
+        GradingTiming,
+        Submission,
+        TestResult,
+        User,
+        UserAssignment,
+        user_classroom,
+    )
 
     with current_app.app_context():
         db.create_all()
@@ -50,7 +68,95 @@ def command_init_db(teacherpass: str):
     click.echo("Database initialized")
 
 
+@click.command("regrade")
+@with_appcontext
+@click.argument("assignment_id", type=int)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Processes grading at once (default: GRADING_REGRADE_WORKERS)",
+)
+def command_regrade(assignment_id: int, workers: int | None):
+    """Regrade every stored submission for an assignment"""
+    from pycs.exc import TestFileMissingException
+    from pycs.regrade import regrade_assignment
+
+    def progress(regrade):
+        click.echo(f"Graded {regrade.done}/{regrade.total}")
+
+    try:
+        regrade = regrade_assignment(assignment_id, workers=workers, progress=progress)
+    except (ValueError, TestFileMissingException) as e:
+        raise click.ClickException(str(e))
+    for student_number, error in regrade.failed:
+        click.echo(f"Failed {student_number}: {error}")
+    rate = regrade.total / regrade.elapsed if regrade.elapsed else 0
+    click.echo(
+        f"Regraded {regrade.graded} submissions in {regrade.elapsed:.1f}s ({rate:.1f}/s),"
+        f" {len(regrade.failed)} failed"
+    )
+
+
+@click.command("grade-bulk")
+@with_appcontext
+@click.argument("assignment_id", type=int)
+@click.argument(
+    "source", type=click.Path(exists=True, dir_okay=True, path_type=Path)
+)
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Processes grading at once (default: GRADING_REGRADE_WORKERS)",
+)
+def command_grade_bulk(assignment_id: int, source: Path, workers: int | None):
+    """Grade a zip or directory of submissions named by student number"""
+    import zipfile
+
+    from pycs.bulk import grade_bulk
+    from pycs.exc import TestFileMissingException
+
+    def progress(bulk):
+        click.echo(f"Graded {bulk.done}/{bulk.total}")
+
+    try:
+        bulk = grade_bulk(assignment_id, source, workers=workers, progress=progress)
+    except (ValueError, TestFileMissingException, zipfile.BadZipFile) as e:
+        raise click.ClickException(str(e))
+    for name, reason in bulk.skipped:
+        click.echo(f"Skipped {name}: {reason}")
+    for name, error in bulk.failed:
+        click.echo(f"Failed {name}: {error}")
+    rate = bulk.done / bulk.elapsed if bulk.elapsed else 0
+    click.echo(
+        f"Graded {bulk.graded} submissions in {bulk.elapsed:.1f}s ({rate:.1f}/s),"
+        f" {len(bulk.failed)} failed, {len(bulk.skipped)} files skipped"
+    )
+
+
+@click.command("grading-worker")
+@click.option(
+    "--workers",
+    type=int,
+    default=None,
+    help="Submissions graded at once (default: GRADING_WORKERS)",
+)
+@click.option(
+    "--until-idle", is_flag=True, help="Exit once there is nothing left to grade"
+)
+def command_grading_worker(workers: int | None, until_idle: bool):
+    """Grade queued submissions, alongside the web server or on another machine"""
+    workers = current_app.config["GRADING_WORKERS"] if workers is None else workers
+    click.echo(f"Grading with {max(1, workers)} workers")
+    grading_queue.run_workers(max(1, workers), until_idle=until_idle)
+
+
 def init_app(app):
     db.init_app(app)
     login_manager.init_app(app)
+    grading_queue.init_app(app)
     app.cli.add_command(command_init_db)
+    app.cli.add_command(command_regrade)
+    app.cli.add_command(command_grade_bulk)
+    app.cli.add_command(command_grading_worker)
@@ -14,7 +14,7 @@ from wtforms import (
     SubmitField,
     TextAreaField,
 )
-from wtforms.validators import DataRequired, EqualTo, Length
+from wtforms.validators import DataRequired, EqualTo, Length, NumberRange
 
 
 class UserPassForm(FlaskForm):
@@ -121,6 +121,12 @@ class AssignmentForm(FlaskForm):
     visible = BooleanField("Visible?")
     weight = IntegerField("Weight", validators=[DataRequired()])
     class_id = IntegerField("Class Id", validators=[DataRequired()])
+    # A new assignment has no shard count until it is saved
+    test_shards = IntegerField(
+        "Test Shards",
+        filters=[lambda shards: shards or 1],
+        validators=[NumberRange(min=1, max=16)],
+    )
     unit_test_upload = FileField(
         validators=[
             FileAllowed(["py", "java"], "Python code (or java code) only"),
@@ -129,6 +135,30 @@ class AssignmentForm(FlaskForm):
     submit = SubmitField(label="Submit")
 
 
+class RegradeForm(FlaskForm):
+    """Regrade every submission of an assignment"""
+
+    submit = SubmitField(label="Regrade all submissions")
+
+
+class BulkGradeForm(FlaskForm):
+    """Grade a zip of submissions named by student number"""
+
+    submissions = FileField(
+        validators=[
+            FileRequired(),
+            FileAllowed(["zip"], "Submissions must be in a zip file."),
+        ]
+    )
+    submit = SubmitField("Grade submissions")
+
+
+class RegradeSubmissionForm(FlaskForm):
+    """Make an earlier version of a student's submission the current one and grade it"""
+
+    submit = SubmitField(label="Regrade this version")
+
+
 class ClassroomForm(FlaskForm):
     """New / Edit assignment form"""
 
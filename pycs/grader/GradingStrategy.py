@@ -1,10 +1,123 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import AbstractContextManager
 from pathlib import Path
+import threading
+from typing import Callable, TypeVar
+
+from .limits import ResourceLimits, Usage
+from .reports import TestCaseResult
+from .sandbox import WorkspacePool, temporary_workspace
+from . import trace
+from .trace import Trace
+
+T = TypeVar("T")
+
 
 class GradingStrategy(ABC):
-    def __init__(self, abs_code_path: Path):
+    # Bump this whenever a change to the grader changes scores or comments,
+    # so that cached results from the old grader are not reused
+    VERSION = 1
+
+    def __init__(
+        self,
+        abs_code_path: Path,
+        workspaces: WorkspacePool | None = None,
+        limits: ResourceLimits | None = None,
+        shards: int = 1,
+    ):
         self.abs_code_path = abs_code_path
         self.file_contents = self._read_code(abs_code_path)
+        # Set to False when grading hit something that may not happen again
+        # (like a timeout on a busy server), so the result is not cached
+        self.cacheable = True
+        # When given, test runs borrow their workspace from this pool
+        self.workspaces = workspaces
+        # Every test case from the last unit test run
+        self.test_results: list[TestCaseResult] = []
+        # The unit test level and comments once they are known. Setting them (and
+        # test_results) before grading reuses them instead of running the tests
+        self.unit_test: tuple[float, str] | None = None
+        # rlimits for every subprocess the grader starts
+        self.limits = limits
+        # CPU time and peak memory of those subprocesses, None if nothing ran
+        self.usage: Usage | None = None
+        self._usage_lock = threading.Lock()
+        # How many runs side by side the unit tests are split into
+        self.shards = max(1, shards)
+        # How long each stage of grading took
+        self.trace = Trace()
+        # Check the style while the unit tests run. Off only to measure what it saves
+        self.overlap_style = True
+
+    def _workspace(self) -> AbstractContextManager[Path]:
+        """A fresh, empty directory to run the tests in, removed afterwards"""
+        if self.workspaces is not None:
+            return self.workspaces.workspace()
+        return temporary_workspace()
+
+    def _record_usage(self, usage: Usage | None):
+        """Add what one more subprocess used to this grading's usage"""
+        if usage is not None:
+            # Shards record theirs from threads of their own
+            with self._usage_lock:
+                self.usage = usage.add(self.usage) if self.usage else usage
+
+    def _shard(self, test_ids: list[str] | None) -> list[list[str]]:
+        """Deal the tests out round robin into (at most) `shards` groups, or none
+        at all if they aren't worth splitting or aren't known for sure"""
+        if test_ids is None:
+            return []
+        count = min(self.shards, len(test_ids))
+        if count < 2:
+            return []
+        return [test_ids[i::count] for i in range(count)]
+
+    def _run_shards(
+        self, run: Callable[[int, list[str]], T], shards: list[list[str]]
+    ) -> list[T]:
+        """`run(index, test_ids)` for every shard at once, each in its own thread
+        (they spend their time waiting on a subprocess)"""
+        with ThreadPoolExecutor(len(shards), thread_name_prefix="shard") as pool:
+            return list(pool.map(run, range(len(shards)), shards))
+
+    def _unit_test(self) -> tuple[float, str]:
+        """`grade_unit_test()`, unless the unit test result is already known"""
+        if self.unit_test is None:
+            self.unit_test = self.grade_unit_test()
+        return self.unit_test
+
+    def _start_unit_test(self) -> Future[tuple[float, str]]:
+        """Start grading the unit tests in a thread of their own.
+
+        The tests spend nearly all their time waiting on a subprocess, so the
+        style checks can run meanwhile; `.result()` joins them.
+        """
+        future = Future()
+
+        def unit_test():
+            try:
+                with self.trace.stage(trace.UNIT_TEST):
+                    future.set_result(self._unit_test())
+            except BaseException as e:
+                future.set_exception(e)
+
+        if self.unit_test is not None or not self.overlap_style:
+            # Nothing to wait on, or asked not to overlap
+            unit_test()
+        else:
+            threading.Thread(target=unit_test, name="unit-test", daemon=True).start()
+        return future
+
+    def fingerprint(self) -> str | None:
+        """The student's code with comments and formatting normalized away.
+
+        Two submissions with the same fingerprint pass the same unit tests.
+
+        Returns:
+            The fingerprint, or None if the code can't be fingerprinted
+        """
+        return None
 
     def _read_code(self, abs_code_path: Path) -> list[str]:
         """Read a students code file into memroy
@@ -21,6 +134,11 @@ class GradingStrategy(ABC):
         with open(abs_code_path, mode="r", encoding="utf-8") as f_in:
             return f_in.read().splitlines()
 
+    @property
+    @abstractmethod
+    def abs_test_path(self) -> Path:
+        """The absolute path of the teacher's unit test file for this submission"""
+
     @abstractmethod
     def grade_header_comments(self) -> tuple[float, str]:
         """Checks for the presence and correctness of header comments.
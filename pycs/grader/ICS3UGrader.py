@@ -1,25 +1,63 @@
-import itertools
+from functools import cached_property
 from pathlib import Path
 import re
-import shutil
 import subprocess
 
-from . import GradingStrategy
+from .GradingStrategy import GradingStrategy
+from .artifacts import TestArtifacts, find_test_artifacts, python_test_ids
+from .py_style import HEADER_LINES, PyStyleReport, analyze, normalize, syntax_error
+from .limits import ResourceLimits, run
+from .reports import TestCaseResult, parse_junit_xml, summarize
+from . import trace
+from .sandbox import WorkspacePool, copy
+from .zygote import PytestZygote
+
+IPO_INPUT = re.compile(r"#\s?input")
+IPO_PROCESSING = re.compile(r"#\s?processing")
+IPO_OUTPUT = re.compile(r"#\s?output")
+IPO_PROCESSING_OUTPUT = re.compile(r"#\s?processing\s?/\s?output")
+
+# pytest's exit codes when every selected test ran (1: some of them failed)
+PYTEST_RAN = (0, 1)
+
+
+def _node_id(test_id: str) -> str:
+    """pytest's node id for a test id like `test_hello.TestGreet.test_name`"""
+    module, *names = test_id.split(".")
+    return "::".join([f"{module}.py", *names])
 
 
 class ICS3UGrader(GradingStrategy):
-    def __init__(self, abs_code_path: Path):
-        super().__init__(abs_code_path)
+    VERSION = 7
 
-    def grade_header_comments(self) -> tuple[float, str]:
-        # Ensure there are no blank lines at the beginning of the script!
-        # Lists are "pass by reference", so I copy the list to ensure that I do not destroy the file
-        # contents for other functions that need it!
-        file_contents = self.file_contents[::]
-        file_contents = list(
-            itertools.dropwhile(lambda line: line.strip() == "", file_contents)
-        )
+    def __init__(
+        self,
+        abs_code_path: Path,
+        zygote: PytestZygote | None = None,
+        workspaces: WorkspacePool | None = None,
+        limits: ResourceLimits | None = None,
+        shards: int = 1,
+    ):
+        super().__init__(abs_code_path, workspaces, limits, shards)
+        # When given, pytest runs are forked from this pre-warmed process
+        self.zygote = zygote
+
+    @property
+    def abs_test_path(self) -> Path:
+        student_dir = self.abs_code_path.parent
+        return student_dir.parent / "tests" / f"test_{self.abs_code_path.name}"
+
+    @cached_property
+    def style(self) -> PyStyleReport:
+        """One pass over the code collects everything the style checks need"""
+        return analyze("\n".join(self.file_contents))
 
+    def fingerprint(self) -> str | None:
+        return normalize("\n".join(self.file_contents))
+
+    def grade_header_comments(self) -> tuple[float, str]:
+        # The analyzer already skipped any blank lines at the beginning of the script
+        file_contents = self.style.header_lines
         if not file_contents:
             return 0, "Your file is blank... double check WHICh file you've uploaded"
         # Ensure docstring by checking the first line
@@ -27,6 +65,8 @@ class ICS3UGrader(GradingStrategy):
             return 0, "Docstrings are missing.\n"
         if file_contents[0] == "'''":
             return 2, "While ''' works, class conventions are \"\"\"\n"
+        # Short files are missing header lines, not crashing the grader
+        file_contents = file_contents + [""] * (HEADER_LINES - len(file_contents))
 
         # Checking class conventions for docstring
         comment = ""
@@ -50,22 +90,8 @@ class ICS3UGrader(GradingStrategy):
         return 4, "Header comments are good\n"
 
     def grade_var_names(self) -> tuple[float, str]:
-        # Lists are "pass by reference", so I copy the list to ensure that I do not destroy the file
-        # contents for other functions that need it!
-        file_contents = self.file_contents[::]
-
-        variables_in_file: list[str] = []
-        for line in file_contents:
-            # Match any line that:
-            # . starts with any number of spaces / indentations
-            # . contains letters (upper or lower), numbers, or underscores
-            # . those letters are followed by an equal sign, but only one equal sign
-            # . and there may or may not be spaces between the var name and the equal sign
-            # . gotta love regex
-            var_in_line = re.search(r"\s*[a-zA-Z0-9_]+\s*=[^=]", line)
-            if var_in_line:
-                beginning, end = var_in_line.span()
-                variables_in_file.append(line[beginning : end - 2].strip())
+        # Each name once, in the order they first show up
+        variables_in_file = list(dict.fromkeys(self.style.variables))
 
         def __is_snake_case(*, var):
             # All CAPS is okay!
@@ -88,11 +114,12 @@ class ICS3UGrader(GradingStrategy):
         return 4, "Variable names are good\n"
 
     def grade_ipo_comments(self) -> tuple[float, str]:
-        file_string = "\n".join([line.strip().lower() for line in self.file_contents])
-        has_i = re.search(r"^#\s?[Ii]nput", file_string, re.MULTILINE)
-        has_p = re.search(r"^#\s?[Pp]rocessing", file_string, re.MULTILINE)
-        has_o = re.search(r"^#\s?[Oo]utput", file_string, re.MULTILINE)
-        has_po = re.search(r"^#\s?[Pp]rocessing\s?/\s?[Oo]utput", file_string, re.MULTILINE)
+        # Comments from the analyzer are lowercase and only the ones that start a line
+        comments = self.style.comments
+        has_i = any(IPO_INPUT.match(c) for c in comments)
+        has_p = any(IPO_PROCESSING.match(c) for c in comments)
+        has_o = any(IPO_OUTPUT.match(c) for c in comments)
+        has_po = any(IPO_PROCESSING_OUTPUT.match(c) for c in comments)
 
         # Valid ipo comments:
         # All three present
@@ -108,49 +135,139 @@ class ICS3UGrader(GradingStrategy):
 
         return 4, "IPO comments are good\n"
 
-    def _run_pytest(self):
-        """Run the pytest application with a given test_*.py file and a given assignment directory"""
-        # Move pytest file to student's assignment directory
-        student_dir = self.abs_code_path.parent
-        code_filename = self.abs_code_path.name
-        abs_pytest_path = student_dir.parent / "tests" / f"test_{code_filename}"
-        shutil.copy2(abs_pytest_path, student_dir)
+    def _run_pytest(self) -> tuple[str, list[TestCaseResult]] | None:
+        """Run the pytest application with a given test_*.py file in a fresh workspace,
+        split across `shards` runs side by side when there are enough tests. If a
+        shard doesn't finish cleanly, some of its tests may not have run, so the
+        whole file runs again in one piece and that run counts.
+
+        Returns:
+            pytest's output and the result of every test, or None if a run timed out
+        """
+        abs_pytest_path = self.abs_test_path
+        if not abs_pytest_path.is_file():
+            raise FileNotFoundError(abs_pytest_path)
+
+        artifacts = find_test_artifacts(abs_pytest_path)
+        shards = self._shard(self._test_ids(abs_pytest_path, artifacts))
+        if shards:
 
+            def run_shard(_: int, test_ids: list[str]):
+                selection = [_node_id(test_id) for test_id in test_ids]
+                return self._run_pytest_once(abs_pytest_path, artifacts, selection)
+
+            results = self._run_shards(run_shard, shards)
+            if None in results:
+                return None
+            if all(returncode in PYTEST_RAN for returncode, _, _ in results):
+                output = ""
+                test_results = []
+                for i, (_, shard_output, shard_results) in enumerate(results, start=1):
+                    header = f"{f' Shard {i} of {len(results)} ':-^80}\n"
+                    output += header + shard_output
+                    test_results += shard_results
+                return output, test_results
+
+        result = self._run_pytest_once(abs_pytest_path, artifacts)
+        return None if result is None else result[1:]
+
+    def _test_ids(
+        self, abs_pytest_path: Path, artifacts: TestArtifacts | None
+    ) -> list[str] | None:
+        """The tests in the test file, or None if they aren't known for sure"""
+        if artifacts is not None:
+            return artifacts.test_ids
         try:
-            process = subprocess.run(
-                [
-                    "pytest",
-                    "--no-header",
-                    "-v",
-                    "--tb=short",
-                    f"{abs_pytest_path.name}",
-                ],
-                cwd=f"{student_dir}",
-                capture_output=True,
-                timeout=5,
-                check=False,
-            )
-        except subprocess.TimeoutExpired:
+            source = abs_pytest_path.read_text(encoding="utf-8")
+            return python_test_ids(source, abs_pytest_path.stem)
+        except (SyntaxError, ValueError, UnicodeDecodeError):
             return None
 
-        return process.stdout.decode()
+    def _run_pytest_once(
+        self,
+        abs_pytest_path: Path,
+        artifacts: TestArtifacts | None,
+        selection: list[str] | None = None,
+    ) -> tuple[int, str, list[TestCaseResult]] | None:
+        """One pytest run of the whole test file, or of only the `selection` of
+        node ids, in a workspace of its own
+
+        Returns:
+            pytest's exit code and output and the result of every test, or None if
+            the run timed out
+        """
+        with self._workspace() as workspace:
+            # The student's code and the test file side by side, nothing else
+            copy(workspace, self.abs_code_path)
+            if artifacts is not None:
+                # Already assert-rewritten and compiled when it was uploaded
+                artifacts.copy_into(workspace)
+            else:
+                copy(workspace, abs_pytest_path)
+
+            report = workspace / "report.xml"
+            pytest_args = [
+                "--no-header",
+                "-v",
+                "--tb=short",
+                f"--junitxml={report}",
+                *(selection or [f"{abs_pytest_path.name}"]),
+            ]
+            with self.trace.stage(trace.TEST_RUN):
+                if self.zygote is not None:
+                    result = self.zygote.run(
+                        pytest_args, workspace, timeout=5, limits=self.limits
+                    )
+                    if result is None:
+                        return None
+                    returncode, output, usage = result
+                else:
+                    try:
+                        process, usage = run(
+                            ["pytest", *pytest_args],
+                            cwd=f"{workspace}",
+                            timeout=5,
+                            limits=self.limits,
+                            trace=self.trace,
+                        )
+                    except subprocess.TimeoutExpired as e:
+                        self._record_usage(getattr(e, "usage", None))
+                        return None
+                    returncode = process.returncode
+                    output = process.stdout.decode(errors="replace")
+            self._record_usage(usage)
+
+            # No report means pytest itself could not run
+            with self.trace.stage(trace.PARSE):
+                results = list(parse_junit_xml(report)) if report.is_file() else []
+            return returncode, output, results
 
     def grade_unit_test(self) -> tuple[float, str]:
+        # Code that doesn't parse can't pass a test, no need to start pytest for it
+        with self.trace.stage(trace.PRECHECK):
+            error = syntax_error("\n".join(self.file_contents), self.abs_code_path.name)
+        if error is not None:
+            return (
+                1,
+                "\n\nYour code does not run. Python can't read it (try running it in VS Code):\n\n"
+                + error,
+            )
+
         # Run the pytest
-        pytest_output = self._run_pytest()
-        if pytest_output is None:
+        result = self._run_pytest()
+        if result is None:
+            self.cacheable = False
             return (
                 1,
                 "\n\nYour code has some kind of infinite loop. Either that or your program is waiting for input that my grader won't give it!",
             )
+        pytest_output, self.test_results = result
 
-        # Calculate their grade based off of how many tests they passed or failed
-        pytest_output_lines = pytest_output.splitlines()
-        test_lines = [
-            line for line in pytest_output_lines if re.search(r"[\s*\d+%]", line)
-        ]
-        num_failed = sum("FAILED" in line for line in test_lines)
-        num_passed = sum("PASSED" in line for line in test_lines)
+        # Calculate their grade based off of how many tests they passed or failed.
+        # Errors (like a broken fixture) are not the student's tests failing
+        summary = summarize(self.test_results)
+        num_failed = summary.failed
+        num_passed = summary.passed
         # Score is a number between 0 and 1
         try:
             score = num_passed / (num_passed + num_failed)
@@ -164,11 +281,17 @@ class ICS3UGrader(GradingStrategy):
         return round(score * 4, 1), pytest_output
 
     def grade_student(self) -> tuple[float, str]:
+        # The tests run in the background while the style is checked
+        unit_test = self._start_unit_test()
+
         # Gather all of the comments and scores
-        hc_score, hc_comments = self.grade_header_comments()
-        ipo_score, ipo_comments = self.grade_ipo_comments()
-        var_score, var_comments = self.grade_var_names()
-        ut_score, ut_comments = self.grade_unit_test()
+        with self.trace.stage(trace.HEADER):
+            hc_score, hc_comments = self.grade_header_comments()
+        with self.trace.stage(trace.IPO):
+            ipo_score, ipo_comments = self.grade_ipo_comments()
+        with self.trace.stage(trace.VARIABLES):
+            var_score, var_comments = self.grade_var_names()
+        ut_score, ut_comments = unit_test.result()
 
         # Calculate weighted score
         scores = [hc_score, ipo_score, var_score, ut_score]
@@ -1,34 +1,79 @@
-import fileinput
-import itertools
+from functools import cached_property
 from pathlib import Path
 import re
-import shutil
 import subprocess
-import sys
+import time
 
-from . import GradingStrategy
+from .GradingStrategy import GradingStrategy
+from .artifacts import TestArtifacts, find_test_artifacts, java_test_ids
+from .java_style import (
+    HEADER_LINES,
+    JavaStyleReport,
+    analyze,
+    normalize,
+    strip_package,
+    structure_error,
+)
+from .jvm import JvmDaemon
+from .limits import ResourceLimits, run
+from .reports import parse_reports_dir, summarize
+from . import trace
+from .sandbox import WorkspacePool, copy
+
+# Lives in UPLOAD_FOLDER/lib
+JUNIT_JAR = "junit-platform-console-standalone-1.7.0-all.jar"
+
+CODE_COMMENT = re.compile(r"//\s?\w+")
+
+# The console launcher's exit codes when every selected test ran (1: some failed)
+JUNIT_RAN = (0, 1)
+
+
+def _method_selector(test_id: str) -> str:
+    """The console launcher's --select-method for a test id like `TestHello.testHi()`"""
+    class_name, method = test_id.removesuffix("()").rsplit(".", 1)
+    return f"{class_name}#{method}"
 
 
 class ICS4UGrader(GradingStrategy):
-    def __init__(self, abs_code_path: Path):
-        super().__init__(abs_code_path)
+    VERSION = 7
+
+    def __init__(
+        self,
+        abs_code_path: Path,
+        jvm: JvmDaemon | None = None,
+        workspaces: WorkspacePool | None = None,
+        limits: ResourceLimits | None = None,
+        shards: int = 1,
+    ):
+        super().__init__(abs_code_path, workspaces, limits, shards)
+        # When given, code is compiled and tested inside this long lived JVM
+        self.jvm = jvm
+
+    @property
+    def abs_test_path(self) -> Path:
+        student_dir = self.abs_code_path.parent
+        return student_dir.parent / "tests-java" / f"Test{self.abs_code_path.name}"
 
-    def grade_header_comments(self) -> tuple[float, str]:
-        # Ensure there are no blank lines at the beginning of the script!
-        # Lists are "pass by reference", so I copy the list to ensure that I do not destroy the file
-        # contents for other functions that need it!
-        file_contents = self.file_contents[::]
-        file_contents = list(
-            itertools.dropwhile(
-                lambda line: (line.strip() == "" or "import" in line or "package" in line), file_contents
-            )
-        )
+    @cached_property
+    def style(self) -> JavaStyleReport:
+        """One pass over the code collects everything the style checks need"""
+        return analyze("\n".join(self.file_contents))
+
+    def fingerprint(self) -> str | None:
+        # The package is never compiled, so it can't change what the tests do
+        return normalize(self._code_without_package())
 
+    def grade_header_comments(self) -> tuple[float, str]:
+        # The analyzer already skipped blank lines, the package and any imports
+        file_contents = self.style.header_lines
         if not file_contents:
             return 0, "Your file is blank... double check WHICh file you've uploaded"
         # Ensure docstring by checking the first line
         if not file_contents[0] == "/**":
             return 0, "Header comments are missing.\n"
+        # Short files are missing header lines, not crashing the grader
+        file_contents = file_contents + [""] * (HEADER_LINES - len(file_contents))
 
         # Checking class conventions for docstring
         comment = ""
@@ -52,23 +97,8 @@ class ICS4UGrader(GradingStrategy):
         return 4, "Header comments are good\n"
 
     def grade_var_names(self) -> tuple[float, str]:
-        # Lists are "pass by reference", so I copy the list to ensure that I do not destroy the file
-        # contents for other functions that need it!
-        file_contents = self.file_contents[::]
-
-        variables_in_file: list[str] = []
-        for line in file_contents:
-            # Match any line that:
-            # . Starts with any number of spaces / indentations
-            # . Contains only letters (datatypes)
-            # . Followed by a space
-            # . Followed by all the letters
-            # . Followed by one equal sign or a semi colon
-            var_in_line = re.search(r"^\s*[a-zA-Z]+ ([a-zA-Z_$][\w$]*)\s*[=;]", line)
-            if var_in_line:
-                beginning, end = var_in_line.span()
-                var = line[beginning:end].strip().split()[1].removesuffix(";")
-                variables_in_file.append(var)
+        # Each name once, in the order they are declared
+        variables_in_file = list(dict.fromkeys(self.style.variables))
 
         def __is_camel_case(*, var):
             # All CAPS is okay!
@@ -91,8 +121,7 @@ class ICS4UGrader(GradingStrategy):
         return 4, "Variable names are good\n"
 
     def grade_ipo_comments(self) -> tuple[float, str]:
-        file_string = "\n".join([line.strip().lower() for line in self.file_contents])
-        code_comments = re.findall(r"^\/\/\s?\w+", file_string, re.MULTILINE)
+        code_comments = [c for c in self.style.comments if CODE_COMMENT.match(c)]
 
         if len(code_comments) == 0:
             return 0, "Missing comments\n"
@@ -101,121 +130,249 @@ class ICS4UGrader(GradingStrategy):
         
         return 4, "Comments are good\n"
 
-    def _does_code_compile(
-        self, code_filename: str, student_dir: Path
-    ) -> tuple[bool, str | None]:
-        """Check if the given java code compiles"""
+    def _run_java(self, args: list[str], workspace: Path) -> subprocess.CompletedProcess:
+        """Run javac or java in a workspace under the grading limits
+
+        Raises:
+            subprocess.TimeoutExpired if it takes more than 5 seconds
+        """
+        limits = self.limits
+        if limits is not None and limits.address_space is not None:
+            # The JVM reserves far more address space than it uses, cap its heap instead
+            heap = f"-Xmx{limits.address_space // (1024 * 1024)}m"
+            args = [args[0], heap if args[0] == "java" else f"-J{heap}", *args[1:]]
+            limits = limits.without_address_space()
         try:
-            process = subprocess.run(
-                ["javac", f"{code_filename}"],
-                cwd=f"{student_dir}",
-                capture_output=True,
-                timeout=5,
-                check=False,
+            process, usage = run(
+                args, cwd=f"{workspace}", timeout=5, limits=limits, trace=self.trace
             )
+        except subprocess.TimeoutExpired as e:
+            self._record_usage(getattr(e, "usage", None))
+            raise
+        self._record_usage(usage)
+        return process
+
+    def _compile(
+        self, workspace: Path, code_filename: str, junit_test_filename: str
+    ) -> tuple[bool, str | None]:
+        """Compile the student's code and the junit tests in one javac run
+
+        Returns:
+            Whether everything compiled, and javac's diagnostics (None on a timeout)
+        """
+        try:
+            with self.trace.stage(trace.COMPILE):
+                process = self._run_java(
+                    [
+                        "javac",
+                        "-d",
+                        ".",
+                        "-cp",
+                        str(self.junit_jar),
+                        code_filename,
+                        junit_test_filename,
+                    ],
+                    workspace,
+                )
         except subprocess.TimeoutExpired:
+            self.cacheable = False
             return False, None
         if process.returncode == 0:
-            return True, process.stdout.decode()
-        else:
-            return False, process.stderr.decode()
+            return True, process.stdout.decode(errors="replace")
+        return False, process.stderr.decode(errors="replace")
 
     def _run_junit(
-        self, student_dir: Path, code_filename: str, junit_test_filename: str
-    ) -> tuple[bool, str]:
-        """Run the junit jar file with a given Test*.java file and a given assignment directory"""
-        process = subprocess.run(
-            [
-                "javac",
-                "-cp",
-                str(
-                    student_dir.parent
-                    / "lib"
-                    / "junit-platform-console-standalone-1.7.0-all.jar"
-                ),
-                str(code_filename),
-                str(junit_test_filename),
-            ],
-            cwd=f"{student_dir}",
-            capture_output=True,
-            timeout=5,
-            check=False,
+        self,
+        workspace: Path,
+        junit_test_filename: str,
+        selection: list[str] | None = None,
+        reports_dir: str = "reports",
+    ) -> tuple[int | None, str]:
+        """Run the compiled Test*.java class in a given workspace with the junit jar,
+        or only the `selection` of its test ids
+
+        Returns:
+            The launcher's exit code (None if it timed out) and its output
+        """
+        if selection:
+            selectors = [
+                arg for test_id in selection for arg in ("-m", _method_selector(test_id))
+            ]
+        else:
+            selectors = ["-c", f"{junit_test_filename.removesuffix('.java')}"]
+        try:
+            with self.trace.stage(trace.TEST_RUN):
+                process = self._run_java(
+                    [
+                        "java",
+                        "-jar",
+                        str(self.junit_jar),
+                        "-cp",
+                        ".",
+                        *selectors,
+                        "--disable-banner",
+                        "--disable-ansi-colors",
+                        f"--reports-dir={reports_dir}",
+                    ],
+                    workspace,
+                )
+        except subprocess.TimeoutExpired:
+            self.cacheable = False
+            return (
+                None,
+                "I think you have an infinite loop in your code (OR infinite recursion!)",
             )
 
-        if process.returncode != 0:
-            return False, process.stderr.decode()
+        output = process.stdout.decode(errors="replace")
+        if process.returncode not in JUNIT_RAN:
+            # The JVM died (or the launcher gave up) partway, say why
+            output += process.stderr.decode(errors="replace")
+        return process.returncode, output
+
+    def _run_junit_shards(
+        self, workspace: Path, junit_test_filename: str, shards: list[list[str]]
+    ) -> tuple[int | None, str] | None:
+        """Run each shard of the tests in a JVM of its own, all at once, with its
+        report in reports-<shard>
+
+        Returns:
+            What `_run_junit` returns, with the output of every shard, or None if a
+            shard didn't finish cleanly and may not have run all of its tests
+        """
+
+        def run_shard(i: int, test_ids: list[str]):
+            return self._run_junit(
+                workspace, junit_test_filename, test_ids, f"reports-{i}"
+            )
 
-        try:
-            process = subprocess.run(
-                [
-                    "java",
-                    "-jar",
-                    str(
-                        student_dir.parent
-                        / "lib"
-                        / "junit-platform-console-standalone-1.7.0-all.jar"
-                    ),
-                    "-cp",
-                    ".",
-                    "-c",
-                    f"{junit_test_filename.removesuffix('.java')}",
-                    "--disable-banner",
-                    "--disable-ansi-colors",
-                ],
-                cwd=f"{student_dir}",
-                capture_output=True,
+        results = self._run_shards(run_shard, shards)
+        for returncode, output in results:
+            if returncode is None:
+                return None, output
+        if not all(returncode in JUNIT_RAN for returncode, _ in results):
+            return None
+        return max(returncode for returncode, _ in results), "".join(
+            f"{f' Shard {i} of {len(results)} ':-^80}\n" + output
+            for i, (_, output) in enumerate(results, start=1)
+        )
+
+    def _test_ids(
+        self, abs_junit_test_path: Path, artifacts: TestArtifacts | None
+    ) -> list[str] | None:
+        """The @Test methods of the test class, or None if they aren't known for
+        sure"""
+        if artifacts is not None:
+            return artifacts.test_ids
+        source = abs_junit_test_path.read_text(encoding="utf-8", errors="replace")
+        return java_test_ids(source, abs_junit_test_path.stem)
+
+    @property
+    def junit_jar(self) -> Path:
+        return self.abs_code_path.parent.parent / "lib" / JUNIT_JAR
+
+    def _code_without_package(self) -> str:
+        """The student's code with its package declaration blanked out.
+        Code is run outside of folders/packages"""
+        return strip_package("".join(line + "\n" for line in self.file_contents))
+
+    def grade_unit_test(self) -> tuple[float, str]:
+        code_filename = self.abs_code_path.name
+        abs_junit_test_path = self.abs_test_path
+        junit_test_filename = abs_junit_test_path.name
+        if not abs_junit_test_path.is_file():
+            raise FileNotFoundError(abs_junit_test_path)
+
+        # Mistakes javac is sure to reject are cheaper to find without a JVM
+        with self.trace.stage(trace.PRECHECK):
+            error = structure_error(self._code_without_package(), code_filename)
+        if error is not None:
+            return (1, f"\n\nError: {error}")
+
+        if self.jvm is not None:
+            return self._grade_with_jvm(code_filename, abs_junit_test_path)
+
+        with self._workspace() as workspace:
+            # The student's code is rewritten, so it is the one file that isn't copied
+            (workspace / code_filename).write_text(
+                self._code_without_package(), encoding="utf-8"
+            )
+            artifacts = find_test_artifacts(abs_junit_test_path)
+            if artifacts is not None:
+                artifacts.copy_into(workspace)
+            else:
+                copy(workspace, abs_junit_test_path)
+
+            # One javac run for both, its diagnostics are the student's feedback
+            code_compiles, err_message = self._compile(
+                workspace, code_filename, junit_test_filename
+            )
+            if not code_compiles:
+                return (1, f"\n\nError: {err_message}")
+
+            shards = self._shard(self._test_ids(abs_junit_test_path, artifacts))
+            junit = None
+            if shards:
+                junit = self._run_junit_shards(workspace, junit_test_filename, shards)
+                reports_dirs = [f"reports-{i}" for i in range(len(shards))]
+            if junit is None:
+                # Not sharded, or a shard crashed: the whole class in one run counts
+                junit = self._run_junit(workspace, junit_test_filename)
+                reports_dirs = ["reports"]
+            returncode, junit_output = junit
+            if returncode not in JUNIT_RAN:
+                return (1, junit_output)
+            with self.trace.stage(trace.PARSE):
+                self.test_results = [
+                    result
+                    for reports_dir in reports_dirs
+                    for result in parse_reports_dir(workspace / reports_dir)
+                ]
+
+        return self._score_results(junit_output)
+
+    def _grade_with_jvm(
+        self, code_filename: str, abs_junit_test_path: Path
+    ) -> tuple[float, str]:
+        """Compile and run the junit tests inside the grading daemon"""
+        with self._workspace() as reports_dir:
+            start = time.monotonic()
+            result = self.jvm.run(
+                code_filename,
+                self._code_without_package(),
+                abs_junit_test_path.name,
+                abs_junit_test_path.read_text(encoding="utf-8"),
                 timeout=5,
-                check=False,
+                reports_dir=reports_dir,
+                output_limit=self.limits.output_bytes if self.limits else None,
             )
-        except subprocess.TimeoutExpired:
+            # The daemon times its compile, the rest of the round trip is the tests
+            self.trace.add(trace.COMPILE, result.compile_seconds)
+            self.trace.add(
+                trace.TEST_RUN, time.monotonic() - start - result.compile_seconds
+            )
+            if result.status == "OK":
+                with self.trace.stage(trace.PARSE):
+                    self.test_results = list(parse_reports_dir(reports_dir))
+        if result.status == "COMPILE_ERROR":
+            return (1, f"\n\nError: {result.output}")
+        if result.status in ("TIMEOUT", "ERROR"):
+            self.cacheable = False
+        if result.status == "TIMEOUT":
             return (
-                False,
+                1,
                 "I think you have an infinite loop in your code (OR infinite recursion!)",
             )
+        if result.status == "ERROR":
+            return (1, result.output)
 
-        return True, process.stdout.decode()
+        return self._score_results(result.output)
 
-    def grade_unit_test(self) -> tuple[float, str]:
-        # Move Test file to student's assignment directory
-        student_dir = self.abs_code_path.parent
-        code_filename = self.abs_code_path.name
-        junit_test_filename = f"Test{code_filename}"
-        abs_junit_test_path = student_dir.parent / "tests-java" / junit_test_filename 
-        shutil.copy2(abs_junit_test_path, student_dir)
-
-        # Remove any package statements at top of code. Code is run outside of folders/packages
-        for line in fileinput.input(student_dir / code_filename, inplace=1):
-            if "package" in line:
-                line = line.replace(line, "")
-            sys.stdout.write(line)
-
-        # Check if java code compiles
-        code_compiles, err_message = self._does_code_compile(code_filename, student_dir)
-        if not code_compiles:
-            return (1, f"\n\nError: {err_message}")
-
-        junit_did_succeed, junit_output = self._run_junit(student_dir, code_filename, junit_test_filename)
-        if not junit_did_succeed:
-            return (1, junit_output)
-
-        # Calculate their grade based off of how many tests they passed or failed
-        # The last two lines of output indicate the number of passed and failed tests
-        junit_output_lines = junit_output.splitlines()[-3:-1]
-
-        def __find_number_in_str(string: str) -> int:
-            maybe_number = re.search(r"\d+", string)
-            if maybe_number is None:
-                return 0
-            number = maybe_number.group()
-            try:
-                number = int(number)
-            except ValueError:
-                return 0
-            return number
-
-        num_passed = __find_number_in_str(junit_output_lines[0])
-        num_failed = __find_number_in_str(junit_output_lines[1])
-        
+    def _score_results(self, junit_output: str) -> tuple[float, str]:
+        """Turn the number of passed and failed tests into a level"""
+        # JUnit counts a test that throws as failed, whatever it throws
+        summary = summarize(self.test_results)
+        num_passed = summary.passed
+        num_failed = summary.failed + summary.errors
         # Score is a number between 0 and 1
         try:
             score = num_passed / (num_passed + num_failed)
@@ -232,11 +389,17 @@ class ICS4UGrader(GradingStrategy):
 
 
     def grade_student(self) -> tuple[float, str]:
+        # The tests run in the background while the style is checked
+        unit_test = self._start_unit_test()
+
         # Gather all of the comments and scores
-        hc_score, hc_comments = self.grade_header_comments()
-        ipo_score, ipo_comments = self.grade_ipo_comments()
-        var_score, var_comments = self.grade_var_names()
-        ut_score, ut_comments = self.grade_unit_test()
+        with self.trace.stage(trace.HEADER):
+            hc_score, hc_comments = self.grade_header_comments()
+        with self.trace.stage(trace.IPO):
+            ipo_score, ipo_comments = self.grade_ipo_comments()
+        with self.trace.stage(trace.VARIABLES):
+            var_score, var_comments = self.grade_var_names()
+        ut_score, ut_comments = unit_test.result()
 
         # Calculate weighted score
         scores = [hc_score, ipo_score, var_score, ut_score]
@@ -1,3 +1,35 @@
+from pathlib import Path
+
 from .GradingStrategy import GradingStrategy
+from .artifacts import TestArtifacts, build_test_artifacts, find_test_artifacts
+from .cache import ResultCache
 from .ICS3UGrader import ICS3UGrader
-from .ICS4UGrader import ICS4UGrader
+from .ICS4UGrader import ICS4UGrader, JUNIT_JAR
+from .jvm import JvmDaemon
+from .limits import ResourceLimits, Usage
+from .sandbox import WorkspacePool
+from .zygote import PytestZygote
+
+
+def get_grader(
+    class_id: int,
+    abs_code_path: Path,
+    *,
+    pytest_zygote: PytestZygote | None = None,
+    jvm_daemon: JvmDaemon | None = None,
+    workspaces: WorkspacePool | None = None,
+    limits: ResourceLimits | None = None,
+    shards: int = 1,
+) -> GradingStrategy:
+    """Pick the grader for a classroom. ICS3U (class 1) is python, everything else is java"""
+    if class_id == 1:
+        return ICS3UGrader(
+            abs_code_path,
+            zygote=pytest_zygote,
+            workspaces=workspaces,
+            limits=limits,
+            shards=shards,
+        )
+    return ICS4UGrader(
+        abs_code_path, jvm=jvm_daemon, workspaces=workspaces, limits=limits, shards=shards
+    )
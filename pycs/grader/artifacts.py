@@ -0,0 +1,283 @@
+"""
+Prebuilt test file artifacts.
+
+Every grading run used to start from the teacher's raw test file: pytest parsed it
+and rewrote its asserts again for each submission. When a test file is uploaded,
+`build_test_artifacts` does the student-independent work once and stores it in
+UPLOAD_FOLDER/artifacts/<test file>-<content hash>/:
+
+- an immutable copy of the test file, which is what graders copy into workspaces
+- for pytest, the assert-rewritten bytecode pytest would otherwise write into
+  every throwaway workspace's __pycache__ (it is reused as long as the python and
+  pytest versions match, and pytest quietly falls back to the source otherwise)
+- the IDs of the tests in the file, in the same `classname.name` form as
+  `TestCaseResult.full_name`, for splitting the tests into shards. Only files
+  whose tests can be listed without running anything get them; a file with
+  nested classes, inherited tests, parametrized JUnit tests and the like has
+  None and always runs in one piece
+
+Building runs `pytest --collect-only` on a python test file, in the request that
+uploaded it, so the upload waits for it (at most COMPILE_TIMEOUT seconds).
+
+Graders look their artifacts up by the hash of the current test file, so
+uploading a new test file invalidates the old artifacts without anyone having to
+remember to, and a test file that was never built just grades the old way.
+
+JUnit tests are not precompiled: javac can't compile a test without the class it
+tests, and constants from that class get inlined into the test's bytecode, so one
+student's compiled test can't be reused for another's.
+"""
+
+from dataclasses import dataclass
+import ast
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from .java_style import code_only
+from .sandbox import copy
+
+ARTIFACTS_DIR = "artifacts"
+MANIFEST = "manifest.json"
+# How long a test file upload waits for pytest to write the rewritten bytecode
+COMPILE_TIMEOUT = 30
+# Bump whenever what goes into the artifacts changes, so older ones are rebuilt
+VERSION = 2
+
+_JAVA_TEST = re.compile(
+    r"@Test\b(?:\s*@[\w.]+(?:\([^)]*\))?)*"
+    r"(?:\s+(?:public|protected|private|static|final))*\s+void\s+([\w$]+)\s*\("
+)
+_JAVA_ANNOTATION = re.compile(r"@\s*(?!interface\b)([\w$.]+)")
+_JAVA_TYPE = re.compile(r"\b(?:class|interface|enum|record)\b")
+# Annotations that don't add, hide or multiply tests
+_JAVA_PLAIN_ANNOTATIONS = {
+    "AfterAll",
+    "AfterEach",
+    "BeforeAll",
+    "BeforeEach",
+    "Deprecated",
+    "Disabled",
+    "DisplayName",
+    "Order",
+    "Override",
+    "SuppressWarnings",
+    "Tag",
+    "Test",
+    "TestMethodOrder",
+    "Timeout",
+}
+
+
+@dataclass
+class TestArtifacts:
+    """The prebuilt artifacts of one version of a test file"""
+
+    path: Path
+    test_file: Path
+    test_ids: list[str] | None
+
+    __test__ = False
+
+    def copy_into(self, workspace: Path):
+        """Copy the test file, and its bytecode if there is any, into a workspace"""
+        copy(workspace, self.test_file)
+        pycache = self.path / "__pycache__"
+        if pycache.is_dir():
+            (workspace / "__pycache__").mkdir(exist_ok=True)
+            for pyc in pycache.iterdir():
+                copy(workspace / "__pycache__", pyc)
+
+
+def artifacts_root(test_path: Path) -> Path:
+    """Where the artifacts of a test file go: next to the tests/ and tests-java/ folders"""
+    return Path(test_path).parent.parent / ARTIFACTS_DIR
+
+
+def _artifacts_dir(test_path: Path, source: bytes) -> Path:
+    digest = hashlib.sha256(source).hexdigest()[:16]
+    return artifacts_root(test_path) / f"{Path(test_path).name}-{digest}"
+
+
+def _load(path: Path) -> TestArtifacts | None:
+    try:
+        manifest = json.loads((path / MANIFEST).read_text())
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != VERSION:
+        return None
+    return TestArtifacts(path, path / manifest["test_file"], manifest["test_ids"])
+
+
+def find_test_artifacts(test_path: Path) -> TestArtifacts | None:
+    """The artifacts built from the current contents of a test file, if any
+
+    Raises:
+        FileNotFoundError if the test file cannot be found
+    """
+    return _load(_artifacts_dir(test_path, Path(test_path).read_bytes()))
+
+
+def _binds_test(node: ast.stmt) -> bool:
+    """Whether a statement other than a def could add or hide a test"""
+    if isinstance(node, ast.Expr):
+        return not isinstance(node.value, ast.Constant)
+    if isinstance(node, ast.If):
+        # Never runs under pytest
+        return ast.unparse(node.test) not in (
+            "__name__ == '__main__'",
+            "'__main__' == __name__",
+        )
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        names = [alias.asname or alias.name for alias in node.names]
+    elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+        targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+        if not all(isinstance(target, ast.Name) for target in targets):
+            return True
+        names = [target.id for target in targets]
+    else:
+        return not isinstance(node, ast.Pass)
+    return any(
+        name == "*" or name.lower().startswith("test") or name.startswith("__")
+        for name in names
+    )
+
+
+def python_test_ids(source: str, module: str) -> list[str] | None:
+    """The tests pytest would collect from a module (before parametrizing), or
+    None if the module does anything that makes the list a guess"""
+    test_ids = []
+    for node in ast.parse(source).body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if node.name.startswith("test"):
+                test_ids.append(f"{module}.{node.name}")
+        elif isinstance(node, ast.ClassDef):
+            if not node.name.startswith("Test"):
+                continue
+            # Inherited or nested tests, or a class pytest won't collect
+            if node.bases or node.keywords:
+                return None
+            for item in node.body:
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    if item.name == "__init__":
+                        return None
+                    if item.name.startswith("test"):
+                        test_ids.append(f"{module}.{node.name}.{item.name}")
+                elif isinstance(item, ast.ClassDef) or _binds_test(item):
+                    return None
+        elif _binds_test(node):
+            return None
+    # A test defined twice is collected once
+    if len(set(test_ids)) != len(test_ids):
+        return None
+    return test_ids
+
+
+def java_test_ids(source: str, class_name: str) -> list[str] | None:
+    """The @Test methods of a JUnit test class, or None if the class has tests
+    that aren't plain @Test methods or could be somewhere else"""
+    code = code_only(source)
+    types = _JAVA_TYPE.findall(code)
+    annotations = {name.rsplit(".", 1)[-1] for name in _JAVA_ANNOTATION.findall(code)}
+    if (
+        len(types) != 1
+        or re.search(rf"\bclass\s+{re.escape(class_name)}\s*\{{", code) is None
+        or not annotations <= _JAVA_PLAIN_ANNOTATIONS
+    ):
+        return None
+    names = _JAVA_TEST.findall(code)
+    # Every @Test accounted for, and no overloads the launcher can't tell apart
+    if len(names) != len(re.findall(r"@\s*(?:[\w$]+\.)*Test\b", code)):
+        return None
+    if len(set(names)) != len(names):
+        return None
+    return [f"{class_name}.{name}()" for name in names]
+
+
+def _compile_pytest(build_dir: Path, test_filename: str):
+    """Have pytest import the test file once, leaving its rewritten bytecode behind
+
+    Blocks for up to COMPILE_TIMEOUT seconds, which a test file that runs slow
+    code at import time can take.
+    """
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    # The import fails without the student's code, but the bytecode is written first
+    try:
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "pytest",
+                "--collect-only",
+                "-q",
+                "-p",
+                "no:cacheprovider",
+                test_filename,
+            ],
+            cwd=build_dir,
+            env=env,
+            capture_output=True,
+            timeout=COMPILE_TIMEOUT,
+            check=False,
+        )
+    except subprocess.TimeoutExpired:
+        # Graders rewrite the test file themselves, like they always have
+        pass
+
+
+def build_test_artifacts(test_path: Path) -> TestArtifacts:
+    """Prebuild everything about a test file that doesn't depend on the submission
+
+    Artifacts of older versions of the same test file are removed.
+
+    Raises:
+        FileNotFoundError if the test file cannot be found
+        SyntaxError if a python test file does not parse
+    """
+    test_path = Path(test_path)
+    source = test_path.read_bytes()
+    final_dir = _artifacts_dir(test_path, source)
+    existing = _load(final_dir)
+    if existing is not None:
+        return existing
+    # Built by an older version of pycs
+    shutil.rmtree(final_dir, ignore_errors=True)
+
+    if test_path.suffix == ".py":
+        test_ids = python_test_ids(source.decode("utf-8"), test_path.stem)
+    else:
+        test_ids = java_test_ids(source.decode("utf-8"), test_path.stem)
+
+    root = artifacts_root(test_path)
+    root.mkdir(parents=True, exist_ok=True)
+    # Built on the side and renamed into place, so graders never see half of it
+    build_dir = Path(tempfile.mkdtemp(prefix=".build-", dir=root))
+    try:
+        shutil.copyfile(test_path, build_dir / test_path.name)
+        if test_path.suffix == ".py":
+            _compile_pytest(build_dir, test_path.name)
+        (build_dir / MANIFEST).write_text(
+            json.dumps(
+                {"version": VERSION, "test_file": test_path.name, "test_ids": test_ids}
+            )
+        )
+        try:
+            build_dir.rename(final_dir)
+        except OSError:
+            # Someone else built the same test file first
+            shutil.rmtree(build_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    for old in root.glob(f"{test_path.name}-*"):
+        if old != final_dir:
+            shutil.rmtree(old, ignore_errors=True)
+    return _load(final_dir)
@@ -0,0 +1,205 @@
+"""
+A persistent cache of grading results.
+
+Students often upload the exact same file more than once. A result only depends
+on the submission, the teacher's test file and the grader itself, so the cache key
+is a hash of those three and a hit skips grading (and every subprocess) entirely.
+Results live in a small sqlite file and the least recently used ones are evicted
+once the cache grows past its size limit. The per-test results of a run are kept
+alongside its score, so a hit restores `grader.test_results` too.
+
+Students also often resubmit after fixing only the comments the style checks
+flagged. Unit tests can't tell the difference, so the unit test result of every
+run is kept as well, keyed by the submission's fingerprint (its code without
+comments or formatting) instead of its bytes. A submission that misses the cache
+but has the fingerprint of one graded before reruns only the style checks.
+"""
+
+from contextlib import contextmanager
+from dataclasses import asdict
+import hashlib
+import json
+from pathlib import Path
+import sqlite3
+import threading
+import time
+
+from .GradingStrategy import GradingStrategy
+from .reports import TestCaseResult
+from .trace import CACHE
+
+
+class ResultCache:
+    """Content-hash keyed `(score, comments)` cache for `grade_student`"""
+
+    def __init__(self, path: Path, max_bytes: int = 64 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Misses that reused the unit test result of a run with the same fingerprint
+        self.unit_test_hits = 0
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS result ("
+                " key TEXT PRIMARY KEY,"
+                " score REAL NOT NULL,"
+                " comments TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " tests TEXT NOT NULL DEFAULT '[]')"
+            )
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(result)")]
+            if "tests" not in columns:
+                # A cache file from before test results were kept
+                conn.execute(
+                    "ALTER TABLE result ADD COLUMN tests TEXT NOT NULL DEFAULT '[]'"
+                )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS result_last_used ON result (last_used)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """A connection that commits (or rolls back) and closes when done"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _digest(*parts: bytes) -> str:
+        digest = hashlib.sha256()
+        for part in parts:
+            # Length prefixes keep ("ab", "c") and ("a", "bc") apart
+            digest.update(len(part).to_bytes(8, "big"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    @classmethod
+    def key(cls, grader: GradingStrategy) -> str:
+        """Hash of the submission, its test file and the grader that grades it
+
+        Raises:
+            FileNotFoundError if the submission or test file cannot be found
+        """
+        return cls._digest(
+            f"{type(grader).__name__}:{grader.VERSION}".encode(),
+            grader.abs_code_path.read_bytes(),
+            grader.abs_test_path.read_bytes(),
+        )
+
+    @classmethod
+    def unit_test_key(cls, grader: GradingStrategy) -> str | None:
+        """Hash of the submission's fingerprint, its file name, its test file and
+        the grader, or None if the submission can't be fingerprinted
+
+        Raises:
+            FileNotFoundError if the test file cannot be found
+        """
+        fingerprint = grader.fingerprint()
+        if fingerprint is None:
+            return None
+        return cls._digest(
+            f"unit_test:{type(grader).__name__}:{grader.VERSION}".encode(),
+            # The tests import the code by its file name
+            grader.abs_code_path.name.encode(),
+            fingerprint.encode(),
+            grader.abs_test_path.read_bytes(),
+        )
+
+    def get(self, key: str) -> tuple[float, str, list[TestCaseResult]] | None:
+        result = self._get(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def _get(self, key: str) -> tuple[float, str, list[TestCaseResult]] | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT score, comments, tests FROM result WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE result SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+        if row is None:
+            return None
+        score, comments, tests = row
+        return score, comments, [TestCaseResult(**test) for test in json.loads(tests)]
+
+    def put(
+        self,
+        key: str,
+        score: float,
+        comments: str,
+        test_results: list[TestCaseResult] = (),
+    ):
+        tests = json.dumps([asdict(result) for result in test_results])
+        size = len(comments.encode()) + len(tests.encode()) + len(key)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO result"
+                " (key, score, comments, size, last_used, tests)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, score, comments, size, time.time(), tests),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop the least recently used results until the cache fits"""
+        (total,) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM result").fetchone()
+        if total <= self.max_bytes:
+            return
+        evict = []
+        for key, size in conn.execute("SELECT key, size FROM result ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            evict.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM result WHERE key = ?", evict)
+
+    def grade(self, grader: GradingStrategy) -> tuple[float, str]:
+        """`grader.grade_student()`, unless this exact submission was graded before.
+
+        A submission with the fingerprint of one graded before only has its style
+        checked, the unit test result is reused.
+        """
+        unit_test_key = None
+        with grader.trace.stage(CACHE):
+            key = self.key(grader)
+            cached = self.get(key)
+            if cached is None:
+                unit_test_key = self.unit_test_key(grader)
+                unit_test = self._get(unit_test_key) if unit_test_key else None
+                if unit_test is not None:
+                    ut_score, ut_comments, grader.test_results = unit_test
+                    grader.unit_test = ut_score, ut_comments
+                    # It is already cached
+                    unit_test_key = None
+                    with self._lock:
+                        self.unit_test_hits += 1
+        if cached is not None:
+            score, comments, grader.test_results = cached
+            return score, comments
+
+        score, comments = grader.grade_student()
+        if grader.cacheable:
+            self.put(key, score, comments, grader.test_results)
+            if unit_test_key is not None and grader.unit_test is not None:
+                self.put(unit_test_key, *grader.unit_test, grader.test_results)
+        return score, comments
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "unit_test_hits": self.unit_test_hits,
+            }
@@ -0,0 +1,51 @@
+"""
+Bounded capture of a student program's output.
+
+A submission that prints in a loop until its timeout can write hundreds of
+megabytes, and all of it used to be kept in memory, decoded and stored in the
+student's comments. A `HeadTailBuffer` keeps only the first and the last half
+of its limit (where the error and pytest's summary are) and counts the bytes in
+between, so capturing costs the same memory however much the program prints.
+
+Like zygote.py, this only uses the standard library, so the zygote process can
+import it without the rest of pycs.
+"""
+
+# Between the head and the tail of output that was cut
+TRUNCATED = "\n\n[... {} bytes of output cut ...]\n\n"
+
+
+class HeadTailBuffer:
+    """The first and last `limit // 2` bytes written to it. A limit of None keeps
+    everything."""
+
+    def __init__(self, limit: int | None = None):
+        self.limit = limit
+        self.head = bytearray()
+        self.tail = bytearray()
+        # Bytes that fell out of the tail
+        self.dropped = 0
+
+    def write(self, chunk: bytes):
+        if self.limit is None:
+            self.head += chunk
+            return
+        head_room = self.limit - self.limit // 2 - len(self.head)
+        if head_room > 0:
+            self.head += chunk[:head_room]
+            chunk = chunk[head_room:]
+        if not chunk:
+            return
+        self.tail += chunk
+        excess = len(self.tail) - self.limit // 2
+        if excess > 0:
+            # bytearray drops from the front without copying the rest
+            del self.tail[:excess]
+            self.dropped += excess
+
+    def getvalue(self) -> bytes:
+        """Everything kept, with a marker where output was cut"""
+        if not self.dropped:
+            return bytes(self.head + self.tail)
+        marker = TRUNCATED.format(self.dropped).encode()
+        return bytes(self.head) + marker + bytes(self.tail)
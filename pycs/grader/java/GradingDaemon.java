@@ -0,0 +1,317 @@
+/**
+ * A long lived JVM that grades ICS4U submissions for pycs.
+ *
+ * Started by pycs/grader/jvm.py as `java -cp <junit standalone jar> GradingDaemon.java`
+ * so the JVM, javac and JUnit are only warmed up once. Jobs come in on stdin, one per
+ * line, and each answer goes out on stdout as one line. Every field is tab separated
+ * and any text field is base64 encoded:
+ *
+ *   request:  id  studentFile  studentSource  testFile  testSource  timeoutMillis  reportsDir  outputLimit
+ *   response: id  status  passed  failed  compileMillis  output
+ *
+ * When reportsDir is not empty, a JUnit XML report (TEST-*.xml, the same as the
+ * console launcher's --reports-dir) is written there for every job.
+ * compileMillis is how long compiling took, so it can be told apart from the test run.
+ * Only the first and last outputLimit / 2 bytes of what the tests print are kept (all
+ * of it when outputLimit is negative), so a student's print loop can't fill the heap.
+ * status is one of OK, COMPILE_ERROR, TIMEOUT or ERROR. Sources are compiled in
+ * memory with javax.tools and loaded in a fresh classloader per job, so nothing
+ * from one student leaks into the next. A job that runs past its timeout cannot be
+ * stopped safely, so the daemon answers TIMEOUT and exits; the python side starts a
+ * new one.
+ */
+
+import java.io.BufferedReader;
+import java.io.ByteArrayOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.OutputStream;
+import java.io.PrintStream;
+import java.io.PrintWriter;
+import java.io.StringWriter;
+import java.net.URI;
+import java.nio.charset.StandardCharsets;
+import java.nio.file.Paths;
+import java.util.ArrayList;
+import java.util.Base64;
+import java.util.HashMap;
+import java.util.List;
+import java.util.Locale;
+import java.util.Map;
+import java.util.concurrent.ExecutionException;
+import java.util.concurrent.ExecutorService;
+import java.util.concurrent.Executors;
+import java.util.concurrent.Future;
+import java.util.concurrent.TimeUnit;
+import java.util.concurrent.TimeoutException;
+
+import javax.tools.Diagnostic;
+import javax.tools.DiagnosticCollector;
+import javax.tools.FileObject;
+import javax.tools.ForwardingJavaFileManager;
+import javax.tools.JavaCompiler;
+import javax.tools.JavaFileManager;
+import javax.tools.JavaFileObject;
+import javax.tools.SimpleJavaFileObject;
+import javax.tools.StandardJavaFileManager;
+import javax.tools.ToolProvider;
+
+import org.junit.platform.launcher.Launcher;
+import org.junit.platform.launcher.LauncherDiscoveryRequest;
+import org.junit.platform.launcher.TestExecutionListener;
+import org.junit.platform.launcher.core.LauncherFactory;
+import org.junit.platform.launcher.listeners.SummaryGeneratingListener;
+import org.junit.platform.launcher.listeners.TestExecutionSummary;
+import org.junit.platform.reporting.legacy.xml.LegacyXmlReportGeneratingListener;
+
+import static org.junit.platform.engine.discovery.DiscoverySelectors.selectClass;
+import static org.junit.platform.launcher.core.LauncherDiscoveryRequestBuilder.request;
+
+public class GradingDaemon {
+
+    private static final JavaCompiler COMPILER = ToolProvider.getSystemJavaCompiler();
+    private static final Launcher LAUNCHER = LauncherFactory.create();
+    private static final PrintStream PROTOCOL_OUT = System.out;
+
+    /** A source file that lives in a string */
+    static class SourceFile extends SimpleJavaFileObject {
+        private final String source;
+
+        SourceFile(String fileName, String source) {
+            super(URI.create("string:///" + fileName), Kind.SOURCE);
+            this.source = source;
+        }
+
+        @Override
+        public CharSequence getCharContent(boolean ignoreEncodingErrors) {
+            return source;
+        }
+    }
+
+    /** A class file that lives in a byte array */
+    static class ClassFile extends SimpleJavaFileObject {
+        private final ByteArrayOutputStream bytes = new ByteArrayOutputStream();
+
+        ClassFile(String className) {
+            super(URI.create("bytes:///" + className.replace('.', '/') + ".class"), Kind.CLASS);
+        }
+
+        @Override
+        public OutputStream openOutputStream() {
+            return bytes;
+        }
+    }
+
+    /** Sends compiler output to ClassFiles instead of the disk */
+    static class MemoryFileManager extends ForwardingJavaFileManager<StandardJavaFileManager> {
+        final Map<String, ClassFile> classes = new HashMap<>();
+
+        MemoryFileManager(StandardJavaFileManager fileManager) {
+            super(fileManager);
+        }
+
+        @Override
+        public JavaFileObject getJavaFileForOutput(
+                JavaFileManager.Location location, String className, JavaFileObject.Kind kind, FileObject sibling) {
+            ClassFile classFile = new ClassFile(className);
+            classes.put(className, classFile);
+            return classFile;
+        }
+    }
+
+    /** One classloader per job, so student classes never leak between jobs */
+    static class MemoryClassLoader extends ClassLoader {
+        private final Map<String, ClassFile> classes;
+
+        MemoryClassLoader(Map<String, ClassFile> classes) {
+            super(GradingDaemon.class.getClassLoader());
+            this.classes = classes;
+        }
+
+        @Override
+        protected Class<?> findClass(String name) throws ClassNotFoundException {
+            ClassFile classFile = classes.get(name);
+            if (classFile == null) {
+                return super.findClass(name);
+            }
+            byte[] bytes = classFile.bytes.toByteArray();
+            return defineClass(name, bytes, 0, bytes.length);
+        }
+    }
+
+    /** Keeps the first and last limit / 2 bytes written to it, however much that is */
+    static class HeadTailOutputStream extends OutputStream {
+        private final ByteArrayOutputStream head = new ByteArrayOutputStream();
+        private final long headLimit;
+        private final byte[] tail;
+        // Everything written past the head, the tail is the last tail.length of it
+        private long tailWritten = 0;
+
+        HeadTailOutputStream(long limit) {
+            headLimit = limit < 0 ? Long.MAX_VALUE : limit - limit / 2;
+            tail = new byte[limit < 0 ? 0 : (int) (limit / 2)];
+        }
+
+        @Override
+        public synchronized void write(int b) {
+            write(new byte[] {(byte) b}, 0, 1);
+        }
+
+        @Override
+        public synchronized void write(byte[] bytes, int off, int len) {
+            int toHead = (int) Math.min(len, headLimit - head.size());
+            head.write(bytes, off, toHead);
+            if (tail.length == 0) {
+                tailWritten += len - toHead;
+                return;
+            }
+            for (int i = off + toHead; i < off + len; i++) {
+                tail[(int) (tailWritten++ % tail.length)] = bytes[i];
+            }
+        }
+
+        /** Everything kept, with a marker where output was cut (the same as capture.py's) */
+        synchronized String contents() {
+            int kept = (int) Math.min(tailWritten, tail.length);
+            byte[] ordered = new byte[kept];
+            for (int i = 0; i < kept; i++) {
+                ordered[i] = tail[(int) ((tailWritten - kept + i) % tail.length)];
+            }
+            long cut = tailWritten - kept;
+            String marker = cut > 0 ? "\n\n[... " + cut + " bytes of output cut ...]\n\n" : "";
+            return head.toString(StandardCharsets.UTF_8) + marker + new String(ordered, StandardCharsets.UTF_8);
+        }
+    }
+
+    /** Sends System.out/err of the running job to a buffer */
+    static class JobOutput extends PrintStream {
+        JobOutput(OutputStream buffer) {
+            super(buffer, true, StandardCharsets.UTF_8);
+        }
+    }
+
+    private static String decode(String field) {
+        return new String(Base64.getDecoder().decode(field), StandardCharsets.UTF_8);
+    }
+
+    private static String encode(String text) {
+        return Base64.getEncoder().encodeToString(text.getBytes(StandardCharsets.UTF_8));
+    }
+
+    private static void respond(String id, String status, long passed, long failed, long compileMillis, String output) {
+        PROTOCOL_OUT.println(String.join("\t", id, status, Long.toString(passed), Long.toString(failed),
+                Long.toString(compileMillis), encode(output)));
+        PROTOCOL_OUT.flush();
+    }
+
+    private static String formatDiagnostics(List<Diagnostic<? extends JavaFileObject>> diagnostics) {
+        StringBuilder out = new StringBuilder();
+        for (Diagnostic<? extends JavaFileObject> diagnostic : diagnostics) {
+            String fileName = diagnostic.getSource() == null
+                    ? ""
+                    : diagnostic.getSource().getName().replaceFirst("^/", "");
+            out.append(fileName)
+                    .append(':')
+                    .append(diagnostic.getLineNumber())
+                    .append(": ")
+                    .append(diagnostic.getKind().toString().toLowerCase(Locale.ROOT))
+                    .append(": ")
+                    .append(diagnostic.getMessage(Locale.ROOT))
+                    .append('\n');
+        }
+        return out.toString();
+    }
+
+    private static void grade(String[] fields, ExecutorService runner) throws Exception {
+        String id = fields[0];
+        String studentFile = fields[1];
+        String testFile = fields[3];
+        long timeoutMillis = Long.parseLong(fields[5]);
+        String reportsDir = decode(fields[6]);
+        long outputLimit = Long.parseLong(fields[7]);
+
+        // Compile both sources in one go, entirely in memory
+        long compileStart = System.nanoTime();
+        DiagnosticCollector<JavaFileObject> diagnostics = new DiagnosticCollector<>();
+        MemoryFileManager fileManager = new MemoryFileManager(
+                COMPILER.getStandardFileManager(diagnostics, Locale.ROOT, StandardCharsets.UTF_8));
+        List<JavaFileObject> sources = new ArrayList<>();
+        sources.add(new SourceFile(studentFile, decode(fields[2])));
+        sources.add(new SourceFile(testFile, decode(fields[4])));
+        List<String> options = List.of("-classpath", System.getProperty("java.class.path"));
+        boolean compiled = COMPILER.getTask(null, fileManager, diagnostics, options, null, sources).call();
+        long compileMillis = TimeUnit.NANOSECONDS.toMillis(System.nanoTime() - compileStart);
+        if (!compiled) {
+            respond(id, "COMPILE_ERROR", 0, 0, compileMillis, formatDiagnostics(diagnostics.getDiagnostics()));
+            return;
+        }
+
+        // Run the tests with the student's classes in their own classloader
+        MemoryClassLoader loader = new MemoryClassLoader(fileManager.classes);
+        String testClassName = testFile.replaceFirst("\\.java$", "");
+        HeadTailOutputStream output = new HeadTailOutputStream(outputLimit);
+        SummaryGeneratingListener listener = new SummaryGeneratingListener();
+        List<TestExecutionListener> listeners = new ArrayList<>();
+        listeners.add(listener);
+        if (!reportsDir.isEmpty()) {
+            listeners.add(new LegacyXmlReportGeneratingListener(
+                    Paths.get(reportsDir), new PrintWriter(output, true, StandardCharsets.UTF_8)));
+        }
+        Future<?> job = runner.submit(() -> {
+            Thread.currentThread().setContextClassLoader(loader);
+            PrintStream originalOut = System.out;
+            PrintStream originalErr = System.err;
+            try (JobOutput jobOutput = new JobOutput(output)) {
+                System.setOut(jobOutput);
+                System.setErr(jobOutput);
+                LauncherDiscoveryRequest discovery = request()
+                        .selectors(selectClass(loader.loadClass(testClassName)))
+                        .build();
+                LAUNCHER.execute(discovery, listeners.toArray(new TestExecutionListener[0]));
+            } finally {
+                System.setOut(originalOut);
+                System.setErr(originalErr);
+            }
+            return null;
+        });
+
+        try {
+            job.get(timeoutMillis, TimeUnit.MILLISECONDS);
+        } catch (TimeoutException e) {
+            respond(id, "TIMEOUT", 0, 0, compileMillis, "");
+            // The student's code is stuck in our JVM; the only safe way out is to leave
+            System.exit(2);
+        } catch (ExecutionException e) {
+            respond(id, "ERROR", 0, 0, compileMillis, e.getCause().toString());
+            return;
+        }
+
+        TestExecutionSummary summary = listener.getSummary();
+        StringWriter report = new StringWriter();
+        PrintWriter reportWriter = new PrintWriter(report);
+        reportWriter.print(output.contents());
+        summary.printFailuresTo(reportWriter, 20);
+        summary.printTo(reportWriter);
+        reportWriter.flush();
+        respond(id, "OK", summary.getTestsSucceededCount(), summary.getTestsFailedCount(), compileMillis,
+                report.toString());
+    }
+
+    public static void main(String[] args) throws IOException {
+        ExecutorService runner = Executors.newSingleThreadExecutor(runnable -> {
+            Thread thread = new Thread(runnable, "grading-job");
+            thread.setDaemon(true);
+            return thread;
+        });
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, StandardCharsets.UTF_8));
+        String line;
+        while ((line = in.readLine()) != null) {
+            String[] fields = line.split("\t", -1);
+            try {
+                grade(fields, runner);
+            } catch (Exception e) {
+                respond(fields[0], "ERROR", 0, 0, 0, e.toString());
+            }
+        }
+    }
+}
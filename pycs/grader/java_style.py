@@ -0,0 +1,264 @@
+"""
+Single pass style analysis of a java submission.
+
+ICS4UGrader used to make one regex pass over every line per style criterion, and
+its variable regex only understood `type name = ...` on a line of its own.
+`tokenize` is a small streaming java tokenizer that turns the source into a
+stream of declarations and comments, and `analyze` collects the header comment
+lines, the declared variable names and the line-leading `//` comments from it.
+
+Declarations are recognized after statement boundaries, so generics
+(`List<String> names`), arrays (`int[] marks`, `int marks[]`), multiple
+declarators (`int a = 1, b`), fields with modifiers (`private static final int
+MAX`) and `for` headers are all found, and nothing inside a string or a comment is
+ever mistaken for code.
+
+Like py_style, the tokenizer is one compiled regex that only stops where something
+can happen (statement boundaries, brackets, commas, strings, comments and `for`),
+which is a good deal faster than producing every java token in python.
+
+`normalize` reduces a file to its token stream without comments or formatting,
+so a resubmission that only fixed those can reuse the unit test result of the
+last one. `structure_error` finds the mistakes javac is sure to reject (brackets
+that don't pair up, no class named after the file) without starting a JVM.
+"""
+
+from dataclasses import dataclass, field
+from typing import Iterator, NamedTuple
+import re
+
+_NAME = r"[A-Za-z_$][\w$]*"
+_KEYWORDS = (
+    "abstract|assert|break|case|catch|class|const|continue|default|do|else|enum"
+    "|extends|final|finally|for|goto|if|implements|import|instanceof|interface"
+    "|native|new|package|private|protected|public|return|static|strictfp|super"
+    "|switch|synchronized|this|throw|throws|transient|try|void|volatile|while"
+    # `yield x;` in a switch expression is not a declaration either
+    "|yield|true|false|null"
+)
+_MODIFIERS = (
+    "public|protected|private|static|final|abstract|transient|volatile"
+    "|synchronized|native|strictfp|default"
+)
+_PLAIN_NAME = rf"(?!(?:{_KEYWORDS})\b){_NAME}"
+_ARRAY = r"(?:\s*\[\s*\])"
+
+
+def _generic(levels: int) -> str:
+    """A pattern for type arguments like `<K, List<V>>` nested up to `levels` deep"""
+    # One character at a time, so a `<` that never closes can't backtrack forever
+    atom = r"[\w$\s,.?&\[\]]"
+    if levels > 1:
+        atom += "|" + _generic(levels - 1)
+    return rf"<(?:{atom})*>"
+
+
+_TYPE = rf"{_PLAIN_NAME}(?:\s*\.\s*{_NAME})*(?:\s*{_generic(3)})?{_ARRAY}*"
+# `Type name` followed by whatever can come after a declared variable
+_DECLARATION = rf"""
+    (?:@[\w$.]+\s*(?:\([^()]*\)\s*)?)*
+    (?:(?:{_MODIFIERS})\s+)*
+    {_TYPE}(?:\s+|(?<=[\]>])\s*)
+    (?P<{{group}}>{_PLAIN_NAME}){_ARRAY}*\s*(?=[=,;:])
+"""
+_STATEMENT_DECLARATION = _DECLARATION.format(group="declared")
+_FOR_DECLARATION = _DECLARATION.format(group="for_declared")
+
+_COMMENT = r"//[^\n]*|/\*.*?(?:\*/|\Z)"
+_COMMENTS = re.compile(_COMMENT, re.DOTALL)
+
+_STRING = r"""\"\"\".*?(?:\"\"\"|\Z)|"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*'"""
+
+
+def _parenthesized(levels: int) -> str:
+    """A pattern for a balanced (...) without braces, nested up to `levels` deep"""
+    atom = rf"""[^(){{}}"'/] | {_STRING} | {_COMMENT} | /"""
+    if levels > 1:
+        atom += " | " + _parenthesized(levels - 1)
+    return rf"\((?:{atom})*\)"
+
+
+_TOKENS = re.compile(
+    rf"""
+    # Only try the alternatives at characters that can start one of them, and
+    # only the ones that can start with that character
+    (?=[;{{}}:(),/"'f])
+    (?:
+        (?=/)(?P<comment>{_COMMENT})
+      | (?=["'])(?P<string>{_STRING})
+      # Comments between statements are common, don't let them hide a declaration
+      | (?=[;{{}}:])(?P<start>[;{{}}:])(?P<gap>\s*(?:(?:{_COMMENT})\s*)*)
+        (?:{_STATEMENT_DECLARATION})?
+      | (?=f)(?P<for>\bfor\s*\(\s*)(?:{_FOR_DECLARATION})?
+      | (?=,)(?P<comma>,\s*(?:(?P<also_declared>{_PLAIN_NAME}){_ARRAY}*\s*(?=[=,;]))?)
+      # Arguments, conditions and casts can't declare anything, skip them whole
+      | (?=\()(?:(?P<group>{_parenthesized(3)})|(?P<open>\())
+      | (?P<close>\))
+    )
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+_PREAMBLE = re.compile(r"(?:\s*(?:package|import)\b[^;]*;)*\s*")
+# Only comments can come before the package declaration
+_PACKAGE = re.compile(
+    rf"""\A(?:\s|{_COMMENT})*
+    (?P<package>package\s+{_NAME}(?:\s*\.\s*{_NAME})*\s*;)""",
+    re.VERBOSE | re.DOTALL,
+)
+
+# Strings are kept as they are, any run of whitespace and comments between them
+# becomes one space (which can still matter: `a - -b` is not `a--b`)
+_GAPS = re.compile(rf"(?P<string>{_STRING})|(?:\s|{_COMMENT})+", re.DOTALL)
+
+_STRINGS_AND_COMMENTS = re.compile(rf"{_STRING}|{_COMMENT}", re.DOTALL)
+_BRACKETS = re.compile(r"[{}()\[\]]")
+_CLOSES = {"}": "{", ")": "(", "]": "["}
+
+# How many lines of the file the header comment checks look at
+HEADER_LINES = 5
+
+
+class Token(NamedTuple):
+    kind: str  # declaration or comment
+    text: str  # The declared name, or the whole comment
+    start: int  # Offset of the token in the source
+
+
+@dataclass
+class JavaStyleReport:
+    """Everything the ICS4U style checks need to know about a file"""
+
+    header_lines: list[str] = field(default_factory=list)
+    variables: list[str] = field(default_factory=list)
+    comments: list[str] = field(default_factory=list)
+
+
+def tokenize(source: str) -> Iterator[Token]:
+    """Yield every variable declaration and comment in some java source, in order"""
+    depth = 0
+    # The bracket depth of the declaration statement we are in, if any
+    declaring_at = None
+    for match in _TOKENS.finditer(source):
+        kind = match.lastgroup
+        if kind == "comment":
+            yield Token("comment", match.group(), match.start())
+        elif kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth = max(0, depth - 1)
+            if declaring_at is not None and depth < declaring_at:
+                declaring_at = None
+        elif kind == "comma":
+            name = match.group("also_declared")
+            if name and declaring_at == depth:
+                yield Token("declaration", name, match.start("also_declared"))
+        elif kind == "for" or kind == "for_declared":
+            depth += 1
+            if match.group("for_declared"):
+                declaring_at = depth
+                yield Token("declaration", match.group("for_declared"), match.start("for_declared"))
+        elif kind == "string" or kind == "group":
+            continue
+        else:
+            # A statement boundary, maybe with a declaration right after it
+            char = match.group("start")
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth = max(0, depth - 1)
+            if char == ";" or (declaring_at is not None and depth < declaring_at):
+                declaring_at = None
+            gap = match.group("gap")
+            if "/" in gap:
+                offset = match.start("gap")
+                for comment in _COMMENTS.finditer(gap):
+                    yield Token("comment", comment.group(), offset + comment.start())
+            if match.group("declared"):
+                declaring_at = depth
+                yield Token("declaration", match.group("declared"), match.start("declared"))
+
+
+def strip_package(source: str) -> str:
+    """The source without its package declaration, which is blanked out rather than
+    removed so that compiler errors still point at the student's line numbers.
+
+    Only a real declaration is touched: a `package` inside a comment, a string or a
+    name like `packageCount` is left alone.
+    """
+    match = _PACKAGE.match(source)
+    if match is None:
+        return source
+    start, end = match.span("package")
+    blank = re.sub(r"[^\n]", " ", source[start:end])
+    return source[:start] + blank + source[end:]
+
+
+def analyze(source: str) -> JavaStyleReport:
+    """Tokenize a java source file once and collect what the style checks need"""
+    report = JavaStyleReport()
+
+    # The header comment is whatever comes first after the package and imports
+    header_start = _PREAMBLE.match(source).end()
+    if header_start < len(source):
+        line_start = source.rfind("\n", 0, header_start) + 1
+        lines = source[line_start:].split("\n", HEADER_LINES)[:HEADER_LINES]
+        report.header_lines = [line.rstrip("\r") for line in lines]
+
+    for token in tokenize(source):
+        if token.kind == "declaration":
+            report.variables.append(token.text)
+        elif token.text.startswith("//"):
+            line_start = source.rfind("\n", 0, token.start) + 1
+            if source[line_start : token.start].strip() == "":
+                report.comments.append(token.text.lower())
+
+    return report
+
+
+def normalize(source: str) -> str:
+    """Some java source with every comment and run of whitespace turned into one
+    space. Comments, indentation and blank lines all leave it unchanged."""
+    return _GAPS.sub(lambda match: match.group("string") or " ", source).strip()
+
+
+def code_only(source: str) -> str:
+    """The source with its strings, char literals and comments blanked out. The
+    newlines are kept, so positions still have the same line numbers"""
+    return _STRINGS_AND_COMMENTS.sub(
+        lambda match: "\n" * match.group().count("\n"), source
+    )
+
+
+def structure_error(source: str, filename: str) -> str | None:
+    """A javac style error for brackets that don't pair up or a file without a
+    class named after it, or None if there is neither. Brackets in strings, char
+    literals and comments don't count."""
+    code = code_only(source)
+
+    def error(position: int, message: str) -> str:
+        line = code.count("\n", 0, position) + 1
+        return f"{filename}:{line}: error: {message}"
+
+    opened: list[re.Match] = []
+    for bracket in _BRACKETS.finditer(code):
+        char = bracket.group()
+        if char not in _CLOSES:
+            opened.append(bracket)
+        elif not opened:
+            opening = _CLOSES[char]
+            return error(bracket.start(), f"'{char}' without a '{opening}' to close")
+        elif opened[-1].group() != _CLOSES[char]:
+            last = opened[-1]
+            line = code.count("\n", 0, last.start()) + 1
+            message = f"'{char}' where the '{last.group()}' from line {line} is open"
+            return error(bracket.start(), message)
+        else:
+            opened.pop()
+    if opened:
+        return error(opened[-1].start(), f"'{opened[-1].group()}' is never closed")
+
+    class_name = filename.removesuffix(".java")
+    declaration = rf"\b(?:class|interface|enum|record)\s+{re.escape(class_name)}\b"
+    if re.search(declaration, code) is None:
+        return error(0, f"there is no class {class_name} in {filename}")
+    return None
@@ -0,0 +1,210 @@
+"""
+Client for the long lived JVM grading daemon (java/GradingDaemon.java).
+
+Grading a java submission the old way costs three JVM cold starts (javac twice and
+the JUnit console launcher). The daemon keeps a warm JVM around that compiles in
+memory and runs JUnit in-process, so a submission costs one round trip over a pipe.
+
+Student code runs inside the daemon, so each JVM gets the grading limits of a
+`java` subprocess (its heap capped instead of its address space), in a session
+of its own and a throwaway working directory. The CPU time limit is the one
+exception: it would add up over every submission the JVM ever grades, and each
+job has its own timeout instead.
+"""
+
+import base64
+from dataclasses import dataclass
+import os
+from pathlib import Path
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+
+from .limits import ResourceLimits, spawn
+from .sandbox import default_root
+
+DAEMON_SOURCE = Path(__file__).parent / "java" / "GradingDaemon.java"
+
+# Sessions, process groups and rlimits
+POSIX = os.name == "posix"
+
+
+@dataclass
+class JvmResult:
+    """What the daemon found out about one submission"""
+
+    status: str  # OK, COMPILE_ERROR, TIMEOUT or ERROR
+    passed: int
+    failed: int
+    output: str
+    compile_seconds: float = 0.0
+
+
+def _encode(text: str) -> str:
+    return base64.b64encode(text.encode("utf-8")).decode("ascii")
+
+
+def _decode(field: str) -> str:
+    return base64.b64decode(field).decode("utf-8", errors="replace")
+
+
+class JvmDaemon:
+    """A small pool of grading JVMs. Safe to share between grading threads.
+
+    Each JVM grades one submission at a time, so up to `size` submissions are
+    graded at once. JVMs are started lazily and replaced if they die or time out.
+    """
+
+    def __init__(
+        self, junit_jar: Path, size: int = 1, limits: ResourceLimits | None = None
+    ):
+        self.junit_jar = Path(junit_jar)
+        self.size = max(1, size)
+        # rlimits for every JVM, see above
+        self.limits = limits
+        self._idle: list[subprocess.Popen] = []
+        self._started = 0
+        self._lock = threading.Lock()
+        # Notified whenever a JVM is handed back or one less is running
+        self._available = threading.Condition(self._lock)
+        self._next_id = 0
+        self._workspace: Path | None = None
+
+    def _start(self) -> subprocess.Popen:
+        if self._workspace is None:
+            self._workspace = Path(
+                tempfile.mkdtemp(prefix="pycs-jvm-", dir=default_root())
+            )
+        heap = []
+        limits = None
+        if self.limits is not None:
+            if self.limits.address_space is not None:
+                heap = [f"-Xmx{self.limits.address_space // (1024 * 1024)}m"]
+            limits = ResourceLimits(
+                processes=self.limits.processes, file_size=self.limits.file_size
+            )
+        return spawn(
+            ["java", *heap, "-cp", str(self.junit_jar), str(DAEMON_SOURCE)],
+            limits,
+            cwd=self._workspace,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+        )
+
+    @staticmethod
+    def _kill(proc: subprocess.Popen):
+        """Stop a JVM and anything the code it ran started"""
+        if POSIX:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        else:
+            proc.kill()
+        proc.wait()
+
+    def _acquire(self) -> subprocess.Popen:
+        with self._available:
+            while not self._idle and self._started >= self.size:
+                self._available.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+        try:
+            return self._start()
+        except BaseException:
+            # No java, say. Don't hold a place in the pool for it
+            self._release(None)
+            raise
+
+    def _release(self, proc: subprocess.Popen | None):
+        with self._available:
+            if proc is not None and proc.poll() is None:
+                self._idle.append(proc)
+            else:
+                # That JVM is gone, the next caller starts a fresh one
+                self._started -= 1
+            self._available.notify()
+
+    def close(self):
+        """Stop every idle JVM"""
+        with self._available:
+            idle, self._idle = self._idle, []
+        for proc in idle:
+            self._kill(proc)
+            self._release(None)
+        with self._lock:
+            if self._started == 0 and self._workspace is not None:
+                shutil.rmtree(self._workspace, ignore_errors=True)
+                self._workspace = None
+
+    def run(
+        self,
+        student_file: str,
+        student_source: str,
+        test_file: str,
+        test_source: str,
+        timeout: float,
+        reports_dir: Path | None = None,
+        output_limit: int | None = None,
+    ) -> JvmResult:
+        """Compile a student's code with a JUnit test file and run the tests
+
+        When `reports_dir` is given, a JUnit XML report of the run is written there.
+        When `output_limit` is given, only that many bytes of what the tests print
+        are kept, half from the start and half from the end.
+        """
+        with self._lock:
+            self._next_id += 1
+            job_id = str(self._next_id)
+
+        proc = self._acquire()
+        try:
+            request = "\t".join(
+                [
+                    job_id,
+                    student_file,
+                    _encode(student_source),
+                    test_file,
+                    _encode(test_source),
+                    str(int(timeout * 1000)),
+                    _encode(str(reports_dir or "")),
+                    # -1 keeps everything
+                    str(output_limit if output_limit is not None else -1),
+                ]
+            )
+            proc.stdin.write(request + "\n")
+            proc.stdin.flush()
+
+            # Compiling is part of the job too, so allow a little slack on top
+            # of the daemon's own test timeout before we give up on it
+            ready, _, _ = select.select([proc.stdout], [], [], timeout + 10)
+            line = proc.stdout.readline() if ready else None
+        except (BrokenPipeError, OSError):
+            line = ""
+
+        if not line:
+            self._kill(proc)
+            self._release(None)
+            if line is None:
+                return JvmResult("TIMEOUT", 0, 0, "")
+            return JvmResult(
+                "ERROR", 0, 0, "The java grader stopped while running your code."
+            )
+
+        fields = line.rstrip("\n").split("\t")
+        _, status, passed, failed, compile_millis, output = fields
+        if status == "TIMEOUT":
+            # The daemon exits after a timeout, don't hand it out again
+            self._kill(proc)
+            self._release(None)
+        else:
+            self._release(proc)
+        return JvmResult(
+            status, int(passed), int(failed), _decode(output), int(compile_millis) / 1000
+        )
@@ -0,0 +1,267 @@
+"""
+Resource limits and accounting for grading subprocesses.
+
+A wall clock timeout alone doesn't stop a submission from eating all the memory,
+forking without end or filling the disk before the timeout fires. `run` starts
+every grading subprocess (pytest, javac, java) under rlimits, in its own session
+so a timeout takes its children down with it, and reaps it with `wait4` to learn
+how much CPU time and memory it actually used. Its output is streamed through
+bounded buffers, so a program that prints without end doesn't eat the memory of
+the grader instead.
+
+The limits are set on the child from the outside with `prlimit`, not with
+`preexec_fn`: grading runs in many threads, and a child that runs python code
+between fork and exec can deadlock on a lock another thread held at the fork.
+The command starts behind a shell that waits for a line on its stdin, so nothing
+of it runs before its limits are set (see `spawn`).
+
+Where the `resource` module doesn't exist (windows), commands run without limits
+and no usage is reported.
+"""
+
+from dataclasses import dataclass
+import errno
+import os
+import selectors
+import shutil
+import signal
+import subprocess
+import sys
+import time
+
+from .capture import HeadTailBuffer
+from .trace import SPAWN, Trace
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+@dataclass
+class ResourceLimits:
+    """rlimits for one grading subprocess. None leaves a limit as it is."""
+
+    cpu_seconds: int | None = None
+    address_space: int | None = None  # bytes
+    processes: int | None = None  # counted across the whole user, not per run
+    file_size: int | None = None  # bytes, per file written
+    # bytes of stdout and of stderr kept, half from the start and half from the end.
+    # Not an rlimit, the grader cuts the output as it reads it
+    output_bytes: int | None = None
+
+    def _rlimits(self) -> list[tuple[int, tuple[int, int]]]:
+        """The `(resource, (soft, hard))` of every limit that is set"""
+        rlimits = []
+        if self.cpu_seconds is not None:
+            # SIGXCPU at the soft limit, SIGKILL a second later if it is ignored
+            rlimits.append(
+                (resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 1))
+            )
+        for limit, value in (
+            (resource.RLIMIT_AS, self.address_space),
+            (resource.RLIMIT_NPROC, self.processes),
+            (resource.RLIMIT_FSIZE, self.file_size),
+        ):
+            if value is not None:
+                rlimits.append((limit, (value, value)))
+        return rlimits
+
+    def apply(self):
+        """Set the limits on the current process"""
+        if resource is None:
+            return
+        for limit, values in self._rlimits():
+            resource.setrlimit(limit, values)
+
+    def apply_to(self, pid: int):
+        """Set the limits on another process (linux only)"""
+        for limit, values in self._rlimits():
+            resource.prlimit(pid, limit, values)
+
+    def without_address_space(self) -> "ResourceLimits":
+        """The same limits minus the address space one, for the JVM, which reserves
+        far more address space than it ever touches"""
+        return ResourceLimits(
+            self.cpu_seconds, None, self.processes, self.file_size, self.output_bytes
+        )
+
+    def to_dict(self) -> dict:
+        return {
+            "cpu_seconds": self.cpu_seconds,
+            "address_space": self.address_space,
+            "processes": self.processes,
+            "file_size": self.file_size,
+            "output_bytes": self.output_bytes,
+        }
+
+
+@dataclass
+class Usage:
+    """What grading subprocesses actually used"""
+
+    cpu_time: float = 0.0  # user + system seconds
+    max_rss: int = 0  # bytes, of the hungriest process
+
+    def add(self, other: "Usage | None") -> "Usage":
+        """Usage of two runs that happened one after the other"""
+        if other is None:
+            return self
+        return Usage(self.cpu_time + other.cpu_time, max(self.max_rss, other.max_rss))
+
+
+def usage_from_rusage(rusage) -> Usage:
+    # ru_maxrss is in kilobytes, except on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return Usage(rusage.ru_utime + rusage.ru_stime, rusage.ru_maxrss * scale)
+
+
+# Holds a command back until a line comes in on its stdin, then becomes it
+_GATE = ["/bin/sh", "-c", 'read _ && exec "$@"', "sh"]
+
+
+def spawn(
+    args: list[str], limits: ResourceLimits | None = None, **kwargs
+) -> subprocess.Popen:
+    """`subprocess.Popen(args, **kwargs)` under `limits`, in a session of its own.
+
+    The command starts behind `_GATE`, gets its limits with `prlimit` and is only
+    then let through. Its stdin is a pipe, whatever it reads comes after the
+    gate's line. Where there is no `prlimit` (macOS) the limits are set with
+    `preexec_fn` after all.
+
+    Raises:
+        FileNotFoundError if there is no such command, like Popen
+    """
+    if limits is None or resource is None:
+        return subprocess.Popen(
+            args, stdin=subprocess.PIPE, start_new_session=True, **kwargs
+        )
+    if not hasattr(resource, "prlimit"):
+        return subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            start_new_session=True,
+            preexec_fn=limits.apply,
+            **kwargs,
+        )
+
+    # The shell would only say "not found" once it is let through
+    if shutil.which(args[0]) is None:
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), args[0])
+    proc = subprocess.Popen(
+        [*_GATE, *args], stdin=subprocess.PIPE, start_new_session=True, **kwargs
+    )
+    try:
+        limits.apply_to(proc.pid)
+        os.write(proc.stdin.fileno(), b"\n")
+    except BaseException:
+        proc.kill()
+        proc.wait()
+        raise
+    return proc
+
+
+def _wait_until(pid: int, deadline: float):
+    """`os.wait4` a process without waiting past `deadline`
+
+    Returns:
+        What `os.wait4` returns, or None if the process was still running
+    """
+    delay = 0.001
+    while True:
+        reaped = os.wait4(pid, os.WNOHANG)
+        if reaped[0] != 0:
+            return reaped
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.05)
+
+
+def run(
+    args: list[str],
+    *,
+    cwd: str,
+    timeout: float,
+    limits: ResourceLimits | None = None,
+    trace: Trace | None = None,
+) -> tuple[subprocess.CompletedProcess, Usage | None]:
+    """Like `subprocess.run(args, capture_output=True)`, under `limits`. How long
+    starting the process took is added to `trace`, if one is given.
+
+    Only the head and tail of stdout and stderr are kept if `limits` has an
+    `output_bytes`, with a marker where the rest was cut.
+
+    Returns:
+        The finished process and what it used
+
+    Raises:
+        subprocess.TimeoutExpired after `timeout` seconds, once everything the
+        command started has been killed. Its `usage` attribute is what it used.
+    """
+    output_bytes = limits.output_bytes if limits is not None else None
+    if resource is None:
+        process = subprocess.run(
+            args, cwd=cwd, capture_output=True, timeout=timeout, check=False
+        )
+        # Too late to save the memory, but the comments stay short
+        for stream in ("stdout", "stderr"):
+            buffer = HeadTailBuffer(output_bytes)
+            buffer.write(getattr(process, stream))
+            setattr(process, stream, buffer.getvalue())
+        return process, None
+
+    spawn_start = time.monotonic()
+    proc = spawn(
+        args, limits, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    # Nothing to read but the end of it
+    proc.stdin.close()
+    if trace is not None:
+        trace.add(SPAWN, time.monotonic() - spawn_start)
+    output = {
+        proc.stdout.fileno(): HeadTailBuffer(output_bytes),
+        proc.stderr.fileno(): HeadTailBuffer(output_bytes),
+    }
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    with selectors.DefaultSelector() as selector:
+        selector.register(proc.stdout, selectors.EVENT_READ)
+        selector.register(proc.stderr, selectors.EVENT_READ)
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                chunk = os.read(key.fd, 65536)
+                if chunk:
+                    output[key.fd].write(chunk)
+                else:
+                    selector.unregister(key.fileobj)
+
+    # Reap it ourselves to get its rusage; Popen sees the returncode and won't wait.
+    # A program can close its output long before it exits, the deadline still holds
+    reaped = None if timed_out else _wait_until(proc.pid, deadline)
+    if reaped is None:
+        timed_out = True
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        reaped = os.wait4(proc.pid, 0)
+    _, status, rusage = reaped
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    stdout = output[proc.stdout.fileno()].getvalue()
+    stderr = output[proc.stderr.fileno()].getvalue()
+    proc.stdout.close()
+    proc.stderr.close()
+    usage = usage_from_rusage(rusage)
+
+    if timed_out:
+        error = subprocess.TimeoutExpired(args, timeout, stdout, stderr)
+        error.usage = usage
+        raise error
+    return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr), usage
@@ -0,0 +1,208 @@
+"""
+Single pass style analysis of a python submission.
+
+ICS3UGrader used to make one regex pass over every line per style criterion.
+`analyze` lexes the source once and collects everything the style checks need:
+the header docstring lines, the names assigned to (including tuple unpacking,
+`for` targets and augmented assignment) and the line-leading comments used for IPO.
+
+The lexer is one compiled regex that only stops at the few things that matter
+(strings, comments, bracketed groups, `for` headers, `:` and `=`), which is a good deal
+faster than walking `tokenize` or `ast` output in python. It still knows when it is
+inside a string or a function call, which is what keeps `print(x, sep=",")` and
+`x == y` from being read as assignments, and where the header of a one line
+compound statement like `if x: y = 1` ends.
+
+`normalize` is the other way around: it parses the file with `ast` to find out
+what the code does regardless of its comments, docstrings and formatting, so a
+resubmission that only fixed those can reuse the unit test result of the last one.
+`syntax_error` parses it too, so code that can't run is caught before pytest is.
+"""
+
+import ast
+from dataclasses import dataclass, field
+import itertools
+import keyword
+import re
+import traceback
+import warnings
+
+_STRING = r"""
+    \"\"\"(?:\\.|[^\\])*?\"\"\"
+  | '''(?:\\.|[^\\])*?'''
+  | "(?:\\.|[^"\\\n])*"
+  | '(?:\\.|[^'\\\n])*'
+"""
+_COMMENT = r"\#[^\n]*"
+
+
+def _bracketed(levels: int) -> str:
+    """A pattern for a balanced (...), [...] or {...} nested up to `levels` deep"""
+    # One character at a time: `[^...]+` inside `(...)*` backtracks exponentially
+    # on brackets that never close
+    atom = rf"""[^()\[\]{{}}'"\#] | {_STRING} | {_COMMENT}"""
+    if levels > 1:
+        atom += " | " + _bracketed(levels - 1)
+    return rf"(?: \((?:{atom})*\) | \[(?:{atom})*\] | \{{(?:{atom})*\}} )"
+
+
+# Whole bracketed groups are matched in one go: nothing inside them (keyword
+# arguments, dict/list contents, default values...) can be an assignment, and it
+# is a lot cheaper than stepping through every bracket. Brackets nested deeper
+# than that (or left unclosed) show up one by one as open/close.
+_LEXER = re.compile(
+    rf"""
+    # Only try the alternatives at characters that can start one of them
+    (?=[\n;:()\[\]{{}}\#"'=])
+    (?:
+        (?P<for>\n[ \t]*(?:async[ \t]+)?for[ \t]+(?P<for_target>[^\n]+?)[ \t]+in\b)
+      | (?P<group>{_bracketed(3)})
+      | (?P<string>{_STRING})
+      | (?P<comment>{_COMMENT})
+      | (?P<open>[(\[{{])
+      | (?P<close>[)\]}}])
+      | (?P<semicolon>;)
+      # Ends a compound statement header or an annotated name, but `:=` doesn't
+      | (?P<colon>:(?!=))
+      # `=` and augmented assignment, but not `==`, `!=`, `<=`, `>=` or `:=`
+      | (?P<assign>(?:(?<=<<)|(?<=>>)|(?<![=!<>:]))=(?!=))
+    )
+    """,
+    re.VERBOSE,
+)
+
+_NAME = re.compile(r"[A-Za-z_]\w*")
+_TARGET_SEPARATORS = re.compile(r"[,()\[\]]")
+_SUBSCRIPT = re.compile(r"[\w.]+\s*\[[^\[\]]*\]")
+# What a line starts with when the `:` on it ends a compound statement header
+# (or a lambda's parameters), rather than a name's annotation
+_HEADER_KEYWORDS = frozenset(
+    "if elif else while for with async try except finally def class match case "
+    "lambda".split()
+)
+
+# The nodes whose body can start with a docstring
+_HAS_DOCSTRING = (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+
+# How many lines of the file the header docstring checks look at
+HEADER_LINES = 5
+
+
+@dataclass
+class PyStyleReport:
+    """Everything the ICS3U style checks need to know about a file"""
+
+    header_lines: list[str] = field(default_factory=list)
+    variables: list[str] = field(default_factory=list)
+    comments: list[str] = field(default_factory=list)
+
+
+def _target_names(target: str) -> list[str]:
+    """The plain names in an assignment target like `a, (b, *c)` or `x: int`"""
+    target = _SUBSCRIPT.sub("", target.split(":", 1)[0])
+    names = []
+    for part in _TARGET_SEPARATORS.split(target):
+        part = part.strip().lstrip("*").strip()
+        # Attributes, subscripts and anything fancier are not new variables
+        if _NAME.fullmatch(part) and not keyword.iskeyword(part):
+            names.append(part)
+    return names
+
+
+def analyze(source: str) -> PyStyleReport:
+    """Lex a python source file once and collect what the style checks need"""
+    report = PyStyleReport(
+        header_lines=list(
+            itertools.islice(
+                itertools.dropwhile(lambda line: line.strip() == "", source.splitlines()),
+                HEADER_LINES,
+            )
+        )
+    )
+
+    # `for` headers are found by the newline in front of them, the first line too
+    source = "\n" + source
+    depth = 0
+    # Where the target of the next `=` on this line starts
+    target_start = 0
+    for match in _LEXER.finditer(source):
+        kind = match.lastgroup
+        if kind == "assign":
+            if depth > 0:
+                continue
+            equals = match.start()
+            start = max(target_start, source.rfind("\n", 0, equals) + 1)
+            # Augmented assignments (`+=`) leave their operator on the target
+            target = source[start:equals].rstrip().rstrip("+-*/%&|^@<>").strip()
+            if _NAME.fullmatch(target) and not keyword.iskeyword(target):
+                report.variables.append(target)
+            else:
+                report.variables.extend(_target_names(target))
+            target_start = match.end()
+        elif kind == "comment":
+            line_start = source.rfind("\n", 0, match.start()) + 1
+            if source[line_start : match.start()].strip() == "":
+                report.comments.append(match.group().lower())
+        elif kind == "for":
+            if depth == 0:
+                report.variables.extend(_target_names(match.group("for_target")))
+        elif kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth = max(0, depth - 1)
+        elif kind == "semicolon":
+            target_start = match.end()
+        elif kind == "colon":
+            if depth > 0:
+                continue
+            start = max(target_start, source.rfind("\n", 0, match.start()) + 1)
+            words = source[start : match.start()].split(None, 1)
+            # The target of `if x: y = 1` starts after the `:`, of `y: int = 1` before
+            if words and words[0] in _HEADER_KEYWORDS:
+                target_start = match.end()
+
+    return report
+
+
+def normalize(source: str) -> str | None:
+    """The AST of a python source file without its docstrings, as text.
+
+    Comments, blank lines, formatting and docstrings all leave it unchanged.
+
+    Returns:
+        The dumped AST, or None if the source doesn't parse
+    """
+    try:
+        with warnings.catch_warnings():
+            # Students' invalid escapes like "\d" are not our problem here
+            warnings.simplefilter("ignore")
+            tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None
+
+    for node in ast.walk(tree):
+        if isinstance(node, _HAS_DOCSTRING):
+            body = node.body
+            if (
+                body
+                and isinstance(body[0], ast.Expr)
+                and isinstance(body[0].value, ast.Constant)
+                and isinstance(body[0].value.value, str)
+            ):
+                del body[0]
+    return ast.dump(tree)
+
+
+def syntax_error(source: str, filename: str) -> str | None:
+    """Why python can't run some source, reported the way python reports it (with
+    the line and a caret under the column), or None if it parses"""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            compile(source, filename, "exec", ast.PyCF_ONLY_AST, dont_inherit=True)
+    except SyntaxError as e:
+        return "".join(traceback.format_exception_only(e))
+    except ValueError as e:
+        # Null bytes in the file
+        return f"{filename}: {e}\n"
+    return None
@@ -0,0 +1,98 @@
+"""
+Structured test reports.
+
+Both test runners can write JUnit style XML: pytest with `--junitxml` and the JUnit
+console launcher (and the grading daemon) with `--reports-dir`. Reading those is
+exact, unlike counting "PASSED" in console output. The reports are parsed
+incrementally, one <testcase> at a time, so a huge report is never held in
+memory all at once.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator
+import xml.etree.ElementTree as ET
+
+PASSED = "passed"
+FAILED = "failed"
+ERROR = "error"
+SKIPPED = "skipped"
+
+
+@dataclass
+class TestCaseResult:
+    """The outcome of one test"""
+
+    name: str
+    classname: str
+    outcome: str  # passed, failed, error or skipped
+    duration: float  # seconds
+    message: str | None = None
+
+    # Not a test class, keep pytest from collecting it
+    __test__ = False
+
+    @property
+    def full_name(self) -> str:
+        """`classname.name`, unique within a test file"""
+        return f"{self.classname}.{self.name}" if self.classname else self.name
+
+
+@dataclass
+class TestSummary:
+    passed: int = 0
+    failed: int = 0
+    errors: int = 0
+    skipped: int = 0
+
+    __test__ = False
+
+    @property
+    def total(self) -> int:
+        return self.passed + self.failed + self.errors + self.skipped
+
+
+def _outcome(testcase: ET.Element) -> tuple[str, str | None]:
+    for child in testcase:
+        if child.tag in ("failure", "error", "skipped"):
+            message = child.get("message") or (child.text or "").strip() or None
+            outcome = {"failure": FAILED, "error": ERROR, "skipped": SKIPPED}[child.tag]
+            return outcome, message
+    return PASSED, None
+
+
+def parse_junit_xml(report: Path) -> Iterator[TestCaseResult]:
+    """Yield a TestCaseResult for every <testcase> in a JUnit XML report"""
+    for _, element in ET.iterparse(report, events=("end",)):
+        if element.tag != "testcase":
+            continue
+        outcome, message = _outcome(element)
+        yield TestCaseResult(
+            name=element.get("name", ""),
+            classname=element.get("classname", ""),
+            outcome=outcome,
+            duration=float(element.get("time") or 0),
+            message=message,
+        )
+        # Done with this test case, don't let the tree grow
+        element.clear()
+
+
+def parse_reports_dir(reports_dir: Path) -> Iterator[TestCaseResult]:
+    """Yield the test cases of every TEST-*.xml report in a --reports-dir"""
+    for report in sorted(Path(reports_dir).glob("TEST-*.xml")):
+        yield from parse_junit_xml(report)
+
+
+def summarize(results: Iterable[TestCaseResult]) -> TestSummary:
+    summary = TestSummary()
+    for result in results:
+        if result.outcome == PASSED:
+            summary.passed += 1
+        elif result.outcome == FAILED:
+            summary.failed += 1
+        elif result.outcome == ERROR:
+            summary.errors += 1
+        else:
+            summary.skipped += 1
+    return summary
@@ -0,0 +1,120 @@
+"""
+Throwaway grading workspaces.
+
+Graders used to run inside the student's upload directory: the test file was
+copied in next to the submission, `.class` files and `__pycache__` were left
+behind, and two gradings of the same student raced each other. Now every run
+gets a fresh, empty directory (on tmpfs when there is one) holding copies of the
+submission and the test file, and the directory is thrown away afterwards. They
+are copies, not links: the student's code runs in there and could otherwise
+write through a link into the class's test file.
+
+Making a directory is cheap but not free, so a `WorkspacePool` keeps a few empty
+ones ready and cleans up used ones on a background thread, off the grading path.
+"""
+
+import atexit
+from contextlib import contextmanager
+import os
+from pathlib import Path
+import queue
+import shutil
+import tempfile
+import threading
+from typing import Iterator
+
+# Memory backed on most linux systems
+TMPFS = Path("/dev/shm")
+
+
+def default_root() -> Path:
+    """Where workspaces go when no root is configured: tmpfs if we can use it"""
+    if TMPFS.is_dir() and os.access(TMPFS, os.W_OK | os.X_OK):
+        return TMPFS
+    return Path(tempfile.gettempdir())
+
+
+def copy(workspace: Path, src: Path, name: str | None = None) -> Path:
+    """Copy `src` into a workspace (as `name`, or its own name). Its modification
+    time is kept, so bytecode compiled from it still matches"""
+    dest = workspace / (name or src.name)
+    shutil.copy2(src, dest)
+    return dest
+
+
+def _make(root: Path) -> Path:
+    return Path(tempfile.mkdtemp(prefix="pycs-run-", dir=root))
+
+
+@contextmanager
+def temporary_workspace(root: Path | None = None) -> Iterator[Path]:
+    """A fresh workspace that is removed afterwards, for when there is no pool"""
+    workspace = _make(root or default_root())
+    try:
+        yield workspace
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+
+
+class WorkspacePool:
+    """Empty workspaces made ahead of time. Safe to share between grading threads."""
+
+    def __init__(self, root: Path | None = None, size: int = 4):
+        self.root = Path(root) if root else default_root()
+        self.size = max(1, size)
+        self._ready: queue.SimpleQueue[Path] = queue.SimpleQueue()
+        self._used: queue.SimpleQueue[Path | None] = queue.SimpleQueue()
+        self._cleaner: threading.Thread | None = None
+        self._lock = threading.Lock()
+        for _ in range(self.size):
+            self._ready.put(_make(self.root))
+        # Don't leave empty workspaces behind on tmpfs when the process exits
+        atexit.register(self.close)
+
+    @contextmanager
+    def workspace(self) -> Iterator[Path]:
+        """An empty workspace for one grading run"""
+        try:
+            workspace = self._ready.get_nowait()
+        except queue.Empty:
+            # Busier than the pool is big, make one on the spot
+            workspace = _make(self.root)
+        try:
+            yield workspace
+        finally:
+            self._ensure_cleaner()
+            self._used.put(workspace)
+
+    def _ensure_cleaner(self):
+        with self._lock:
+            if self._cleaner is None or not self._cleaner.is_alive():
+                self._cleaner = threading.Thread(
+                    target=self._clean, name="workspace-cleaner", daemon=True
+                )
+                self._cleaner.start()
+
+    def _clean(self):
+        """Tear down used workspaces and replace them with fresh ones"""
+        while True:
+            workspace = self._used.get()
+            if workspace is None:
+                return
+            shutil.rmtree(workspace, ignore_errors=True)
+            if self._ready.qsize() < self.size:
+                self._ready.put(_make(self.root))
+
+    def close(self):
+        """Remove every workspace this pool made"""
+        with self._lock:
+            if self._cleaner is not None and self._cleaner.is_alive():
+                self._used.put(None)
+                self._cleaner.join()
+            self._cleaner = None
+        for workspaces in (self._used, self._ready):
+            while True:
+                try:
+                    workspace = workspaces.get_nowait()
+                except queue.Empty:
+                    break
+                if workspace is not None:
+                    shutil.rmtree(workspace, ignore_errors=True)
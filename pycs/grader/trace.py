@@ -0,0 +1,66 @@
+"""
+Stage timings of a grading run.
+
+Every grader carries a `Trace` and times its stages with it (the style checks,
+the unit tests and, inside those, prechecking, spawning, compiling, running and
+parsing). The grading queue stores the timings of each run so the teacher's
+timings page can show how long every stage usually takes, per assignment. A
+trace's listener hears about each stage as it starts, which is how students watch
+their submission being graded.
+"""
+
+from contextlib import contextmanager
+import threading
+import time
+from typing import Callable, Iterator
+
+# The stages graders time. Stages nest: unit_test includes the ones after it.
+HEADER = "header"
+IPO = "ipo"
+VARIABLES = "variables"
+UNIT_TEST = "unit_test"
+PRECHECK = "precheck"
+SPAWN = "spawn"
+COMPILE = "compile"
+TEST_RUN = "test_run"
+PARSE = "parse"
+CACHE = "cache"
+# The order stages are shown in
+STAGES = (
+    CACHE,
+    HEADER,
+    IPO,
+    VARIABLES,
+    UNIT_TEST,
+    PRECHECK,
+    SPAWN,
+    COMPILE,
+    TEST_RUN,
+    PARSE,
+)
+
+
+class Trace:
+    """Monotonic seconds spent in each stage of one grading run"""
+
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+        # Called with each stage as it starts, for live progress
+        self.listener: Callable[[str], None] | None = None
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        """Count some more time against a stage (a stage can run more than once)"""
+        with self._lock:
+            self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, stage: str) -> Iterator[None]:
+        """Time the body of a `with` block as `stage`"""
+        if self.listener is not None:
+            self.listener(stage)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(stage, time.monotonic() - start)
@@ -0,0 +1,283 @@
+"""
+A pre-warmed pytest fork-server.
+
+Starting a fresh `pytest` process for every submission pays for interpreter
+startup, pytest's imports and plugin discovery each time. The zygote is a long
+lived process that has already imported pytest (and every installed plugin) and
+forks a fresh child per submission, so each run only pays for the student's code.
+
+This file runs on its own as the zygote process (`python zygote.py`) and only
+uses the standard library and pytest, so it does not drag the flask app along.
+The web process talks to it through `PytestZygote`, one JSON request/response
+per line over the zygote's stdin/stdout.
+"""
+
+import json
+import os
+from pathlib import Path
+import selectors
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+try:
+    from .capture import HeadTailBuffer
+except ImportError:
+    # Running as the zygote process, next to capture.py
+    from capture import HeadTailBuffer
+
+
+class PytestZygote:
+    """Client for a zygote process. Safe to share between grading threads."""
+
+    def __init__(self):
+        self._proc: subprocess.Popen | None = None
+        self._lock = threading.Lock()
+        self._waiting: dict[int, dict] = {}
+        self._next_id = 0
+
+    def start(self):
+        """Start the zygote process (if it isn't already running)"""
+        with self._lock:
+            self._start_locked()
+
+    def _start_locked(self):
+        if self._proc is not None and self._proc.poll() is None:
+            return
+        self._proc = subprocess.Popen(
+            [sys.executable, str(Path(__file__))],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        self._waiting = {}
+        threading.Thread(
+            target=self._read_responses, args=(self._proc,), daemon=True
+        ).start()
+
+    def close(self):
+        """Stop the zygote process"""
+        with self._lock:
+            if self._proc is not None:
+                self._proc.kill()
+                self._proc.wait()
+                self._proc = None
+
+    def run(
+        self, args: list[str], cwd: Path, timeout: float, limits=None
+    ) -> tuple[int, str, "Usage"] | None:
+        """Run `pytest <args>` in `cwd` inside a forked child, under the rlimits of a
+        `ResourceLimits` if one is given (and with its output cut to the head and
+        tail of `output_bytes`).
+
+        Returns:
+            The return code and combined output of pytest and the child's CPU time
+            and peak memory, or None if the run took longer than `timeout` seconds.
+        """
+        from .limits import Usage
+
+        done = threading.Event()
+        with self._lock:
+            self._start_locked()
+            self._next_id += 1
+            job_id = self._next_id
+            self._waiting[job_id] = waiter = {"done": done}
+            request = {
+                "id": job_id,
+                "args": args,
+                "cwd": str(cwd),
+                "timeout": timeout,
+                "limits": limits.to_dict() if limits is not None else {},
+            }
+            self._proc.stdin.write((json.dumps(request) + "\n").encode())
+            self._proc.stdin.flush()
+
+        # The zygote enforces the timeout itself; this is only a safety net
+        # in case the zygote process dies mid-run.
+        if not done.wait(timeout + 5) or "response" not in waiter:
+            return None
+        response = waiter["response"]
+        if response["timed_out"]:
+            return None
+        usage = Usage(response["cpu_time"], response["max_rss"])
+        return response["returncode"], response["output"], usage
+
+    def _read_responses(self, proc: subprocess.Popen):
+        for line in proc.stdout:
+            response = json.loads(line)
+            with self._lock:
+                waiter = self._waiting.pop(response["id"], None)
+            if waiter is not None:
+                waiter["response"] = response
+                waiter["done"].set()
+
+        # The zygote went away, wake anyone still waiting on it
+        with self._lock:
+            if self._proc is proc:
+                for waiter in self._waiting.values():
+                    waiter["done"].set()
+                self._waiting = {}
+
+
+###############################################################################
+# Zygote process
+###############################################################################
+
+
+def _prewarm():
+    """Import pytest and all of its plugins so forked children don't have to"""
+    import importlib.metadata
+
+    import pytest  # noqa: F401
+    import _pytest.config
+
+    _pytest.config.get_plugin_manager()
+    for entry_point in importlib.metadata.entry_points(group="pytest11"):
+        try:
+            entry_point.load()
+        except Exception:
+            pass
+
+
+def _apply_limits(limits: dict):
+    """The same rlimits `ResourceLimits.apply` sets, for a forked child"""
+    import resource
+
+    if limits.get("cpu_seconds") is not None:
+        cpu = limits["cpu_seconds"]
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 1))
+    for limit, key in (
+        (resource.RLIMIT_AS, "address_space"),
+        (resource.RLIMIT_NPROC, "processes"),
+        (resource.RLIMIT_FSIZE, "file_size"),
+    ):
+        if limits.get(key) is not None:
+            resource.setrlimit(limit, (limits[key], limits[key]))
+
+
+def _run_child(request: dict, write_fd: int):
+    """Runs in the forked child: become pytest and exit"""
+    try:
+        os.setsid()
+        _apply_limits(request.get("limits", {}))
+        os.chdir(request["cwd"])
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(write_fd, 1)
+        os.dup2(write_fd, 2)
+        sys.path.insert(0, request["cwd"])
+
+        import pytest
+
+        returncode = int(pytest.main(request["args"]))
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except BaseException:
+        returncode = 3
+    os._exit(returncode)
+
+
+# How often children that closed their output are checked on until they exit
+EXIT_POLL_SECONDS = 0.005
+
+
+def serve():
+    """Read requests from stdin, fork a pytest child for each, answer on stdout"""
+    _prewarm()
+    out = sys.stdout
+    selector = selectors.DefaultSelector()
+    selector.register(sys.stdin.buffer, selectors.EVENT_READ, None)
+    stdin_buffer = b""
+    # By pid. A child stays here after closing its output until it exits or runs
+    # out of time, and nothing here ever waits on one, so one child can't hold
+    # up the rest
+    children = {}
+
+    def close_output(child):
+        if child["fd"] is not None:
+            selector.unregister(child["fd"])
+            os.close(child["fd"])
+            child["fd"] = None
+
+    def respond(child, reaped, timed_out):
+        _, status, rusage = reaped
+        response = {
+            "id": child["id"],
+            "timed_out": timed_out,
+            "returncode": os.waitstatus_to_exitcode(status),
+            "output": child["output"].getvalue().decode(errors="replace"),
+            "cpu_time": rusage.ru_utime + rusage.ru_stime,
+            # ru_maxrss is in kilobytes, except on macOS
+            "max_rss": rusage.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+        }
+        out.write(json.dumps(response) + "\n")
+        out.flush()
+
+    def kill(child):
+        close_output(child)
+        try:
+            os.killpg(child["pid"], signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        # Killed, so this doesn't wait long
+        respond(child, os.wait4(child["pid"], 0), timed_out=True)
+
+    while True:
+        deadline = min((c["deadline"] for c in children.values()), default=None)
+        wait = None if deadline is None else max(0, deadline - time.monotonic())
+        if any(c["fd"] is None for c in children.values()):
+            wait = min(wait, EXIT_POLL_SECONDS)
+        for key, _ in selector.select(wait):
+            if key.data is None:
+                chunk = os.read(key.fd, 65536)
+                if not chunk:
+                    # The web process went away, so do we
+                    for child in children.values():
+                        kill(child)
+                    return
+                stdin_buffer += chunk
+                while b"\n" in stdin_buffer:
+                    line, stdin_buffer = stdin_buffer.split(b"\n", 1)
+                    request = json.loads(line)
+                    read_fd, write_fd = os.pipe()
+                    out.flush()
+                    pid = os.fork()
+                    if pid == 0:
+                        os.close(read_fd)
+                        _run_child(request, write_fd)
+                    os.close(write_fd)
+                    children[pid] = child = {
+                        "id": request["id"],
+                        "pid": pid,
+                        "fd": read_fd,
+                        "output": HeadTailBuffer(
+                            request.get("limits", {}).get("output_bytes")
+                        ),
+                        "deadline": time.monotonic() + request["timeout"],
+                    }
+                    selector.register(read_fd, selectors.EVENT_READ, child)
+            else:
+                child = key.data
+                chunk = os.read(key.fd, 65536)
+                if chunk:
+                    child["output"].write(chunk)
+                else:
+                    close_output(child)
+
+        now = time.monotonic()
+        for pid, child in list(children.items()):
+            if child["fd"] is None:
+                reaped = os.wait4(pid, os.WNOHANG)
+                if reaped[0] != 0:
+                    del children[pid]
+                    respond(child, reaped, timed_out=False)
+                    continue
+            if child["deadline"] <= now:
+                del children[pid]
+                kill(child)
+
+
+if __name__ == "__main__":
+    serve()
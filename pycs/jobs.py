@@ -0,0 +1,592 @@
+"""
+Grading job queue.
+
+Uploads are saved by the view and handed to this queue, so the request returns
+right away. Jobs live in the grading_job table, so they survive a restart of the
+web process and can be graded by workers on other machines sharing the database
+and the upload folder (`flask grading-worker`). Worker threads run the graders
+(which spend most of their time waiting on pytest/javac/java subprocesses) and
+write the scores back through the assignment controller.
+
+A worker claims a job by taking a lease on it, and keeps renewing the lease while
+it grades. If the worker dies, the lease runs out and another worker picks the
+job up again, up to GRADING_MAX_ATTEMPTS times. A job whose grading raised goes
+back in line the same way, counting as an attempt. After that the student gets a
+score of 0 with a comment saying their code couldn't be graded.
+
+Workers don't simply take the oldest job. Submissions to assignments that are
+due soon go first, and otherwise students take turns: a student who already has
+a job being graded waits behind students who don't, so one student submitting
+over and over can't starve the rest of the class. The backlog is bounded; past
+GRADING_MAX_BACKLOG new jobs are turned away (the upload itself is already
+saved) with an estimate of when to try again.
+
+Every step of a job (queued, picked up, each grading stage, done) is published
+on `events` for the assignment page's live progress stream.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+import math
+import os
+from pathlib import Path
+import socket
+import threading
+import time
+
+from pycs.events import DONE, GRADING, QUEUED, GradingEvents
+from pycs.exc import GradingBacklogFullException
+
+# The comment a student gets when their submission can't be graded at all
+GRADING_FAILED_COMMENT = (
+    "Your code could not be graded. Submit it again, and tell your teacher "
+    "if this keeps happening."
+)
+
+
+@dataclass
+class Job:
+    """One submission waiting to be (or being) graded"""
+
+    user_id: int
+    assignment_id: int
+    class_id: int
+    code_path: Path
+    due_date: datetime | None = None
+    status: str = "queued"
+    queued_at: datetime = field(default_factory=datetime.now)
+    # Times a worker has picked it up, this time included once claimed
+    attempts: int = 0
+    id: int | None = None
+
+    @classmethod
+    def from_row(cls, row) -> "Job":
+        """A detached copy of a GradingJob, safe to use after its session is gone"""
+        return cls(
+            row.user_id,
+            row.assignment_id,
+            row.class_id,
+            Path(row.code_path),
+            row.due_date,
+            row.status,
+            row.queued_at,
+            row.attempts,
+            row.id,
+        )
+
+    @property
+    def key(self) -> tuple[int, int]:
+        return self.user_id, self.assignment_id
+
+    def is_urgent(self, now: datetime, window: timedelta) -> bool:
+        """Whether the assignment is due within `window` (and isn't past due)"""
+        return self.due_date is not None and now <= self.due_date <= now + window
+
+
+class GradingQueue:
+    """A durable queue of grading jobs drained by pools of worker threads.
+
+    The web process runs GRADING_WORKERS worker threads of its own. A pool size of
+    0 grades inline in the calling thread (handy for tests and the CLI), unless
+    GRADING_QUEUE_ONLY is set, in which case jobs are only queued for the
+    `flask grading-worker` processes.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        # Wakes this process's workers up when a job is submitted here
+        self._cond = threading.Condition()
+        # Set to have the workers exit after the job they are grading
+        self._stopping = threading.Event()
+        # Moving average of how long a job takes, for Retry-After
+        self._average_seconds = 5.0
+        self._workers: list[threading.Thread] = []
+        self.grader_options = {}
+        self.result_cache = None
+        # Live progress of the jobs graded (or queued) by this process
+        self.events = GradingEvents()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("GRADING_WORKERS", 2)
+        app.config.setdefault("GRADING_QUEUE_ONLY", False)
+        app.config.setdefault("GRADING_PYTEST_ZYGOTE", hasattr(os, "fork"))
+        app.config.setdefault("GRADING_JVM_DAEMON", False)
+        app.config.setdefault(
+            "GRADING_CACHE_PATH", os.path.join(app.instance_path, "grading_cache.db")
+        )
+        app.config.setdefault("GRADING_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+        app.config.setdefault("GRADING_SANDBOX_ROOT", None)
+        app.config.setdefault("GRADING_SANDBOX_POOL", 4)
+        app.config.setdefault("GRADING_REGRADE_WORKERS", os.cpu_count() or 1)
+        app.config.setdefault("GRADING_REGRADE_BATCH_SIZE", 50)
+        app.config.setdefault("GRADING_LIMIT_CPU_SECONDS", 10)
+        app.config.setdefault("GRADING_LIMIT_MEMORY_BYTES", 512 * 1024 * 1024)
+        app.config.setdefault("GRADING_LIMIT_PROCESSES", 1024)
+        app.config.setdefault("GRADING_LIMIT_FILE_BYTES", 16 * 1024 * 1024)
+        app.config.setdefault("GRADING_LIMIT_OUTPUT_BYTES", 64 * 1024)
+        app.config.setdefault("GRADING_MAX_BACKLOG", 500)
+        app.config.setdefault("GRADING_DEADLINE_WINDOW", timedelta(hours=2))
+        app.config.setdefault("GRADING_LEASE_SECONDS", 30)
+        app.config.setdefault("GRADING_MAX_ATTEMPTS", 3)
+        app.config.setdefault("GRADING_POLL_SECONDS", 1.0)
+        app.config.setdefault("GRADING_EVENTS_RECHECK_SECONDS", 15)
+        app.config.setdefault("GRADING_TIMINGS_WINDOW", timedelta(days=30))
+        app.extensions["grading_queue"] = self
+        self.app = app
+        # Pick up jobs left in the table by the last run of the server
+        app.before_request(self._start_workers)
+
+        from pycs.grader import (
+            JUNIT_JAR,
+            JvmDaemon,
+            PytestZygote,
+            ResourceLimits,
+            ResultCache,
+            WorkspacePool,
+        )
+
+        self.grader_options = {
+            "limits": ResourceLimits(
+                cpu_seconds=app.config["GRADING_LIMIT_CPU_SECONDS"],
+                address_space=app.config["GRADING_LIMIT_MEMORY_BYTES"],
+                processes=app.config["GRADING_LIMIT_PROCESSES"],
+                file_size=app.config["GRADING_LIMIT_FILE_BYTES"],
+                output_bytes=app.config["GRADING_LIMIT_OUTPUT_BYTES"],
+            )
+        }
+        if app.config["GRADING_PYTEST_ZYGOTE"]:
+            self.grader_options["pytest_zygote"] = PytestZygote()
+        if app.config["GRADING_JVM_DAEMON"]:
+            self.grader_options["jvm_daemon"] = JvmDaemon(
+                Path(app.config["UPLOAD_FOLDER"]) / "lib" / JUNIT_JAR,
+                size=max(1, app.config["GRADING_WORKERS"]),
+                limits=self.grader_options["limits"],
+            )
+        if app.config["GRADING_SANDBOX_POOL"]:
+            self.grader_options["workspaces"] = WorkspacePool(
+                app.config["GRADING_SANDBOX_ROOT"], app.config["GRADING_SANDBOX_POOL"]
+            )
+
+        self.result_cache = None
+        if app.config["GRADING_CACHE_PATH"]:
+            self.result_cache = ResultCache(
+                app.config["GRADING_CACHE_PATH"], app.config["GRADING_CACHE_MAX_BYTES"]
+            )
+
+    @property
+    def num_workers(self) -> int:
+        return self.app.config["GRADING_WORKERS"]
+
+    @property
+    def grades_inline(self) -> bool:
+        return self.num_workers == 0 and not self.app.config["GRADING_QUEUE_ONLY"]
+
+    def _count(self, status: str) -> int:
+        from pycs.extensions import db
+        from pycs.models import GradingJob
+
+        with self.app.app_context():
+            return db.session.scalar(
+                db.select(db.func.count())
+                .select_from(GradingJob)
+                .where(GradingJob.status == status)
+            )
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker, on any node"""
+        return self._count("queued")
+
+    @property
+    def running(self) -> int:
+        """Number of jobs being graded, on any node"""
+        return self._count("running")
+
+    def status(self, user_id: int, assignment_id: int) -> Job | None:
+        """The unfinished job for a student's assignment, if there is one"""
+        from pycs.extensions import db
+        from pycs.models import GradingJob
+
+        with self.app.app_context():
+            row = db.session.scalars(
+                db.select(GradingJob)
+                .where(
+                    GradingJob.user_id == user_id,
+                    GradingJob.assignment_id == assignment_id,
+                )
+                .order_by(GradingJob.id.desc())
+                .limit(1)
+            ).first()
+            return Job.from_row(row) if row is not None else None
+
+    def _retry_after(self, depth: int) -> int:
+        """Roughly how many seconds until the backlog has room again"""
+        seconds = depth * self._average_seconds / max(1, self.num_workers)
+        return max(5, math.ceil(seconds))
+
+    def submit(
+        self,
+        user_id: int,
+        assignment_id: int,
+        class_id: int,
+        code_path: Path,
+        due_date: datetime | None = None,
+    ) -> Job:
+        """Queue a submission for grading.
+
+        A student who resubmits before their last upload was picked up
+        does not get a second job; the waiting job grades the newest file.
+
+        Raises:
+            GradingBacklogFullException if GRADING_MAX_BACKLOG jobs are already
+            waiting. Its `retry_after` is a guess at when there will be room.
+        """
+        from pycs.extensions import db
+        from pycs.models import GradingJob
+
+        job = Job(user_id, assignment_id, class_id, Path(code_path), due_date)
+        if self.grades_inline:
+            self.events.publish(user_id, assignment_id, GRADING)
+            score = self._grade(job)
+            self.events.publish(user_id, assignment_id, DONE, score=score)
+            return job
+
+        with self.app.app_context():
+            existing = db.session.scalars(
+                db.select(GradingJob).where(
+                    GradingJob.user_id == user_id,
+                    GradingJob.assignment_id == assignment_id,
+                    GradingJob.status == "queued",
+                )
+            ).first()
+            if existing is not None:
+                existing.code_path = str(job.code_path)
+                existing.due_date = due_date
+                db.session.commit()
+                self.events.publish(user_id, assignment_id, QUEUED)
+                return Job.from_row(existing)
+
+            max_backlog = self.app.config["GRADING_MAX_BACKLOG"]
+            if max_backlog is not None:
+                depth = self.depth
+                if depth >= max_backlog:
+                    raise GradingBacklogFullException(self._retry_after(depth))
+            row = GradingJob(
+                user_id=user_id,
+                assignment_id=assignment_id,
+                class_id=class_id,
+                code_path=str(job.code_path),
+                due_date=due_date,
+                queued_at=job.queued_at,
+            )
+            db.session.add(row)
+            db.session.commit()
+            job = Job.from_row(row)
+        self.events.publish(user_id, assignment_id, QUEUED)
+
+        with self._cond:
+            self._ensure_workers()
+            self._cond.notify()
+        return job
+
+    def _claim(self, worker_id: str) -> Job | None:
+        """Lease the job that should be graded next to a worker.
+
+        Submissions due within GRADING_DEADLINE_WINDOW go first, the soonest due
+        first. Otherwise students with nothing being graded go before students
+        who already have a job running, and ties go to whoever has waited
+        longest. Jobs whose lease ran out (their worker died) are claimed again
+        like queued ones.
+
+        Returns:
+            The claimed job, or None if there is nothing to grade
+        """
+        from pycs.extensions import db
+        from pycs.models import GradingJob
+
+        config = self.app.config
+        now = datetime.now()
+        window = config["GRADING_DEADLINE_WINDOW"]
+        claimable = db.or_(
+            GradingJob.status == "queued",
+            db.and_(GradingJob.status == "running", GradingJob.lease_expires < now),
+        )
+
+        with self.app.app_context():
+            # A job that took its worker down this many times won't do better
+            given_up = [
+                Job.from_row(row)
+                for row in db.session.scalars(
+                    db.select(GradingJob).where(
+                        claimable,
+                        GradingJob.attempts >= config["GRADING_MAX_ATTEMPTS"],
+                    )
+                )
+            ]
+            for job in given_up:
+                self.app.logger.error("Giving up on grading job %s", job)
+                score = self._record_failure(job)
+                db.session.execute(db.delete(GradingJob).where(GradingJob.id == job.id))
+                db.session.commit()
+                self.events.publish(job.user_id, job.assignment_id, DONE, score=score)
+
+            candidates = db.session.scalars(
+                db.select(GradingJob)
+                .where(claimable)
+                .order_by(GradingJob.queued_at, GradingJob.id)
+            ).all()
+            if not candidates:
+                return None
+            running = dict(
+                db.session.execute(
+                    db.select(GradingJob.user_id, db.func.count())
+                    .where(
+                        GradingJob.status == "running",
+                        GradingJob.lease_expires >= now,
+                    )
+                    .group_by(GradingJob.user_id)
+                ).all()
+            )
+
+            # Only the oldest job of each student competes, so a student's own
+            # submissions are graded in the order they came in
+            oldest: dict[int, Job] = {}
+            for row in candidates:
+                oldest.setdefault(row.user_id, Job.from_row(row))
+
+            def priority(job: Job):
+                busy = running.get(job.user_id, 0)
+                if job.is_urgent(now, window):
+                    return 0, job.due_date, busy, job.queued_at
+                return 1, now, busy, job.queued_at
+
+            lease_expires = now + timedelta(seconds=config["GRADING_LEASE_SECONDS"])
+            for job in sorted(oldest.values(), key=priority):
+                # Another worker may have claimed it since it was read
+                claimed = db.session.execute(
+                    db.update(GradingJob)
+                    .where(GradingJob.id == job.id, claimable)
+                    .values(
+                        status="running",
+                        lease_owner=worker_id,
+                        lease_expires=lease_expires,
+                        attempts=GradingJob.attempts + 1,
+                    )
+                ).rowcount
+                db.session.commit()
+                if claimed:
+                    job.status = "running"
+                    job.attempts += 1
+                    return job
+        return None
+
+    def _renew_lease(self, job: Job, worker_id: str, done: threading.Event):
+        """Keep extending a job's lease until `done` is set"""
+        from pycs.extensions import db
+        from pycs.models import GradingJob
+
+        lease = self.app.config["GRADING_LEASE_SECONDS"]
+        while not done.wait(lease / 3):
+            try:
+                with self.app.app_context():
+                    db.session.execute(
+                        db.update(GradingJob)
+                        .where(
+                            GradingJob.id == job.id,
+                            GradingJob.lease_owner == worker_id,
+                        )
+                        .values(
+                            lease_expires=datetime.now() + timedelta(seconds=lease)
+                        )
+                    )
+                    db.session.commit()
+            except Exception:
+                # Try again next time, the lease has room for a missed renewal
+                self.app.logger.exception("Could not renew the lease on %s", job)
+
+    def _finish(self, job: Job, worker_id: str):
+        """Take a graded job off the queue, unless it was given to another worker"""
+        from pycs.extensions import db
+        from pycs.models import GradingJob
+
+        with self.app.app_context():
+            db.session.execute(
+                db.delete(GradingJob).where(
+                    GradingJob.id == job.id, GradingJob.lease_owner == worker_id
+                )
+            )
+            db.session.commit()
+
+    def _requeue(self, job: Job, worker_id: str):
+        """Put a job whose grading failed back in line for another attempt"""
+        from pycs.extensions import db
+        from pycs.models import GradingJob
+
+        with self.app.app_context():
+            db.session.execute(
+                db.update(GradingJob)
+                .where(GradingJob.id == job.id, GradingJob.lease_owner == worker_id)
+                .values(status="queued", lease_owner=None, lease_expires=None)
+            )
+            db.session.commit()
+
+    def _record_failure(self, job: Job) -> float:
+        """Tell the student their submission couldn't be graded
+
+        Returns:
+            The score they get for it
+        """
+        from pycs.controllers import assignment as ass_controller
+
+        with self.app.app_context():
+            assignment = ass_controller.get_assignment_by_id(job.assignment_id)
+            ass_controller.save_score(
+                job.user_id, assignment, 0, GRADING_FAILED_COMMENT, []
+            )
+        return 0
+
+    def _start_workers(self):
+        with self._cond:
+            self._ensure_workers()
+
+    def _ensure_workers(self):
+        """Start this process's worker threads the first time they are needed"""
+        if self.app.config["GRADING_QUEUE_ONLY"]:
+            return
+        self._workers = [t for t in self._workers if t.is_alive()]
+        for i in range(len(self._workers), self.num_workers):
+            worker = threading.Thread(
+                target=self._work, name=f"grader-{i}", daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def stop_workers(self):
+        """Stop this process's worker threads once their current jobs are graded"""
+        with self._cond:
+            self._stopping.set()
+            self._cond.notify_all()
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.join()
+        self._stopping.clear()
+
+    def run_workers(self, count: int, until_idle: bool = False):
+        """Grade jobs with `count` threads in the foreground, for `flask grading-worker`
+
+        Args:
+            count: How many jobs are graded at once
+            until_idle: Return once there is nothing left to grade, instead of
+                waiting for more jobs forever
+        """
+        workers = [
+            threading.Thread(
+                target=self._work, args=(until_idle,), name=f"grader-{i}", daemon=True
+            )
+            for i in range(count)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def _work(self, until_idle: bool = False):
+        thread = threading.current_thread().name
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{thread}"
+        poll = self.app.config["GRADING_POLL_SECONDS"]
+        while not self._stopping.is_set():
+            try:
+                job = self._claim(worker_id)
+            except Exception:
+                # Most likely the database is busy, try again in a moment
+                self.app.logger.exception("Could not claim a grading job")
+                job = None
+            if job is None:
+                if until_idle:
+                    return
+                with self._cond:
+                    if not self._stopping.is_set():
+                        self._cond.wait(poll)
+                continue
+
+            self.events.publish(job.user_id, job.assignment_id, GRADING)
+            done = threading.Event()
+            heartbeat = threading.Thread(
+                target=self._renew_lease, args=(job, worker_id, done), daemon=True
+            )
+            heartbeat.start()
+            start = time.monotonic()
+            score = None
+            failed = False
+            try:
+                score = self._grade(job)
+            except Exception:
+                self.app.logger.exception("Grading job %s failed", job)
+                failed = True
+            finally:
+                done.set()
+                heartbeat.join()
+
+            # Maybe the database or the file system hiccuped, give it another go
+            retry = failed and job.attempts < self.app.config["GRADING_MAX_ATTEMPTS"]
+            try:
+                if retry:
+                    self._requeue(job, worker_id)
+                else:
+                    if failed:
+                        score = self._record_failure(job)
+                    self._finish(job, worker_id)
+            except Exception:
+                # Its lease runs out and it is graded again, no harm done
+                self.app.logger.exception("Could not finish grading job %s", job)
+            # Only once the job is gone, so a reloaded page shows the score
+            if retry:
+                self.events.publish(job.user_id, job.assignment_id, QUEUED)
+            else:
+                self.events.publish(job.user_id, job.assignment_id, DONE, score=score)
+            with self._cond:
+                seconds = time.monotonic() - start
+                self._average_seconds += 0.1 * (seconds - self._average_seconds)
+
+    def _grade(self, job: Job) -> float:
+        """Grade one job and store the score
+
+        Returns:
+            The score
+        """
+        from pycs.controllers import assignment as ass_controller
+        from pycs.grader import get_grader
+
+        with self.app.app_context():
+            assignment = ass_controller.get_assignment_by_id(job.assignment_id)
+            grader = get_grader(
+                job.class_id,
+                job.code_path,
+                shards=assignment.test_shards,
+                **self.grader_options,
+            )
+            grader.trace.listener = self.events.listener(job.user_id, job.assignment_id)
+            try:
+                if self.result_cache is not None:
+                    score, comments = self.result_cache.grade(grader)
+                else:
+                    score, comments = grader.grade_student()
+                test_results, usage = grader.test_results, grader.usage
+            except FileNotFoundError:
+                score, comments = (
+                    0,
+                    f"Tell Mr. Habib  that he forgot to upload the test file to assignment: {assignment.name}",
+                )
+                test_results, usage = [], None
+            ass_controller.save_score(
+                job.user_id,
+                assignment,
+                score,
+                comments,
+                test_results,
+                usage,
+                grader.trace.timings,
+            )
+            return score
@@ -1,5 +1,9 @@
 from .assignment import Assignment
 from .classroom import Classroom
+from .grading_job import GradingJob
+from .grading_timing import GradingTiming
+from .submission import Submission
+from .test_result import TestResult
 from .user import User
 from .user_assignment import UserAssignment
 from .user_classroom import user_classroom
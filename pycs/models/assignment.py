@@ -22,6 +22,8 @@ class Assignment(db.Model):
     unit_name: Mapped[str]
     weight: Mapped[int] = mapped_column(ForeignKey("weighting.id"))
     class_id: Mapped[int] = mapped_column(ForeignKey("classroom.id"))
+    # How many runs side by side its unit tests are split into when grading
+    test_shards: Mapped[int] = mapped_column(default=1)
 
     weighting: Mapped["Weighting"] = relationship()
     classroom: Mapped["Classroom"] = relationship(back_populates="assignments")
@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from pycs.extensions import db
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class GradingJob(db.Model):
+    """A submission waiting to be (or being) graded, shared by every worker node"""
+
+    __tablename__ = "grading_job"
+    __table_args__ = (
+        # Workers look for queued jobs and expired leases
+        Index("ix_grading_job_status_lease", "status", "lease_expires"),
+        # A student's job for an assignment, for resubmissions and the status page
+        Index("ix_grading_job_user_assignment", "user_id", "assignment_id"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    assignment_id: Mapped[int] = mapped_column(ForeignKey("assignment.id"))
+    class_id: Mapped[int]
+    code_path: Mapped[str]
+    due_date: Mapped[datetime | None]
+    status: Mapped[str] = mapped_column(default="queued")  # queued or running
+    queued_at: Mapped[datetime] = mapped_column(default=datetime.now)
+    # How many times a worker has picked it up, including ones that crashed
+    attempts: Mapped[int] = mapped_column(default=0)
+    # The worker grading it, and when that worker stops being trusted with it
+    lease_owner: Mapped[str | None]
+    lease_expires: Mapped[datetime | None]
+
+    def __repr__(self):
+        return f"<GradingJob {self.user_id=} {self.assignment_id=} {self.status=}>"
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+from pycs.extensions import db
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class GradingTiming(db.Model):
+    """How long one stage of one grading run took"""
+
+    __tablename__ = "grading_timing"
+    __table_args__ = (
+        # Reads every stage's timings already sorted, for the percentiles
+        Index(
+            "ix_grading_timing_assignment_stage_seconds",
+            "assignment_id",
+            "stage",
+            "seconds",
+        ),
+        # Finds the timings old enough to prune
+        Index("ix_grading_timing_graded_at", "graded_at"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    assignment_id: Mapped[int] = mapped_column(ForeignKey("assignment.id"))
+    stage: Mapped[str]
+    seconds: Mapped[float]
+    graded_at: Mapped[datetime] = mapped_column(default=datetime.now)
+
+    def __repr__(self):
+        return f"<GradingTiming {self.assignment_id=} {self.stage=} {self.seconds=}>"
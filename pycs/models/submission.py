@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from pycs.extensions import db
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column, relationship
+
+
+class Submission(db.Model):
+    """One uploaded version of a student's assignment, stored in the blob store"""
+
+    __tablename__ = "submission"
+    __table_args__ = (
+        # A student's history for an assignment, newest first
+        Index(
+            "ix_submission_user_assignment_submitted",
+            "user_id",
+            "assignment_id",
+            "submitted_at",
+        ),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    assignment_id: Mapped[int] = mapped_column(ForeignKey("assignment.id"))
+    filename: Mapped[str]
+    blob: Mapped[str]  # sha256 hex digest of the file
+    size: Mapped[int]  # bytes, uncompressed
+    submitted_at: Mapped[datetime] = mapped_column(default=datetime.now)
+
+    user: Mapped["User"] = relationship()
+    assignment: Mapped["Assignment"] = relationship()
+
+    def __repr__(self):
+        return f"<Submission {self.user_id=} {self.assignment_id=} {self.blob=}>"
@@ -0,0 +1,33 @@
+from pycs.extensions import db
+from sqlalchemy import ForeignKey, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+
+class TestResult(db.Model):
+    """One unit test of a student's latest graded submission"""
+
+    __tablename__ = "test_result"
+    __table_args__ = (
+        # Covers the class-wide pass rates query without touching the table
+        Index(
+            "ix_test_result_assignment_name_outcome",
+            "assignment_id",
+            "name",
+            "outcome",
+        ),
+        # Finding (and replacing) one student's results on regrade
+        Index("ix_test_result_user_assignment", "user_id", "assignment_id"),
+    )
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    assignment_id: Mapped[int] = mapped_column(ForeignKey("assignment.id"))
+    name: Mapped[str]
+    outcome: Mapped[str]  # passed, failed, error or skipped
+    duration: Mapped[float]
+
+    # Not a test class, keep pytest from collecting it
+    __test__ = False
+
+    def __repr__(self):
+        return f"<TestResult {self.user_id=} {self.assignment_id=} {self.name=}>"
@@ -13,6 +13,9 @@ class UserAssignment(db.Model):
     )
     score: Mapped[int]
     comments: Mapped[str]
+    # What the last grading run used, for capacity planning (None if nothing ran)
+    cpu_time: Mapped[float | None]  # seconds
+    max_rss: Mapped[int | None]  # bytes
 
     user: Mapped["User"] = relationship(back_populates="assignment_associations")
     assignment: Mapped["Assignment"] = relationship(back_populates="user_associations")
@@ -0,0 +1,319 @@
+"""
+Bulk regrading of an assignment.
+
+When the teacher uploads a new test file, the scores already stored for that
+assignment are stale. A regrade finds every stored submission
+(UPLOAD_FOLDER/<student_number>/<required_filename>), grades them again in
+parallel across a pool of processes and writes the new scores back in batches,
+one transaction per batch.
+
+Run it with `flask regrade <assignment_id>` or the Regrade button on the
+assignment's page.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+import multiprocessing
+from pathlib import Path
+import threading
+import time
+from typing import Callable
+
+from flask import current_app
+
+from pycs.exc import TestFileMissingException
+
+
+@dataclass
+class Regrade:
+    """Progress of regrading one assignment"""
+
+    assignment_id: int
+    total: int = 0
+    done: int = 0
+    status: str = "running"  # running, done or failed
+    error: str | None = None
+    # (student number, the error) of submissions the grader choked on
+    failed: list[tuple[str, str]] = field(default_factory=list)
+    started_at: float = field(default_factory=time.monotonic)
+    elapsed: float | None = None
+
+    @property
+    def graded(self) -> int:
+        return self.done - len(self.failed)
+
+
+# The latest regrade of each assignment, for the teacher's assignment page
+_regrades: dict[int, Regrade] = {}
+_regrades_lock = threading.Lock()
+
+# Set up once in each pool process by _init_worker
+_worker_options: dict = {}
+_worker_cache = None
+
+
+def get_regrade(assignment_id: int) -> Regrade | None:
+    with _regrades_lock:
+        return _regrades.get(assignment_id)
+
+
+def find_submissions(assignment) -> list[tuple[int, Path]]:
+    """The `(user_id, code_path)` of every stored submission for an assignment"""
+    upload_folder = Path(current_app.config["UPLOAD_FOLDER"])
+    submissions = []
+    for user in assignment.classroom.users:
+        code_path = upload_folder / user.student_number / assignment.required_filename
+        if code_path.is_file():
+            submissions.append((user.id, code_path))
+    return submissions
+
+
+def check_test_file(assignment, code_path: Path):
+    """Without a test file every student would get a 0, don't overwrite their scores
+
+    Raises:
+        TestFileMissingException if the assignment has no test file to grade with
+    """
+    from pycs.grader import get_grader
+
+    test_path = get_grader(assignment.class_id, code_path).abs_test_path
+    if not test_path.is_file():
+        raise TestFileMissingException(
+            f"Upload a test file for {assignment.name} before grading it"
+        )
+
+
+def _init_worker(options: dict, cache_path: str | None, cache_max_bytes: int):
+    """Give each pool process its own warm pytest zygote / JVM, workspaces and the
+    result cache"""
+    global _worker_cache
+    from pycs.grader import JvmDaemon, PytestZygote, ResultCache, WorkspacePool
+
+    _worker_options["limits"] = options.get("limits")
+    if options.get("pytest_zygote"):
+        _worker_options["pytest_zygote"] = PytestZygote()
+    if options.get("jvm_daemon"):
+        _worker_options["jvm_daemon"] = JvmDaemon(
+            options["jvm_daemon"], limits=options.get("limits")
+        )
+    if options.get("workspaces"):
+        _worker_options["workspaces"] = WorkspacePool(options["workspaces"], size=2)
+    if cache_path:
+        _worker_cache = ResultCache(cache_path, cache_max_bytes)
+
+
+def _grade(
+    class_id: int, code_path: Path, grader_options: dict, cache, shards: int = 1
+) -> tuple:
+    """The score, comments, per-test results, resource usage and stage timings of
+    one submission"""
+    from pycs.grader import get_grader
+
+    grader = get_grader(class_id, code_path, shards=shards, **grader_options)
+    if cache is not None:
+        score, comments = cache.grade(grader)
+    else:
+        score, comments = grader.grade_student()
+    return score, comments, grader.test_results, grader.usage, grader.trace.timings
+
+
+def _grade_one(class_id: int, code_path: Path, shards: int) -> tuple:
+    """Grade one submission in a pool process"""
+    return _grade(class_id, code_path, _worker_options, _worker_cache, shards)
+
+
+def grade_all(
+    class_id: int,
+    submissions: list[tuple[int, Path]],
+    workers: int,
+    record: Callable[..., None],
+    failed: Callable[[int, Exception], None] | None = None,
+    shards: int = 1,
+):
+    """Grade `(user_id, code_path)` submissions with the grading queue's options,
+    across a pool of `workers` processes (or in this process if it is 0)
+
+    Args:
+        record: Called in this process with the user_id and everything `_grade`
+            returns, as each submission is graded
+        failed: Called with the user_id and the exception when grading one
+            submission raises. Without it, the exception is raised.
+        shards: How many runs side by side each submission's unit tests are split
+            into (the assignment's test_shards)
+    """
+    from pycs.extensions import grading_queue
+
+    config = current_app.config
+
+    def fail(user_id: int, error: Exception):
+        if failed is None:
+            raise error
+        failed(user_id, error)
+
+    if workers == 0:
+        for user_id, code_path in submissions:
+            try:
+                graded = _grade(
+                    class_id,
+                    code_path,
+                    grading_queue.grader_options,
+                    grading_queue.result_cache,
+                    shards,
+                )
+            except Exception as e:
+                fail(user_id, e)
+            else:
+                record(user_id, *graded)
+        return
+
+    # The pool processes get their own zygote/JVM/workspaces, ours can't be shared
+    options = {
+        "pytest_zygote": "pytest_zygote" in grading_queue.grader_options,
+        "limits": grading_queue.grader_options.get("limits"),
+    }
+    jvm = grading_queue.grader_options.get("jvm_daemon")
+    if jvm is not None:
+        options["jvm_daemon"] = str(jvm.junit_jar)
+    workspaces = grading_queue.grader_options.get("workspaces")
+    if workspaces is not None:
+        options["workspaces"] = str(workspaces.root)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        # Don't fork the web server's threads into the workers
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(
+            options,
+            config["GRADING_CACHE_PATH"],
+            config["GRADING_CACHE_MAX_BYTES"],
+        ),
+    ) as pool:
+        futures = {
+            pool.submit(_grade_one, class_id, code_path, shards): user_id
+            for user_id, code_path in submissions
+        }
+        for future in as_completed(futures):
+            try:
+                graded = future.result()
+            except Exception as e:
+                fail(futures[future], e)
+            else:
+                record(futures[future], *graded)
+
+
+def regrade_assignment(
+    assignment_id: int,
+    *,
+    workers: int | None = None,
+    batch_size: int | None = None,
+    progress: Callable[[Regrade], None] | None = None,
+    regrade: Regrade | None = None,
+) -> Regrade:
+    """Grade every stored submission for an assignment again and save the scores.
+
+    Submissions that fail to grade keep their old score and are listed in
+    `failed`, the rest are still saved.
+
+    Args:
+        assignment_id: The assignment to regrade
+        workers: How many processes grade at once (GRADING_REGRADE_WORKERS by
+            default). 0 grades everything in this process.
+        batch_size: How many scores are written per transaction
+            (GRADING_REGRADE_BATCH_SIZE by default)
+        progress: Called with the Regrade after every graded submission
+        regrade: The Regrade to report progress on, if it is already registered
+
+    Returns:
+        The finished Regrade
+
+    Raises:
+        ValueError if there is no such assignment
+        TestFileMissingException if the assignment has no test file to grade with
+    """
+    from pycs.controllers import assignment as ass_controller
+
+    config = current_app.config
+    workers = config["GRADING_REGRADE_WORKERS"] if workers is None else workers
+    batch_size = batch_size or config["GRADING_REGRADE_BATCH_SIZE"]
+
+    if regrade is None:
+        regrade = Regrade(assignment_id)
+        with _regrades_lock:
+            _regrades[assignment_id] = regrade
+
+    try:
+        assignment = ass_controller.get_assignment_by_id(assignment_id)
+        if assignment is None:
+            raise ValueError(f"No assignment with id {assignment_id}")
+        students = {user.id: user.student_number for user in assignment.classroom.users}
+        submissions = find_submissions(assignment)
+        regrade.total = len(submissions)
+        if submissions:
+            check_test_file(assignment, submissions[0][1])
+
+        batch: list[tuple] = []
+
+        def record(user_id: int, *graded):
+            batch.append((user_id, *graded))
+            if len(batch) >= batch_size:
+                ass_controller.save_scores(assignment, batch)
+                batch.clear()
+            regrade.done += 1
+            if progress is not None:
+                progress(regrade)
+
+        def failed(user_id: int, error: Exception):
+            regrade.failed.append((students[user_id], str(error) or repr(error)))
+            regrade.done += 1
+            if progress is not None:
+                progress(regrade)
+
+        grade_all(
+            assignment.class_id,
+            submissions,
+            workers,
+            record,
+            failed,
+            shards=assignment.test_shards,
+        )
+
+        if batch:
+            ass_controller.save_scores(assignment, batch)
+        regrade.status = "done"
+    except Exception as e:
+        regrade.status = "failed"
+        regrade.error = str(e)
+        raise
+    finally:
+        regrade.elapsed = time.monotonic() - regrade.started_at
+    return regrade
+
+
+def start_regrade(assignment_id: int) -> Regrade | None:
+    """Regrade an assignment in a background thread (inline if GRADING_WORKERS is 0)
+
+    Returns:
+        The regrade already running for this assignment, if there is one, so the
+        same assignment is never regraded twice at once
+    """
+    # Checked and claimed at once, so two clicks can't both start one
+    with _regrades_lock:
+        running = _regrades.get(assignment_id)
+        if running is not None and running.status == "running":
+            return running
+        regrade = _regrades[assignment_id] = Regrade(assignment_id)
+
+    app = current_app._get_current_object()
+
+    def run():
+        with app.app_context():
+            try:
+                regrade_assignment(assignment_id, regrade=regrade)
+            except Exception:
+                app.logger.exception("Regrading assignment %s failed", assignment_id)
+
+    if app.config["GRADING_WORKERS"] == 0:
+        run()
+    else:
+        threading.Thread(target=run, name=f"regrade-{assignment_id}", daemon=True).start()
+    return None
@@ -2,16 +2,27 @@ from datetime import datetime
 from http import HTTPStatus
 import os
 from pathlib import Path
-
-from flask import Blueprint, current_app, redirect, render_template, request, url_for
+import queue
+
+from flask import (
+    Blueprint,
+    Response,
+    current_app,
+    redirect,
+    render_template,
+    request,
+    url_for,
+)
 from flask_login import current_user
 import markdown
 from werkzeug.exceptions import abort
 from werkzeug.utils import secure_filename
 
 from pycs.controllers import assignment as ass_controller
+from pycs.events import DONE, GRADING, QUEUED, format_event
+from pycs.exc import GradingBacklogFullException
+from pycs.extensions import grading_queue
 from pycs.forms import UploadCodeForm
-from pycs.grader import GradingStrategy, ICS3UGrader, ICS4UGrader
 
 from . import login_required
 
@@ -82,6 +93,7 @@ def student_assignment(class_id: int, a_id: int):
         abort(HTTPStatus.NOT_FOUND)
 
     form = None
+    retry_after = None
     if assignment.submission_required:
         form = UploadCodeForm()
 
@@ -101,30 +113,32 @@ def student_assignment(class_id: int, a_id: int):
                     f"{filename}",
                 )
 
-                # Save the code in the upload path
-                uploaded_file.save(upload_path)
-
-                # Score the user's submission
-                grader: GradingStrategy = (
-                    ICS3UGrader(Path(upload_path))
-                    if class_id == 1
-                    else ICS4UGrader(Path(upload_path))
+                # Every version goes into the student's history, the latest
+                # one is also the file in the upload path that gets graded
+                code = uploaded_file.read()
+                ass_controller.save_submission(
+                    current_user.id, assignment.id, filename, code
                 )
+                Path(upload_path).write_bytes(code)
+
+                # Hand the submission to the grading workers
                 try:
-                    score, comments = grader.grade_student()
-                except FileNotFoundError:
-                    score, comments = (
-                        0,
-                        f"Tell Mr. Habib  that he forgot to upload the test file to assignment: {assignment.name}",
+                    grading_queue.submit(
+                        current_user.id,
+                        assignment.id,
+                        class_id,
+                        Path(upload_path),
+                        assignment.due_date,
+                    )
+                except GradingBacklogFullException as e:
+                    # The file is saved, it just can't be graded right now
+                    retry_after = e.retry_after
+                    form.code.errors.append(
+                        "Your file was saved, but the grader is swamped right now. "
+                        f"Submit it again in about {max(1, retry_after // 60)} minute(s) to get it graded."
                     )
-
-                # Has the user already submitted? If so, we are just updating the score
-                if user_assignment is not None:
-                    ass_controller.update_ass_score(user_assignment, score, comments)
                 else:
-                    ass_controller.score_ass(current_user, assignment, score, comments)
-
-                return redirect(request.url)
+                    return redirect(request.url)
             else:
                 form.code.errors.append(
                     f"Uploaded file must be named {assignment.required_filename}. Yours is {filename}"
@@ -133,10 +147,53 @@ def student_assignment(class_id: int, a_id: int):
     instructions = markdown.markdown(
         assignment.instructions, extensions=["fenced_code", "tables", "attr_list"]
     )
-    return render_template(
+    page = render_template(
         "view_assignment.html",
         assignment=assignment,
         instructions=instructions,
         data=user_assignment,
         form=form,
+        grading_job=grading_queue.status(current_user.id, assignment.id),
+    )
+    if retry_after is not None:
+        return page, HTTPStatus.SERVICE_UNAVAILABLE, {"Retry-After": str(retry_after)}
+    return page
+
+
+@bp.get("/app/<int:class_id>/assignment/<int:a_id>/progress")
+@login_required
+def grading_progress(class_id: int, a_id: int):
+    """Server-Sent Events following the grading of the student's latest upload,
+    ending with a `done` event"""
+    user_id = current_user.id
+    recheck = current_app.config["GRADING_EVENTS_RECHECK_SECONDS"]
+
+    def stream():
+        with grading_queue.events.subscribe(user_id, a_id) as events:
+            # Subscribed before looking, so nothing that happens after is missed
+            job = grading_queue.status(user_id, a_id)
+            if job is None:
+                yield format_event({"event": DONE})
+                return
+            yield format_event({"event": QUEUED if job.status == "queued" else GRADING})
+
+            while True:
+                try:
+                    message = events.get(timeout=recheck)
+                except queue.Empty:
+                    # It may have been graded by a worker on another machine
+                    if grading_queue.status(user_id, a_id) is None:
+                        yield format_event({"event": DONE})
+                        return
+                    # Also keeps proxies from closing a quiet connection
+                    yield ": still grading\n\n"
+                    continue
+                yield format_event(message)
+                if message["event"] == DONE:
+                    return
+
+    return Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -1,8 +1,10 @@
 import csv
 from datetime import datetime
+from http import HTTPStatus
 import io
 import os
 from pathlib import Path
+import tempfile
 
 from flask import (
     Blueprint,
@@ -14,15 +16,28 @@ from flask import (
     url_for,
 )
 import markdown
+from werkzeug.exceptions import abort
 from werkzeug.utils import secure_filename
 
+from pycs.bulk import get_bulk_grade, start_bulk_grade
 from pycs.controllers import user as user_controller
 from pycs.controllers import assignment as ass_controller
 from pycs.controllers import classroom as class_controller
 from pycs.controllers import commit_change
-from pycs.forms import AssignmentForm, ClassroomForm, UploadMarksForm
+from pycs.exc import GradingBacklogFullException
+from pycs.extensions import grading_queue
+from pycs.forms import (
+    AssignmentForm,
+    BulkGradeForm,
+    ClassroomForm,
+    RegradeForm,
+    RegradeSubmissionForm,
+    UploadMarksForm,
+)
+from pycs.grader import build_test_artifacts
 from pycs.models.assignment import Assignment
 from pycs.models.classroom import Classroom
+from pycs.regrade import get_regrade, start_regrade
 
 from . import teacher_login_required
 
@@ -32,7 +47,7 @@ bp = Blueprint("teacher", __name__)
 @bp.get("/")
 @teacher_login_required
 def index():
-    return render_template("teacher/home.html")
+    return render_template("teacher/home.html", grading_queue=grading_queue)
 
 
 ###############################################################################
@@ -94,9 +109,75 @@ def view_student_assignment(student_number: int, class_id: int, a_id: int):
         data=user_assignment,
         user=user,
         form=None,
+        submissions=list(ass_controller.get_submissions(user.id, a_id)),
+        regrade_form=RegradeSubmissionForm(),
+    )
+
+
+@bp.get("/submissions/<int:submission_id>")
+@teacher_login_required
+def download_submission(submission_id: int):
+    submission = ass_controller.get_submission(submission_id)
+    if submission is None:
+        abort(HTTPStatus.NOT_FOUND)
+    try:
+        code = ass_controller.read_submission(submission)
+    except FileNotFoundError:
+        abort(HTTPStatus.NOT_FOUND)
+    return send_file(
+        io.BytesIO(code),
+        mimetype="text/plain",
+        as_attachment=True,
+        download_name=submission.filename,
     )
 
 
+@bp.post("/submissions/<int:submission_id>/regrade")
+@teacher_login_required
+def regrade_submission(submission_id: int):
+    """Put an earlier version back as the student's current file and grade it"""
+    submission = ass_controller.get_submission(submission_id)
+    if submission is None:
+        abort(HTTPStatus.NOT_FOUND)
+    user, assignment = submission.user, submission.assignment
+
+    form = RegradeSubmissionForm()
+    if form.validate_on_submit():
+        code_path = (
+            Path(current_app.config["UPLOAD_FOLDER"])
+            / f"{user.student_number}"
+            / submission.filename
+        )
+        try:
+            code = ass_controller.read_submission(submission)
+        except FileNotFoundError:
+            abort(HTTPStatus.NOT_FOUND)
+        code_path.parent.mkdir(parents=True, exist_ok=True)
+        code_path.write_bytes(code)
+        try:
+            grading_queue.submit(
+                user.id, assignment.id, assignment.class_id, code_path
+            )
+        except GradingBacklogFullException as e:
+            flash(f"Restored, but the grader is busy. Try again in {e.retry_after}s")
+
+    return redirect(
+        url_for(
+            ".view_student_assignment",
+            student_number=user.student_number,
+            class_id=assignment.class_id,
+            a_id=assignment.id,
+        )
+    )
+
+
+@bp.get("/timings")
+@teacher_login_required
+def view_timings():
+    percentiles = ass_controller.get_stage_percentiles()
+    return render_template("teacher/view_timings.html", percentiles=percentiles)
+
+
 ###############################################################################
 ####################      ASSIGNMENTS DASHBORD             ####################
 ###############################################################################
@@ -144,7 +225,7 @@ def view_edit_assignment(a_id: int | None = None):
                 upload_path = os.path.join(pytest_upload_dir, filename)
 
                 try:
-                    uploaded_file.save(pytest_upload_dir)
+                    uploaded_file.save(upload_path)
                 except OSError:
                     upload_error = f"Could not upload file {filename}: OSError"
             elif ext == ".java":
@@ -163,11 +244,63 @@ def view_edit_assignment(a_id: int | None = None):
             else:
                 upload_error = f"Could not upload file, not .py or .java"
 
+            if upload_error is None:
+                upload_error = _build_test_artifacts(upload_path)
             if upload_error is not None:
                 flash(upload_error)
         return redirect(url_for(".view_assignments"))
 
-    return render_template("teacher/assignment_form.html", form=form)
+    return render_template(
+        "teacher/assignment_form.html",
+        form=form,
+        regrade_form=RegradeForm() if a_id is not None else None,
+        regrade=get_regrade(a_id) if a_id is not None else None,
+        bulk_form=BulkGradeForm() if a_id is not None else None,
+        bulk=get_bulk_grade(a_id) if a_id is not None else None,
+    )
+
+
+def _build_test_artifacts(upload_path: str) -> str | None:
+    """Prebuild a newly uploaded test file for the graders
+
+    Returns:
+        What went wrong, if the test file is broken
+    """
+    try:
+        build_test_artifacts(Path(upload_path))
+    except SyntaxError as e:
+        return f"Uploaded, but the test file does not run: {e}"
+    except OSError:
+        # Graders fall back to the raw test file
+        current_app.logger.exception("Could not build artifacts for %s", upload_path)
+    return None
+
+
+@bp.post("/assignments/<int:a_id>/regrade")
+@teacher_login_required
+def regrade_assignment(a_id: int):
+    form = RegradeForm()
+    if form.validate_on_submit():
+        if start_regrade(a_id) is not None:
+            flash("This assignment is already being regraded")
+    return redirect(url_for(".view_edit_assignment", a_id=a_id))
+
+
+@bp.post("/assignments/<int:a_id>/bulk")
+@teacher_login_required
+def bulk_grade_assignment(a_id: int):
+    form = BulkGradeForm()
+    if form.validate_on_submit():
+        # Kept on disk so the zip is read one submission at a time
+        fd, zip_path = tempfile.mkstemp(prefix="pycs-bulk-", suffix=".zip")
+        with os.fdopen(fd, "wb") as f_out:
+            form.submissions.data.save(f_out)
+        if start_bulk_grade(a_id, Path(zip_path)) is not None:
+            flash("Submissions for this assignment are already being graded")
+    else:
+        for error in form.submissions.errors:
+            flash(error)
+    return redirect(url_for(".view_edit_assignment", a_id=a_id))
 
 
 ###############################################################################
@@ -206,6 +339,20 @@ def view_edit_classes(class_id: int | None = None):
     return render_template("teacher/class_form.html", form=form)
 
 
+@bp.get("/classes/<int:class_id>/tests")
+@teacher_login_required
+def view_test_pass_rates(class_id: int):
+    classroom = class_controller.get_classroom_by_id(class_id)
+    if classroom is None:
+        abort(HTTPStatus.NOT_FOUND)
+    pass_rates = ass_controller.get_test_pass_rates(class_id)
+    return render_template(
+        "teacher/view_test_pass_rates.html",
+        classroom=classroom,
+        pass_rates=pass_rates,
+    )
+
+
 ###############################################################################
 ####################        Mark Import / Export           ####################
 ###############################################################################
@@ -1,42 +1,89 @@
 import pytest
 from pycs import create_app
-from pycs.database import init_db, clear_db, db_session
-from pycs.models import User, Assignment
+from pycs.extensions import db, grading_queue, init_db
+from pycs.models import Assignment, Classroom, User, Weighting
 from datetime import datetime
+from werkzeug.security import generate_password_hash
 
 
 @pytest.fixture
-def app():
-    app = create_app({"TESTING": True, "WTF_CSRF_ENABLED": False})
-    init_db()
-    new_user = User(
-        student_number="999999999", first_name="Tester", password="thepassword"
-    )
-    new_assignment = Assignment(
-        name="hello ass",
-        required_filename="hello.py",
-        due_date=datetime.today(),
-        visible=True,
-    )
-    invisible_assignment = Assignment(
-        name="invis",
-        required_filename="invis.py",
-        due_date=datetime.today(),
-        visible=False,
-    )
-    second_assignment = Assignment(
-        name="other one",
-        required_filename="other.py",
-        due_date=datetime.today(),
-        visible=True,
-    )
+def database_uri(tmp_path):
+    # A file rather than memory, so grading worker threads and processes get
+    # connections of their own
+    return f"sqlite:///{tmp_path / 'pycs.db'}"
 
-    db_session.add_all(
-        [new_user, new_assignment, invisible_assignment, second_assignment]
+
+@pytest.fixture
+def app(tmp_path, database_uri):
+    app = create_app(
+        {
+            "TESTING": True,
+            "WTF_CSRF_ENABLED": False,
+            "SQLALCHEMY_DATABASE_URI": database_uri,
+            "UPLOAD_FOLDER": str(tmp_path / "code"),
+            "EXPORTED_FILES": str(tmp_path / "exports"),
+            "GRADING_WORKERS": 0,
+            "GRADING_PYTEST_ZYGOTE": False,
+            "GRADING_CACHE_PATH": None,
+            "GRADING_SANDBOX_POOL": 0,
+        }
     )
-    db_session.commit()
+    with app.app_context():
+        init_db("teacherpass")
+        classroom = Classroom(
+            course_code="ICS3U", year=2023, sem=2, join_code="ABCDE", teacher_id=1
+        )
+        new_user = User(
+            student_number="999999999",
+            first_name="Tester",
+            password_hash=generate_password_hash("thepassword"),
+            role="Student",
+        )
+        new_user.classes.append(classroom)
+        weighting = Weighting(name="Assignments", weight=1)
+        new_assignment = Assignment(
+            name="hello ass",
+            instructions="Say hello",
+            submission_required=True,
+            required_filename="hello.py",
+            due_date=datetime.today(),
+            visible=True,
+            unit_name="Unit 1",
+            weighting=weighting,
+            classroom=classroom,
+        )
+        invisible_assignment = Assignment(
+            name="invis",
+            instructions="Hidden",
+            submission_required=True,
+            required_filename="invis.py",
+            due_date=datetime.today(),
+            visible=False,
+            unit_name="Unit 1",
+            weighting=weighting,
+            classroom=classroom,
+        )
+        second_assignment = Assignment(
+            name="other one",
+            instructions="Another one",
+            submission_required=True,
+            required_filename="other.py",
+            due_date=datetime.today(),
+            visible=True,
+            unit_name="Unit 1",
+            weighting=weighting,
+            classroom=classroom,
+        )
+
+        db.session.add_all(
+            [new_user, new_assignment, invisible_assignment, second_assignment]
+        )
+        db.session.commit()
     yield app
-    clear_db()
+    # Worker threads outlive the app otherwise, and would grade the next test's jobs
+    grading_queue.stop_workers()
+    with app.app_context():
+        db.drop_all()
 
 
 @pytest.fixture
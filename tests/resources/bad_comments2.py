@@ -1,7 +1,7 @@
-"""
+'''
 author: mr. habib
 date: 01/01/2023
 Good header comments, but wrong quotes
-"""
+'''
 
 print("Hello level 2")
@@ -0,0 +1,195 @@
+import io
+from pathlib import Path
+
+from pycs.grader import ICS3UGrader, build_test_artifacts, find_test_artifacts
+from pycs.grader.artifacts import java_test_ids, python_test_ids
+
+STUDENT_CODE = '''def hello():
+    return "hello"
+'''
+
+TESTS = '''from hello import hello
+
+
+def test_hello():
+    assert hello() == "hello"
+
+
+class TestMore:
+    def test_goodbye(self):
+        assert hello() == "goodbye"
+'''
+
+
+def _setup(tmp_path: Path) -> Path:
+    (tmp_path / "999999999").mkdir()
+    (tmp_path / "tests").mkdir()
+    code_path = tmp_path / "999999999" / "hello.py"
+    code_path.write_text(STUDENT_CODE)
+    (tmp_path / "tests" / "test_hello.py").write_text(TESTS)
+    return code_path
+
+
+def test_build_and_invalidate(tmp_path):
+    _setup(tmp_path)
+    test_path = tmp_path / "tests" / "test_hello.py"
+    assert find_test_artifacts(test_path) is None
+
+    artifacts = build_test_artifacts(test_path)
+    assert artifacts.test_ids == [
+        "test_hello.test_hello",
+        "test_hello.TestMore.test_goodbye",
+    ]
+    assert artifacts.test_file.read_text() == TESTS
+    assert list((artifacts.path / "__pycache__").glob("test_hello.*.pyc"))
+    assert find_test_artifacts(test_path) == artifacts
+
+    # A new upload doesn't match the old artifacts, and rebuilding removes them
+    test_path.write_text(TESTS + "\n\ndef test_extra():\n    pass\n")
+    assert find_test_artifacts(test_path) is None
+    rebuilt = build_test_artifacts(test_path)
+    assert rebuilt.test_ids[-1] == "test_hello.test_extra"
+    assert not artifacts.path.exists()
+
+
+def test_grader_uses_prebuilt_test(tmp_path):
+    code_path = _setup(tmp_path)
+    build_test_artifacts(tmp_path / "tests" / "test_hello.py")
+
+    grader = ICS3UGrader(code_path)
+    grader.grade_unit_test()
+    assert {r.full_name: r.outcome for r in grader.test_results} == {
+        "test_hello.test_hello": "passed",
+        "test_hello.TestMore.test_goodbye": "failed",
+    }
+
+
+def test_grader_runs_shards_side_by_side(tmp_path):
+    """Each shard runs its share of the tests, the results are merged as one run"""
+    code_path = _setup(tmp_path)
+    for prebuilt in (False, True):
+        if prebuilt:
+            build_test_artifacts(tmp_path / "tests" / "test_hello.py")
+        grader = ICS3UGrader(code_path, shards=4)
+        score, output = grader.grade_unit_test()
+        assert score == 2, output
+        assert {r.full_name: r.outcome for r in grader.test_results} == {
+            "test_hello.test_hello": "passed",
+            "test_hello.TestMore.test_goodbye": "failed",
+        }
+        # Only as many shards as there are tests
+        assert output.count(" Shard ") == 2
+        assert " Shard 2 of 2 " in output
+
+
+def test_grader_runs_unlisted_tests_in_one_piece(tmp_path):
+    """Tests that can't be listed for sure all still run, unsharded"""
+    code_path = _setup(tmp_path)
+    (tmp_path / "tests" / "test_hello.py").write_text(
+        TESTS + "\n    class TestNested:\n        def test_nested(self):\n            pass\n"
+    )
+    grader = ICS3UGrader(code_path, shards=4)
+    score, output = grader.grade_unit_test()
+    assert " Shard " not in output
+    assert len(grader.test_results) == 3
+    assert score == 2.7
+
+
+def test_crashed_shard_reruns_in_one_piece(tmp_path):
+    """A shard that dies partway may have lost tests, the whole file runs again"""
+    code_path = _setup(tmp_path)
+    (tmp_path / "tests" / "test_hello.py").write_text(
+        TESTS + "\n\ndef test_exit():\n    import os\n    os._exit(3)\n"
+    )
+    grader = ICS3UGrader(code_path, shards=3)
+    _, output = grader.grade_unit_test()
+    assert " Shard " not in output
+
+
+def test_test_ids():
+    assert python_test_ids("def helper(): pass\ndef test_a(): pass\n", "test_x") == [
+        "test_x.test_a"
+    ]
+    source = """
+    public class TestHello {
+        @Test
+        public void testHello() {}
+
+        @Test @DisplayName("bye")
+        void testBye() {}
+
+        public void helper() {}
+    }
+    """
+    assert java_test_ids(source, "TestHello") == [
+        "TestHello.testHello()",
+        "TestHello.testBye()",
+    ]
+
+
+def test_test_ids_are_none_unless_complete():
+    """Files whose tests can't all be listed without running them are never split"""
+    main = "def test_a(): pass\n\nif __name__ == '__main__':\n    test_a()\n"
+    assert python_test_ids(main, "test_x") == ["test_x.test_a"]
+    for source in (
+        "class TestB:\n    class TestNested:\n        def test_d(self): pass\n",
+        "class TestB(Base):\n    def test_e(self): pass\n",
+        "from other import test_f\n",
+        "test_g = make_test()\n",
+        "def test_h(): pass\ndef test_h(): pass\n",
+        "for name in names:\n    globals()[name] = make_test()\n",
+    ):
+        assert python_test_ids(source, "test_x") is None, source
+
+    for annotated in (
+        "@ParameterizedTest @ValueSource(ints = {1, 2}) void testTwice(int x) {}",
+        "@RepeatedTest(3) void testThrice() {}",
+        "@Nested class Inner { @Test void testInner() {} }",
+        "@TestFactory Stream<DynamicTest> testMany() { return null; }",
+    ):
+        source = (
+            f"public class TestHello {{\n    @Test void testHello() {{}}\n    {annotated}\n}}\n"
+        )
+        assert java_test_ids(source, "TestHello") is None, annotated
+    # Only code counts, not strings or comments
+    source = (
+        "public class TestHello {\n"
+        "    // @RepeatedTest(3) is for later\n"
+        '    @Test void testHello() { String s = "@Nested class"; }\n'
+        "}\n"
+    )
+    assert java_test_ids(source, "TestHello") == ["TestHello.testHello()"]
+
+
+def test_artifacts_of_an_older_version_are_rebuilt(tmp_path):
+    _setup(tmp_path)
+    test_path = tmp_path / "tests" / "test_hello.py"
+    artifacts = build_test_artifacts(test_path)
+    manifest = artifacts.path / "manifest.json"
+    manifest.write_text(manifest.read_text().replace('"version": 2', '"version": 1'))
+    assert find_test_artifacts(test_path) is None
+    assert build_test_artifacts(test_path) == artifacts
+    assert find_test_artifacts(test_path) == artifacts
+
+
+def test_upload_builds_artifacts(app, client):
+    client.post("/login", data={"student_number": "001310455", "password": "teacherpass"})
+    response = client.post(
+        "/teacher/assignments/1",
+        data={
+            "name": "hello ass",
+            "instructions": "Say hello",
+            "unit_name": "Unit 1",
+            "required_filename": "hello.py",
+            "total_points": 4,
+            "due_date": "2024-01-01",
+            "weight": 1,
+            "class_id": 1,
+            "unit_test_upload": (io.BytesIO(TESTS.encode()), "test_hello.py"),
+        },
+    )
+    assert response.status_code == 302
+
+    test_path = Path(app.config["UPLOAD_FOLDER"]) / "tests" / "test_hello.py"
+    assert test_path.read_text() == TESTS
+    assert find_test_artifacts(test_path) is not None
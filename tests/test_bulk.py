@@ -0,0 +1,155 @@
+import io
+from pathlib import Path
+import threading
+import zipfile
+
+from pycs.bulk import get_bulk_grade, start_bulk_grade
+from pycs.controllers import assignment as ass_controller
+
+STUDENT_CODE = b'''"""
+author: Tester
+date: 01/01/2023
+Says hello
+"""
+
+
+def hello():
+    return "hello"
+'''
+
+TEST_CODE = '''from hello import hello
+
+
+def test_hello():
+    assert hello() == "hello"
+'''
+
+
+def _zip(entries: dict[str, bytes]) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def _add_test_file(app):
+    tests = Path(app.config["UPLOAD_FOLDER"]) / "tests"
+    tests.mkdir(parents=True, exist_ok=True)
+    (tests / "test_hello.py").write_text(TEST_CODE)
+
+
+SUBMISSIONS = {
+    "999999999_hello.py": STUDENT_CODE,
+    "123456789.py": STUDENT_CODE,
+    "999999999_notes.txt": b"I did my best",
+    "__MACOSX/._999999999_hello.py": b"",
+}
+
+
+def test_grade_bulk_command(app, runner, tmp_path):
+    _add_test_file(app)
+    source = tmp_path / "handed_in.zip"
+    source.write_bytes(_zip(SUBMISSIONS))
+
+    result = runner.invoke(args=["grade-bulk", "1", str(source), "--workers", "0"])
+
+    assert result.exit_code == 0, result.output
+    assert "Skipped 123456789.py: no student in the class" in result.output
+    assert "Skipped 999999999_notes.txt: not a .py file" in result.output
+    assert "__MACOSX" not in result.output
+    assert "Graded 1 submissions" in result.output
+    upload = Path(app.config["UPLOAD_FOLDER"]) / "999999999" / "hello.py"
+    assert upload.read_bytes() == STUDENT_CODE
+    with app.app_context():
+        assert "1 passed" in ass_controller.get_user_assignment(2, 1).comments
+        assert len(list(ass_controller.get_submissions(2, 1))) == 1
+
+
+def test_grade_bulk_directory_in_process_pool(app, runner, tmp_path):
+    _add_test_file(app)
+    source = tmp_path / "handed_in"
+    (source / "999999999").mkdir(parents=True)
+    (source / "999999999" / "hello.py").write_bytes(STUDENT_CODE)
+
+    result = runner.invoke(args=["grade-bulk", "1", str(source), "--workers", "2"])
+
+    assert result.exit_code == 0, result.output
+    with app.app_context():
+        assert "1 passed" in ass_controller.get_user_assignment(2, 1).comments
+
+
+def test_grade_bulk_without_test_file(app, runner, tmp_path):
+    source = tmp_path / "handed_in.zip"
+    source.write_bytes(_zip(SUBMISSIONS))
+
+    result = runner.invoke(args=["grade-bulk", "1", str(source), "--workers", "0"])
+
+    assert result.exit_code != 0
+    assert "Upload a test file" in result.output
+    with app.app_context():
+        assert ass_controller.get_user_assignment(2, 1) is None
+
+
+def test_bulk_grade_form(app, client, auth):
+    _add_test_file(app)
+    app.config["GRADING_REGRADE_WORKERS"] = 0
+    auth.login("001310455", "teacherpass")
+
+    response = client.post(
+        "/teacher/assignments/1/bulk",
+        data={"submissions": (io.BytesIO(_zip(SUBMISSIONS)), "handed_in.zip")},
+        content_type="multipart/form-data",
+        follow_redirects=True,
+    )
+
+    assert b"1 submissions graded" in response.data
+    assert b"123456789.py: no student in the class" in response.data
+    with app.app_context():
+        assert "1 passed" in ass_controller.get_user_assignment(2, 1).comments
+
+
+def test_start_bulk_grade_starts_one_at_a_time(app, tmp_path, monkeypatch):
+    """A second upload while a bulk grade is starting gets the running one"""
+    app.config["GRADING_WORKERS"] = 1
+    started = []
+    release = threading.Event()
+
+    def slow_bulk_grade(assignment_id, source, *, bulk):
+        started.append(bulk)
+        release.wait(5)
+        bulk.status = "done"
+
+    monkeypatch.setattr("pycs.bulk._bulk_grades", {})
+    monkeypatch.setattr("pycs.bulk.grade_bulk", slow_bulk_grade)
+    first, second = tmp_path / "first.zip", tmp_path / "second.zip"
+    first.write_bytes(_zip(SUBMISSIONS))
+    second.write_bytes(_zip(SUBMISSIONS))
+    with app.app_context():
+        assert start_bulk_grade(1, first) is None
+        running = start_bulk_grade(1, second)
+    release.set()
+    assert running is get_bulk_grade(1)
+    assert len(started) <= 1 and all(bulk is running for bulk in started)
+    assert not second.exists()
+
+
+def test_student_number_anywhere_in_the_name(app, runner, tmp_path):
+    _add_test_file(app)
+    source = tmp_path / "handed_in.zip"
+    source.write_bytes(
+        _zip(
+            {
+                "2024/Assignment1_999999999.py": STUDENT_CODE,
+                "2024/Assignment1_123456789.py": STUDENT_CODE,
+            }
+        )
+    )
+
+    result = runner.invoke(args=["grade-bulk", "1", str(source), "--workers", "0"])
+
+    assert result.exit_code == 0, result.output
+    assert "Graded 1 submissions" in result.output
+    assert "Assignment1_123456789.py: no student in the class" in result.output
+    with app.app_context():
+        assert "1 passed" in ass_controller.get_user_assignment(2, 1).comments
@@ -0,0 +1,153 @@
+from pathlib import Path
+
+import pytest
+
+from pycs.grader import GradingStrategy, ICS3UGrader, ResultCache
+from pycs.grader.reports import FAILED, PASSED, TestCaseResult
+
+
+class CountingGrader(GradingStrategy):
+    calls = 0
+
+    @property
+    def abs_test_path(self) -> Path:
+        return self.abs_code_path.parent / "test_hello.py"
+
+    def grade_header_comments(self):
+        return 4, ""
+
+    def grade_var_names(self):
+        return 4, ""
+
+    def grade_ipo_comments(self):
+        return 4, ""
+
+    def grade_unit_test(self):
+        return 4, ""
+
+    def grade_student(self):
+        CountingGrader.calls += 1
+        return 4, "graded " + self.abs_code_path.read_text()
+
+
+@pytest.fixture
+def submission(tmp_path):
+    CountingGrader.calls = 0
+    (tmp_path / "test_hello.py").write_text("def test_it(): pass")
+    code_path = tmp_path / "hello.py"
+    code_path.write_text("print('hi')")
+    return code_path
+
+
+def test_cache_hit_skips_grading(tmp_path, submission):
+    """The same submission with the same test file is only graded once"""
+    cache = ResultCache(tmp_path / "cache.db")
+    first = cache.grade(CountingGrader(submission))
+    second = cache.grade(CountingGrader(submission))
+    assert first == second
+    assert CountingGrader.calls == 1
+    assert cache.stats() == {"hits": 1, "misses": 1, "unit_test_hits": 0}
+
+    # The cache survives a restart
+    assert ResultCache(tmp_path / "cache.db").grade(CountingGrader(submission)) == first
+    assert CountingGrader.calls == 1
+
+
+def test_cache_key_changes_with_test_file(tmp_path, submission):
+    """A new test file means the submission has to be graded again"""
+    cache = ResultCache(tmp_path / "cache.db")
+    cache.grade(CountingGrader(submission))
+    (tmp_path / "test_hello.py").write_text("def test_other(): pass")
+    cache.grade(CountingGrader(submission))
+    assert CountingGrader.calls == 2
+
+
+def test_cache_skips_uncacheable_results(tmp_path, submission):
+    """Results from runs that timed out are graded again next time"""
+
+    class TimeoutGrader(CountingGrader):
+        def grade_student(self):
+            self.cacheable = False
+            return super().grade_student()
+
+    cache = ResultCache(tmp_path / "cache.db")
+    cache.grade(TimeoutGrader(submission))
+    cache.grade(TimeoutGrader(submission))
+    assert CountingGrader.calls == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path, submission):
+    """Old results are dropped once the cache is over its size limit"""
+    cache = ResultCache(tmp_path / "cache.db", max_bytes=150)
+    cache.put("old", 1, "x" * 60)
+    cache.put("used", 2, "x" * 60)
+    cache.get("used")
+    cache.put("new", 3, "x" * 60)
+    assert cache.get("old") is None
+    assert cache.get("used") == (2, "x" * 60, [])
+    assert cache.get("new") == (3, "x" * 60, [])
+
+
+def test_cache_hit_restores_test_results(tmp_path, submission):
+    """A cached grade still knows which tests passed"""
+    results = [
+        TestCaseResult("test_a", "test_hello", PASSED, 0.5),
+        TestCaseResult("test_b", "test_hello", FAILED, 0.25, "assert 1 == 2"),
+    ]
+
+    class ReportingGrader(CountingGrader):
+        def grade_student(self):
+            self.test_results = results
+            return super().grade_student()
+
+    cache = ResultCache(tmp_path / "cache.db")
+    cache.grade(ReportingGrader(submission))
+    grader = ReportingGrader(submission)
+    cache.grade(grader)
+    assert CountingGrader.calls == 1
+    assert grader.test_results == results
+
+
+class CountingPythonGrader(ICS3UGrader):
+    unit_test_runs = 0
+
+    @property
+    def abs_test_path(self) -> Path:
+        return self.abs_code_path.parent / "test_hello.py"
+
+    def grade_unit_test(self):
+        CountingPythonGrader.unit_test_runs += 1
+        return super().grade_unit_test()
+
+
+def test_same_fingerprint_reuses_unit_tests(tmp_path):
+    """A resubmission that only changed comments reruns the style checks, not the tests"""
+    CountingPythonGrader.unit_test_runs = 0
+    (tmp_path / "test_hello.py").write_text(
+        "from hello import add\n\ndef test_add():\n    assert add(1, 2) == 3\n"
+    )
+    code_path = tmp_path / "hello.py"
+    code_path.write_text("def add(a, b):\n    return a + b\n")
+    cache = ResultCache(tmp_path / "cache.db")
+    first_score, first_comments = cache.grade(CountingPythonGrader(code_path))
+    assert "1 passed" in first_comments
+
+    code_path.write_text(
+        '"""\nauthor: Ann\ndate: 01/02/2024\nAdds numbers\n"""\n\n'
+        "def add(a, b):\n    # input\n    # processing\n    # output\n"
+        "    return a + b\n"
+    )
+    grader = CountingPythonGrader(code_path)
+    score, comments = cache.grade(grader)
+    assert CountingPythonGrader.unit_test_runs == 1
+    assert score > first_score
+    assert "Header comments are good" in comments
+    assert "1 passed" in comments
+    assert [result.outcome for result in grader.test_results] == [PASSED]
+    assert cache.stats()["unit_test_hits"] == 1
+
+    # Changing what the code does runs the tests again
+    code_path.write_text("def add(a, b):\n    return a - b\n")
+    _, comments = cache.grade(CountingPythonGrader(code_path))
+    assert CountingPythonGrader.unit_test_runs == 2
+    assert "1 failed" in comments
@@ -0,0 +1,27 @@
+from pycs.grader.capture import HeadTailBuffer
+
+
+def test_short_output_is_kept_whole():
+    buffer = HeadTailBuffer(10)
+    buffer.write(b"abc")
+    buffer.write(b"defg")
+    assert buffer.getvalue() == b"abcdefg"
+    assert HeadTailBuffer(10).getvalue() == b""
+
+
+def test_long_output_keeps_head_and_tail():
+    buffer = HeadTailBuffer(10)
+    for chunk in (b"0123", b"456789abcd", b"efghij"):
+        buffer.write(chunk)
+    assert buffer.getvalue() == b"01234\n\n[... 10 bytes of output cut ...]\n\nfghij"
+    # Memory stays at the limit however much more is written
+    for _ in range(1000):
+        buffer.write(b"x" * 1000)
+    assert len(buffer.head) + len(buffer.tail) == 10
+    assert buffer.dropped == 1_000_010
+
+
+def test_no_limit_keeps_everything():
+    buffer = HeadTailBuffer()
+    buffer.write(b"x" * 100_000)
+    assert buffer.getvalue() == b"x" * 100_000
@@ -0,0 +1,93 @@
+import json
+from pathlib import Path
+import threading
+
+from pycs.events import GradingEvents, STREAM_BUFFER
+from pycs.extensions import grading_queue
+from pycs.grader.trace import Trace
+
+
+class StagedGrader:
+    """Goes through the stages of a python grader without running anything"""
+
+    def __init__(self):
+        self.test_results = []
+        self.usage = None
+        self.trace = Trace()
+
+    def grade_student(self):
+        for stage in ("header", "ipo", "variables", "unit_test", "test_run"):
+            with self.trace.stage(stage):
+                pass
+        return 3.5, "graded"
+
+
+def _events(stream) -> list[dict]:
+    """The messages in a Server-Sent Events stream, skipping keepalives"""
+    return [
+        json.loads(line.removeprefix(b"data: "))
+        for line in stream
+        if line.startswith(b"data: ")
+    ]
+
+
+def test_publish_reaches_only_the_students_subscribers():
+    events = GradingEvents()
+    with events.subscribe(2, 1) as mine, events.subscribe(3, 1) as theirs:
+        events.publish(2, 1, "style")
+        assert mine.get_nowait() == {"event": "style"}
+        assert theirs.empty()
+    # Nobody is listening any more, and nobody is kept around
+    events.publish(2, 1, "done", score=4)
+    assert events._subscribers == {}
+
+
+def test_slow_subscribers_drop_events_instead_of_blocking():
+    events = GradingEvents()
+    with events.subscribe(2, 1) as subscriber:
+        for _ in range(STREAM_BUFFER + 5):
+            events.publish(2, 1, "testing")
+        assert subscriber.qsize() == STREAM_BUFFER
+
+
+def test_listener_publishes_each_progress_event_once():
+    events = GradingEvents()
+    with events.subscribe(2, 1) as subscriber:
+        grader = StagedGrader()
+        grader.trace.listener = events.listener(2, 1)
+        grader.grade_student()
+        published = []
+        while not subscriber.empty():
+            published.append(subscriber.get_nowait()["event"])
+    assert published == ["style", "testing"]
+
+
+def test_progress_stream_ends_right_away_without_a_job(client, auth):
+    auth.login()
+    response = client.get("/app/1/assignment/1/progress")
+    assert response.mimetype == "text/event-stream"
+    assert _events(response.iter_encoded()) == [{"event": "done"}]
+
+
+def test_progress_stream_follows_a_queued_job(app, client, auth, monkeypatch):
+    """The stream starts with the job waiting in line and ends with its score"""
+    app.config["GRADING_QUEUE_ONLY"] = True
+    monkeypatch.setattr("pycs.grader.get_grader", lambda *_, **__: StagedGrader())
+    grading_queue.submit(2, 1, 1, Path("hello.py"))
+
+    auth.login()
+    response = client.get("/app/1/assignment/1/progress", buffered=False)
+    stream = response.iter_encoded()
+    assert json.loads(next(stream).removeprefix(b"data: ")) == {"event": "queued"}
+
+    worker = threading.Thread(target=grading_queue.run_workers, args=(1, True))
+    worker.start()
+    events = _events(stream)
+    worker.join()
+    assert [event["event"] for event in events] == [
+        "grading",
+        "style",
+        "testing",
+        "done",
+    ]
+    assert events[-1]["score"] == 3.5
@@ -1,29 +1,47 @@
 from pathlib import Path
+import subprocess
+import sys
+import threading
 
 import pytest
 
-from pycs.grader import (
-    read_code,
-    _check_header_comments,
-    _check_variable_names,
-    _check_ipo,
-    _grade_pytest,
-)
+from pycs.grader import ICS3UGrader, ICS4UGrader
+from pycs.grader.limits import ResourceLimits, Usage
+from pycs.grader.reports import TestCaseResult
 
 resources = Path(__file__).parent / "resources"
 
 
+def _check_header_comments(lines):
+    return _grader_for(lines).grade_header_comments()
+
+
+def _check_variable_names(lines):
+    return _grader_for(lines).grade_var_names()
+
+
+def _check_ipo(lines):
+    return _grader_for(lines).grade_ipo_comments()
+
+
+def _grader_for(lines):
+    # Skip reading a file, the checks only look at file_contents
+    grader = ICS3UGrader.__new__(ICS3UGrader)
+    grader.file_contents = lines
+    return grader
+
+
 def test__read_file():
     """Read file should return list[str] of each line in the file"""
-    actual = read_code(resources / "lines.txt")
+    actual = ICS3UGrader(resources / "lines.txt").file_contents
     expected = ["1", "2", "3"]
     assert actual == expected
 
 
 def test__read_file_fne():
-    """Files not found should return None"""
-    actual = read_code(resources / "doesnotexist.txt")
-    assert actual is None
+    """Files not found should raise FileNotFoundError"""
+    with pytest.raises(FileNotFoundError):
+        ICS3UGrader(resources / "doesnotexist.txt")
 
 
 def test__check_header_comments_lvl0():
@@ -112,6 +130,14 @@ def test__check_variable_names_lvl4():
     assert "Variable names are good" in comments
 
 
+def test__check_variable_names_one_line_compound_statements():
+    """Assignments after the `:` of a one line `if`/`while` are checked too"""
+    for line in ["if x: BadName = 1", "while c: Other_Bad = 2"]:
+        score, comments = _check_variable_names([line])
+        assert score == 2
+        assert "do not follow class conventions" in comments
+
+
 def test__check_ipo_lvl0():
     """Code with no ipo should return a score of 0"""
     no_ipo = ["print('hello')"]
@@ -146,26 +172,218 @@ def test__check_ipo_lvl4_valid2():
 
 
 @pytest.mark.parametrize(
-    ("pytest_output", "expected_score"),
+    ("outcomes", "expected_score"),
     (
-        ("test1.py::test_1 PASSED [ 5%]\ntest1.py::test_2 PASSED [100%]", 4),
-        ("test1.py::test_1 FAILED [ 50%]\ntest1.py::test_2 PASSED [100%]", 2),
-        ("test1.py::test_1 FAILED [ 50%]\ntest1.py::test_2 FAILED [100%]", 0),
-        (
-            "test1.py::test_1 PASSED [ 33%]\ntest1.py::test_2 FAILED [ 67%]\n\ntest1.py::test_2 PASSED [100%]",
-            2.7,
-        ),
+        (["passed", "passed"], 4),
+        (["failed", "passed"], 2),
+        (["failed", "failed"], 0),
+        (["passed", "failed", "passed"], 2.7),
+        (["passed", "error", "skipped"], 4),
     ),
 )
-def test__grade_pytest(pytest_output, expected_score, monkeypatch):
+def test__grade_pytest(outcomes, expected_score, monkeypatch):
     """Code should run pytest command and grade based off of the number of passes and fails"""
+    results = [
+        TestCaseResult(f"test_{i}", "test1", outcome, 0.0)
+        for i, outcome in enumerate(outcomes)
+    ]
+    monkeypatch.setattr(ICS3UGrader, "_run_pytest", lambda self: ("output", results))
+    grader = ICS3UGrader(resources / "hello.py")
+    actual_score, _ = grader.grade_unit_test()
+    assert actual_score == expected_score
+    assert grader.test_results == results
+
+
+def test__grade_student_checks_style_while_tests_run(monkeypatch):
+    """The style checks don't wait for the tests, and the result is the same either way"""
+    style_checked = threading.Event()
+    results = [TestCaseResult("test_0", "test1", "passed", 0.0)]
+
+    def run_pytest(self):
+        # Only finishes if the style is checked while it waits
+        assert style_checked.wait(5)
+        return "1 passed", results
+
+    def grade_var_names(self):
+        style_checked.set()
+        return original_var_names(self)
+
+    original_var_names = ICS3UGrader.grade_var_names
+    monkeypatch.setattr(ICS3UGrader, "_run_pytest", run_pytest)
+    monkeypatch.setattr(ICS3UGrader, "grade_var_names", grade_var_names)
+    overlapped = ICS3UGrader(resources / "hello.py")
+    score, comments = overlapped.grade_student()
+    assert comments.endswith("1 passed")
+    assert overlapped.test_results == results
+
+    # One after the other, for comparison
+    style_checked.set()
+    sequential = ICS3UGrader(resources / "hello.py")
+    sequential.overlap_style = False
+    assert sequential.grade_student() == (score, comments)
+
+
+def test__grade_student_raises_unit_test_errors():
+    """A missing test file still surfaces from grade_student"""
+    with pytest.raises(FileNotFoundError):
+        ICS3UGrader(resources / "lines.txt").grade_student()
+
+
+def test__grade_pytest_syntax_error_skips_pytest(tmp_path, monkeypatch):
+    """Code that doesn't parse gets python's error without pytest ever starting"""
+    monkeypatch.setattr(ICS3UGrader, "_run_pytest", lambda self: pytest.fail("ran"))
+    code_path = tmp_path / "hello.py"
+    code_path.write_text("def add(a, b)\n    return a + b\n")
+    score, comments = ICS3UGrader(code_path).grade_unit_test()
+    assert score == 1
+    assert "line 1" in comments and "SyntaxError" in comments
+
+
+JUNIT_REPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuite name="JUnit Jupiter" tests="2">
+<testcase name="testHello()" classname="TestHello.java" time="0.01"/>
+<testcase name="testBye()" classname="TestHello.java" time="0.01"><failure message="nope"/></testcase>
+</testsuite>
+"""
+
+
+def test__grade_junit_compiles_once(tmp_path, monkeypatch):
+    """The student's code and the tests are compiled by a single javac run"""
+    (tmp_path / "student").mkdir()
+    (tmp_path / "tests-java").mkdir()
+    code_path = tmp_path / "student" / "Hello.java"
+    code_path.write_text("package school;\npublic class Hello { int packageCount; }\n")
+    (tmp_path / "tests-java" / "TestHello.java").write_text("public class TestHello {}\n")
+
+    commands = []
+
+    def fake_run(args, *, cwd, timeout, limits, trace):
+        commands.append(args)
+        if args[0] == "javac":
+            assert (Path(cwd) / "Hello.java").read_text() == (
+                "               \npublic class Hello { int packageCount; }\n"
+            )
+        else:
+            (Path(cwd) / "reports").mkdir()
+            (Path(cwd) / "reports" / "TEST-junit-jupiter.xml").write_text(JUNIT_REPORT)
+        usage = Usage(cpu_time=0.5, max_rss=100 * 1024 * 1024)
+        return subprocess.CompletedProcess(args, 0, b"junit output", b""), usage
+
+    monkeypatch.setattr(sys.modules["pycs.grader.ICS4UGrader"], "run", fake_run)
+    grader = ICS4UGrader(code_path, limits=ResourceLimits(address_space=256 << 20))
+    score, comments = grader.grade_unit_test()
+    assert [args[0] for args in commands] == ["javac", "java"]
+    assert commands[0][-2:] == ["Hello.java", "TestHello.java"]
+    # The JVM's memory is capped with its heap size instead of an rlimit
+    assert commands[0][1] == "-J-Xmx256m" and commands[1][1] == "-Xmx256m"
+    assert (score, comments) == (2, "junit output")
+    assert grader.usage == Usage(cpu_time=1.0, max_rss=100 * 1024 * 1024)
+
+
+def test__grade_junit_shards_share_one_compile(tmp_path, monkeypatch):
+    """Every shard runs its own tests in a JVM of its own, from one javac run"""
+    (tmp_path / "student").mkdir()
+    (tmp_path / "tests-java").mkdir()
+    code_path = tmp_path / "student" / "Hello.java"
+    code_path.write_text("public class Hello {}\n")
+    (tmp_path / "tests-java" / "TestHello.java").write_text(
+        "public class TestHello {\n"
+        "    @Test void testHello() {}\n"
+        "    @Test void testBye() {}\n"
+        "    @Test void testAgain() {}\n"
+        "}\n"
+    )
 
-    class Fake_shutil:
-        def copy2(*args):
-            pass
+    commands = []
+
+    def fake_run(args, *, cwd, timeout, limits, trace):
+        commands.append(args)
+        if args[0] == "java":
+            reports = Path(cwd) / args[-1].removeprefix("--reports-dir=")
+            reports.mkdir()
+            (reports / "TEST-junit-jupiter.xml").write_text(JUNIT_REPORT)
+        return subprocess.CompletedProcess(args, 0, b"junit output\n", b""), None
+
+    monkeypatch.setattr(sys.modules["pycs.grader.ICS4UGrader"], "run", fake_run)
+    grader = ICS4UGrader(code_path, shards=2)
+    score, comments = grader.grade_unit_test()
+    assert [args[0] for args in commands] == ["javac", "java", "java"]
+    selections = sorted(
+        [arg for arg in args if "#" in arg] for args in commands if args[0] == "java"
+    )
+    assert selections == [
+        ["TestHello#testBye"],
+        ["TestHello#testHello", "TestHello#testAgain"],
+    ]
+    # Both shards' reports are merged into one score
+    assert len(grader.test_results) == 4
+    assert score == 2
+    assert comments.count("junit output") == 2
+
+
+def test__grade_junit_crashed_shard_reruns_in_one_piece(tmp_path, monkeypatch):
+    """A shard whose JVM dies partway doesn't count, the whole class runs again"""
+    (tmp_path / "student").mkdir()
+    (tmp_path / "tests-java").mkdir()
+    code_path = tmp_path / "student" / "Hello.java"
+    code_path.write_text("public class Hello {}\n")
+    (tmp_path / "tests-java" / "TestHello.java").write_text(
+        "public class TestHello {\n"
+        "    @Test void testHello() {}\n"
+        "    @Test void testBye() {}\n"
+        "}\n"
+    )
 
-    monkeypatch.setattr("pycs.grader._run_pytest", lambda x, y: pytest_output)
-    monkeypatch.setattr("pycs.grader.shutil", Fake_shutil)
-    fake_path = Path("/fake/assignment/directory")
-    actual_score, _ = _grade_pytest(fake_path)
-    assert actual_score == expected_score
+    commands = []
+
+    def fake_run(args, *, cwd, timeout, limits, trace):
+        commands.append(args)
+        if "TestHello#testBye" in args:
+            return subprocess.CompletedProcess(args, 134, b"", b"JVM crashed\n"), None
+        if args[0] == "javac":
+            return subprocess.CompletedProcess(args, 0, b"", b""), None
+        reports = Path(cwd) / args[-1].removeprefix("--reports-dir=")
+        reports.mkdir()
+        (reports / "TEST-junit-jupiter.xml").write_text(JUNIT_REPORT)
+        return subprocess.CompletedProcess(args, 1, b"junit output\n", b""), None
+
+    monkeypatch.setattr(sys.modules["pycs.grader.ICS4UGrader"], "run", fake_run)
+    grader = ICS4UGrader(code_path, shards=2)
+    score, comments = grader.grade_unit_test()
+    assert [args[0] for args in commands] == ["javac", "java", "java", "java"]
+    assert "-c" in commands[-1]
+    assert (score, comments) == (2, "junit output\n")
+    assert len(grader.test_results) == 2
+
+
+def test__grade_junit_crash_is_reported(tmp_path, monkeypatch):
+    """A launcher that doesn't finish isn't scored as if every test ran"""
+    (tmp_path / "student").mkdir()
+    (tmp_path / "tests-java").mkdir()
+    code_path = tmp_path / "student" / "Hello.java"
+    code_path.write_text("public class Hello {}\n")
+    (tmp_path / "tests-java" / "TestHello.java").write_text("public class TestHello {}\n")
+
+    def fake_run(args, *, cwd, timeout, limits, trace):
+        if args[0] == "javac":
+            return subprocess.CompletedProcess(args, 0, b"", b""), None
+        process = subprocess.CompletedProcess(args, 134, b"partial\n", b"JVM crashed\n")
+        return process, None
+
+    monkeypatch.setattr(sys.modules["pycs.grader.ICS4UGrader"], "run", fake_run)
+    score, comments = ICS4UGrader(code_path).grade_unit_test()
+    assert (score, comments) == (1, "partial\nJVM crashed\n")
+
+
+def test__grade_junit_unbalanced_braces_skip_javac(tmp_path, monkeypatch):
+    """Unbalanced braces are reported without starting javac"""
+    (tmp_path / "student").mkdir()
+    (tmp_path / "tests-java").mkdir()
+    code_path = tmp_path / "student" / "Hello.java"
+    code_path.write_text("public class Hello {\n    void hi() {\n}\n")
+    (tmp_path / "tests-java" / "TestHello.java").write_text("public class TestHello {}\n")
+    monkeypatch.setattr(
+        sys.modules["pycs.grader.ICS4UGrader"], "run", lambda *_, **__: pytest.fail("ran")
+    )
+    score, comments = ICS4UGrader(code_path).grade_unit_test()
+    assert (score, comments) == (1, "\n\nError: Hello.java:1: error: '{' is never closed")
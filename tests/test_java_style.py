@@ -0,0 +1,136 @@
+from pycs.grader.java_style import (
+    analyze,
+    normalize,
+    strip_package,
+    structure_error,
+)
+
+HEADER = """package school;
+
+import java.util.Scanner;
+
+/**
+ * Author: Tester
+ * Date: 01/01/2023
+ * Says hello
+ */
+"""
+
+
+def _variables(body: str) -> list[str]:
+    return analyze(f"public class Main {{\n{body}\n}}\n").variables
+
+
+def test_header_lines_skip_package_and_imports():
+    report = analyze(HEADER + "public class Main {}\n")
+    assert report.header_lines == [
+        "/**",
+        " * Author: Tester",
+        " * Date: 01/01/2023",
+        " * Says hello",
+        " */",
+    ]
+
+
+def test_fields_with_modifiers_and_generics():
+    body = (
+        "private static final int MAX_SIZE = 10;\n"
+        "@Deprecated protected Map<String, List<Integer>> tallies = new HashMap<>();\n"
+    )
+    assert _variables(body) == ["MAX_SIZE", "tallies"]
+
+
+def test_arrays_and_multiple_declarators():
+    body = "int[] marks = {1, 2}, other[];\nint a = f(1, 2), b, c = 3;\n"
+    assert _variables(body) == ["marks", "other", "a", "b", "c"]
+
+
+def test_for_headers():
+    body = "void go() {\nfor (int i = 0, j = 1; i < j; i++) {}\nfor (String word : words) {}\n}"
+    assert _variables(body) == ["i", "j", "word"]
+
+
+def test_declarations_after_comments():
+    body = "void go() {\n// input\nScanner sc = new Scanner(System.in);\n}"
+    assert _variables(body) == ["sc"]
+
+
+def test_no_false_positives():
+    body = (
+        "public String name() { return \"int fake = 1;\"; }\n"
+        "void go() {\n"
+        "a = 5;\n"
+        "return x;\n"
+        "/* int other = 2; */\n"
+        "System.out.println(a == b);\n"
+        "}\n"
+    )
+    assert _variables(body) == []
+
+
+def test_only_line_leading_line_comments():
+    report = analyze("// Input\nint x = 1; // processing\n    // OUTPUT\n/* block */\n")
+    assert report.comments == ["// input", "// output"]
+
+
+def test_strip_package_only_touches_the_declaration():
+    source = (
+        "/* package notes; */\n"
+        "package school.unit1;\n"
+        "public class A {\n"
+        "    int packageCount; // package\n"
+        '    String s = "package x;";\n'
+        "}\n"
+    )
+    stripped = strip_package(source)
+    # Same lines, so javac's line numbers still match the student's file
+    assert stripped.count("\n") == source.count("\n")
+    assert stripped.splitlines()[1].strip() == ""
+    assert stripped.splitlines()[2:] == source.splitlines()[2:]
+    assert strip_package("public class A { int packageCount; }") == (
+        "public class A { int packageCount; }"
+    )
+
+
+def test_normalize_ignores_comments_and_formatting():
+    source = 'public class A {\n  int x = 1; String s = "a  // b";\n}\n'
+    commented = (
+        "/**\n * Author: Ann\n */\n"
+        "public class A {\n"
+        "    // input\n"
+        "    int x = 1; /* one */\n"
+        '    String s = "a  // b";\n'
+        "\n}\n"
+    )
+    assert normalize(source) == normalize(commented)
+    # Whitespace inside strings, and between tokens that would run together, counts
+    assert normalize(source) != normalize(source.replace("a  // b", "a // b"))
+    assert normalize("int y = a - -b;") != normalize("int y = a--b;")
+
+
+def test_structure_error_finds_unbalanced_brackets():
+    assert structure_error("public class A {\n  void f() {\n}\n", "A.java") == (
+        "A.java:1: error: '{' is never closed"
+    )
+    assert structure_error("public class A {\n  int x = (1;\n}\n", "A.java") == (
+        "A.java:3: error: '}' where the '(' from line 2 is open"
+    )
+    assert structure_error("public class A { }\n}\n", "A.java") == (
+        "A.java:2: error: '}' without a '{' to close"
+    )
+    # Brackets in strings, chars and comments don't count
+    source = (
+        "public class A {\n"
+        '    String s = "{(";\n'
+        "    char c = '}';\n"
+        "    /* ) */ // ]\n"
+        "}\n"
+    )
+    assert structure_error(source, "A.java") is None
+
+
+def test_structure_error_needs_the_class_the_file_is_named_after():
+    assert structure_error("public class Stats<T> { }", "Stats.java") is None
+    assert structure_error("// class Stats\npublic class Stat { }", "Stats.java") == (
+        "Stats.java:1: error: there is no class Stats in Stats.java"
+    )
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+import io
+import threading
+from pathlib import Path
+
+import pytest
+
+from pycs.controllers import assignment as ass_controller
+from pycs.exc import GradingBacklogFullException
+from pycs.extensions import grading_queue
+from pycs.grader import Usage
+from pycs.grader.trace import Trace
+
+
+class FakeGrader:
+    def __init__(self, score=4, comments="nice", release=None):
+        self.score = score
+        self.comments = comments
+        self.release = release
+        self.test_results = []
+        self.usage = None
+        self.trace = Trace()
+
+    def grade_student(self):
+        if self.release is not None:
+            self.release.wait(5)
+        return self.score, self.comments
+
+
+def test_inline_grading_stores_score(app, monkeypatch):
+    """With no workers, a submitted job is graded before submit returns"""
+    monkeypatch.setattr("pycs.grader.get_grader", lambda *_, **__: FakeGrader())
+    grading_queue.submit(2, 1, 1, Path("hello.py"))
+
+    with app.app_context():
+        ua = ass_controller.get_user_assignment(2, 1)
+        assert ua.score == 4
+        assert ua.comments == "nice"
+    assert grading_queue.status(2, 1) is None
+
+
+def test_worker_pool_grades_in_background(app, monkeypatch):
+    """Jobs stay visible as queued/running until a worker stores the score"""
+    app.config["GRADING_WORKERS"] = 1
+    release = threading.Event()
+    graded = threading.Semaphore(0)
+    monkeypatch.setattr(
+        "pycs.grader.get_grader", lambda *_, **__: FakeGrader(3, "ok", release)
+    )
+    original = grading_queue._grade
+
+    def _grade(job):
+        original(job)
+        graded.release()
+
+    monkeypatch.setattr(grading_queue, "_grade", _grade)
+
+    first = grading_queue.submit(2, 1, 1, Path("hello.py"))
+    assert grading_queue.status(2, 1).id == first.id
+
+    # A resubmission while the first is still waiting does not add a job
+    second = grading_queue.submit(2, 3, 1, Path("other.py"))
+    again = grading_queue.submit(2, 3, 1, Path("other.py"))
+    assert second.id == again.id
+
+    release.set()
+    assert graded.acquire(timeout=5) and graded.acquire(timeout=5)
+    with app.app_context():
+        assert ass_controller.get_user_assignment(2, 1).score == 3
+
+
+def test_usage_is_stored(app, monkeypatch):
+    """What grading used is kept, and a run that used nothing doesn't erase it"""
+    grader = FakeGrader()
+    grader.usage = Usage(cpu_time=0.25, max_rss=50 * 1024 * 1024)
+    monkeypatch.setattr("pycs.grader.get_grader", lambda *_, **__: grader)
+    grading_queue.submit(2, 1, 1, Path("hello.py"))
+
+    cached = FakeGrader(score=3)
+    cached.usage = None
+    monkeypatch.setattr("pycs.grader.get_grader", lambda *_, **__: cached)
+    grading_queue.submit(2, 1, 1, Path("hello.py"))
+
+    with app.app_context():
+        ua = ass_controller.get_user_assignment(2, 1)
+        assert ua.score == 3
+        assert (ua.cpu_time, ua.max_rss) == (0.25, 50 * 1024 * 1024)
+
+
+@pytest.fixture
+def held_queue(app, monkeypatch):
+    """A queue with workers configured but not started, so jobs stay queued"""
+    app.config["GRADING_WORKERS"] = 1
+    monkeypatch.setattr(grading_queue, "_ensure_workers", lambda: None)
+    return grading_queue
+
+
+def _drain(queue):
+    """Claim everything, in the order workers would"""
+    order = []
+    while (job := queue._claim("test-worker")) is not None:
+        order.append(job.key)
+    return order
+
+
+def test_students_take_turns(held_queue):
+    """One student with many submissions doesn't make everyone else wait"""
+    for assignment_id in (1, 2, 3):
+        held_queue.submit(2, assignment_id, 1, Path("hello.py"))
+    held_queue.submit(3, 1, 1, Path("hello.py"))
+    held_queue.submit(4, 1, 1, Path("hello.py"))
+
+    assert _drain(held_queue) == [(2, 1), (3, 1), (4, 1), (2, 2), (2, 3)]
+
+
+def test_assignments_due_soon_go_first(held_queue):
+    now = datetime.now()
+    held_queue.submit(2, 1, 1, Path("hello.py"), now + timedelta(days=7))
+    held_queue.submit(3, 1, 1, Path("hello.py"), now - timedelta(minutes=5))
+    held_queue.submit(4, 2, 1, Path("hello.py"), now + timedelta(hours=1))
+    held_queue.submit(5, 3, 1, Path("hello.py"), now + timedelta(minutes=10))
+
+    assert _drain(held_queue)[:2] == [(5, 3), (4, 2)]
+
+
+def test_full_backlog_turns_new_jobs_away(app, held_queue):
+    app.config["GRADING_MAX_BACKLOG"] = 2
+    held_queue.submit(2, 1, 1, Path("hello.py"))
+    held_queue.submit(3, 1, 1, Path("hello.py"))
+
+    with pytest.raises(GradingBacklogFullException) as e:
+        held_queue.submit(4, 1, 1, Path("hello.py"))
+    assert e.value.retry_after >= 5
+    # Resubmitting a job that is already waiting doesn't add to the backlog
+    held_queue.submit(2, 1, 1, Path("hello.py"))
+    assert held_queue.depth == 2
+
+
+def test_upload_with_full_backlog_is_saved_and_503(app, client, auth, held_queue):
+    app.config["GRADING_MAX_BACKLOG"] = 0
+    auth.login()
+    response = client.post(
+        "/app/1/assignment/1",
+        data={"code": (io.BytesIO(b"print('hello')\n"), "hello.py")},
+        content_type="multipart/form-data",
+    )
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 5
+    assert b"Your file was saved" in response.data
+    assert (Path(app.config["UPLOAD_FOLDER"]) / "999999999" / "hello.py").is_file()
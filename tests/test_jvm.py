@@ -0,0 +1,113 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+from pycs.grader import JUNIT_JAR, JvmDaemon
+from pycs.grader.jvm import DAEMON_SOURCE
+from pycs.grader.limits import ResourceLimits
+
+# Where the benchmark looks for it too, unless told otherwise
+JUNIT = Path(os.environ.get("PYCS_JUNIT_JAR", Path("instance/code/lib") / JUNIT_JAR))
+
+
+@pytest.mark.skipif(
+    shutil.which("javac") is None or not JUNIT.is_file(),
+    reason="needs javac and the JUnit console jar (PYCS_JUNIT_JAR)",
+)
+def test_daemon_compiles(tmp_path):
+    process = subprocess.run(
+        ["javac", "-d", str(tmp_path), "-cp", str(JUNIT), str(DAEMON_SOURCE)],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    assert process.returncode == 0, process.stderr
+
+
+@pytest.mark.skipif(os.name != "posix", reason="rlimits and sessions are posix")
+def test_daemon_runs_under_the_grading_limits(tmp_path, monkeypatch):
+    """The JVM gets the limits of a java subprocess, minus the CPU time one"""
+    started = []
+    monkeypatch.setattr(
+        "pycs.grader.jvm.spawn", lambda *args, **kwargs: started.append((args, kwargs))
+    )
+    limits = ResourceLimits(cpu_seconds=10, address_space=256 << 20, processes=64)
+    daemon = JvmDaemon(tmp_path / JUNIT_JAR, limits=limits)
+    daemon._start()
+
+    (((args, run_limits), kwargs),) = started
+    assert args[:2] == ["java", "-Xmx256m"]
+    assert run_limits == ResourceLimits(processes=64)
+    # Not wherever the server happens to run
+    assert Path(kwargs["cwd"]).is_dir() and Path(kwargs["cwd"]) != Path.cwd()
+    daemon.close()
+    assert not Path(kwargs["cwd"]).exists()
+
+
+# Stands in for GradingDaemon.java: answers every job, and gives up on the one
+# whose code is "timeout" the way the daemon does, by saying so and exiting
+FAKE_DAEMON = """
+import base64, sys, time
+for line in sys.stdin:
+    job_id, _, source = line.split("\\t")[:3]
+    if base64.b64decode(source) == b"timeout":
+        time.sleep(0.5)
+        print(job_id, "TIMEOUT", 0, 0, 0, "", sep="\\t", flush=True)
+        break
+    print(job_id, "OK", 1, 0, 0, "", sep="\\t", flush=True)
+"""
+
+
+def fake_daemon(tmp_path, monkeypatch, failures=0):
+    """A JvmDaemon of one JVM running FAKE_DAEMON, whose first `failures` starts fail"""
+    starts = []
+
+    def start(self):
+        starts.append(None)
+        if len(starts) <= failures:
+            raise FileNotFoundError("java")
+        return subprocess.Popen(
+            [sys.executable, "-c", FAKE_DAEMON],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            start_new_session=True,
+        )
+
+    monkeypatch.setattr(JvmDaemon, "_start", start)
+    return JvmDaemon(tmp_path / JUNIT_JAR, size=1), starts
+
+
+def run_job(daemon, source):
+    return daemon.run("Main.java", source, "MainTest.java", "", timeout=5)
+
+
+@pytest.mark.skipif(os.name != "posix", reason="the fake JVM gets its own session")
+def test_waiting_job_gets_a_new_jvm_after_a_timeout(tmp_path, monkeypatch):
+    daemon, starts = fake_daemon(tmp_path, monkeypatch)
+    with ThreadPoolExecutor(2) as executor:
+        timed_out = executor.submit(run_job, daemon, "timeout")
+        # Waits for the only JVM, which then dies
+        time.sleep(0.1)
+        waiting = executor.submit(run_job, daemon, "ok")
+        assert timed_out.result(timeout=10).status == "TIMEOUT"
+        assert waiting.result(timeout=10).status == "OK"
+    assert len(starts) == 2
+    daemon.close()
+
+
+@pytest.mark.skipif(os.name != "posix", reason="the fake JVM gets its own session")
+def test_failed_start_frees_its_place(tmp_path, monkeypatch):
+    daemon, starts = fake_daemon(tmp_path, monkeypatch, failures=1)
+    with pytest.raises(FileNotFoundError):
+        run_job(daemon, "ok")
+    with ThreadPoolExecutor(1) as executor:
+        assert executor.submit(run_job, daemon, "ok").result(timeout=10).status == "OK"
+    assert len(starts) == 2
+    daemon.close()
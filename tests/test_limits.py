@@ -0,0 +1,107 @@
+from pathlib import Path
+import re
+import subprocess
+import sys
+import time
+
+import pytest
+
+from pycs.grader.limits import ResourceLimits, Usage, run
+
+resource = pytest.importorskip("resource")
+
+
+def _python(code: str) -> list[str]:
+    return [sys.executable, "-c", code]
+
+
+def test_run_reports_usage(tmp_path):
+    process, usage = run(
+        _python("print('hi'); x = bytearray(50_000_000)"), cwd=tmp_path, timeout=5
+    )
+    assert process.returncode == 0
+    assert process.stdout == b"hi\n"
+    assert usage.cpu_time > 0
+    assert usage.max_rss >= 50_000_000
+
+
+def test_memory_and_file_limits(tmp_path):
+    limits = ResourceLimits(address_space=256 * 1024 * 1024, file_size=1024 * 1024)
+    process, _ = run(
+        _python("x = bytearray(1_000_000_000)"), cwd=tmp_path, timeout=5, limits=limits
+    )
+    assert b"MemoryError" in process.stderr
+
+    process, _ = run(
+        _python("open('big', 'wb').write(b'x' * 2_000_000)"),
+        cwd=tmp_path,
+        timeout=5,
+        limits=limits,
+    )
+    assert b"File too large" in process.stderr
+
+
+def test_cpu_limit(tmp_path):
+    process, usage = run(
+        _python("while True: pass"), cwd=tmp_path, timeout=10, limits=ResourceLimits(1)
+    )
+    assert process.returncode < 0
+    assert usage.cpu_time == pytest.approx(1, abs=0.5)
+
+
+@pytest.mark.skipif(not hasattr(resource, "prlimit"), reason="linux only")
+def test_limits_are_set_without_preexec_fn(tmp_path, monkeypatch):
+    """preexec_fn isn't safe with the grading threads around"""
+    popen = subprocess.Popen
+
+    def no_preexec_fn(*args, **kwargs):
+        assert kwargs.get("preexec_fn") is None
+        return popen(*args, **kwargs)
+
+    monkeypatch.setattr(subprocess, "Popen", no_preexec_fn)
+    limits = ResourceLimits(file_size=1024 * 1024)
+    process, _ = run(["cat", "/proc/self/limits"], cwd=tmp_path, timeout=5, limits=limits)
+    assert re.search(rb"Max file size +1048576 +1048576", process.stdout)
+
+    # The line that let it through isn't left for it to read
+    process, _ = run(
+        _python("import sys; print(repr(sys.stdin.read()))"),
+        cwd=tmp_path,
+        timeout=5,
+        limits=limits,
+    )
+    assert process.stdout == b"''\n"
+    with pytest.raises(FileNotFoundError):
+        run(["no-such-grader"], cwd=tmp_path, timeout=5, limits=limits)
+
+
+def test_timeout_kills_children(tmp_path):
+    """A timeout takes down everything the command started, not just the command"""
+    with pytest.raises(subprocess.TimeoutExpired) as e:
+        run(["sh", "-c", "sleep 30 & echo $! > pid; wait"], cwd=tmp_path, timeout=0.5)
+    assert isinstance(e.value.usage, Usage)
+    status = Path(f"/proc/{(tmp_path / 'pid').read_text().strip()}/status")
+    # Gone, or a zombie waiting for init to reap it
+    assert not status.exists() or "State:\tZ" in status.read_text()
+
+
+def test_timeout_holds_after_the_output_is_closed(tmp_path):
+    """Closing stdout and stderr doesn't get a program out of its timeout"""
+    code = "import os, time; os.closerange(0, 4096); time.sleep(30)"
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired) as e:
+        run(_python(code), cwd=tmp_path, timeout=0.5)
+    assert time.monotonic() - start < 5
+    assert isinstance(e.value.usage, Usage)
+
+
+def test_output_is_cut_to_its_head_and_tail(tmp_path):
+    """A program that prints without end only costs the output limit"""
+    code = "print('start'); [print('spam' * 100) for _ in range(50_000)]; print('end')"
+    process, _ = run(
+        _python(code), cwd=tmp_path, timeout=5, limits=ResourceLimits(output_bytes=1000)
+    )
+    assert process.stdout.startswith(b"start\n")
+    assert process.stdout.endswith(b"end\n")
+    assert b"bytes of output cut" in process.stdout
+    assert len(process.stdout) < 1100
@@ -0,0 +1,115 @@
+from pathlib import Path
+
+from pycs.controllers import assignment as ass_controller
+from pycs.extensions import db, grading_queue
+from pycs.grader.reports import FAILED, PASSED, TestCaseResult
+from pycs.models import TestResult, User
+
+STUDENT_CODE = '''"""
+author: Tester
+date: 01/01/2023
+Says hello
+"""
+
+
+def hello():
+    return "hello"
+'''
+
+TESTS = '''from hello import hello
+
+
+def test_hello():
+    assert hello() == "hello"
+
+
+def test_goodbye():
+    assert hello() == "goodbye"
+'''
+
+
+def _results(user_id: int) -> dict[str, str]:
+    return {
+        r.name: r.outcome
+        for r in db.session.execute(
+            db.select(TestResult).where(TestResult.user_id == user_id)
+        ).scalars()
+    }
+
+
+def test_grading_stores_each_test(app):
+    upload_folder = Path(app.config["UPLOAD_FOLDER"])
+    (upload_folder / "999999999").mkdir(parents=True, exist_ok=True)
+    code_path = upload_folder / "999999999" / "hello.py"
+    code_path.write_text(STUDENT_CODE)
+    (upload_folder / "tests" / "test_hello.py").write_text(TESTS)
+
+    grading_queue.submit(2, 1, 1, code_path)
+    with app.app_context():
+        assert _results(2) == {
+            "test_hello.test_hello": PASSED,
+            "test_hello.test_goodbye": FAILED,
+        }
+
+    # Grading again replaces the old results instead of adding to them
+    grading_queue.submit(2, 1, 1, code_path)
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count()).select_from(TestResult)) == 2
+
+
+def test_pass_rates_hardest_first(app, client):
+    with app.app_context():
+        assignment = ass_controller.get_assignment_by_id(1)
+        other = User(
+            student_number="888888888",
+            first_name="Other",
+            password_hash="x",
+            role="Student",
+        )
+        db.session.add(other)
+        db.session.commit()
+
+        ass_controller.save_scores(
+            assignment,
+            [
+                (
+                    2,
+                    2,
+                    "",
+                    [
+                        TestCaseResult("test_easy", "t", PASSED, 0.1),
+                        TestCaseResult("test_hard", "t", FAILED, 0.1),
+                    ],
+                    None,
+                    {},
+                ),
+                (
+                    other.id,
+                    4,
+                    "",
+                    [
+                        TestCaseResult("test_easy", "t", PASSED, 0.1),
+                        TestCaseResult("test_hard", "t", PASSED, 0.1),
+                    ],
+                    None,
+                    {},
+                ),
+            ],
+        )
+        rates = ass_controller.get_test_pass_rates(1)
+        assert [tuple(row) for row in rates] == [
+            (1, "hello ass", "t.test_hard", 2, 1),
+            (1, "hello ass", "t.test_easy", 2, 2),
+        ]
+        assert ass_controller.get_test_pass_rates(2) == []
+
+    client.post("/login", data={"student_number": "001310455", "password": "teacherpass"})
+    response = client.get("/teacher/classes/1/tests")
+    assert response.status_code == 200
+    assert response.data.index(b"t.test_hard") < response.data.index(b"t.test_easy")
+    assert b"50% pass" in response.data
+
+
+def test_pass_rates_of_unknown_class(client):
+    client.post("/login", data={"student_number": "001310455", "password": "teacherpass"})
+    assert client.get("/teacher/classes/999/tests").status_code == 404
@@ -0,0 +1,81 @@
+from pycs.grader.py_style import analyze, normalize, syntax_error
+
+
+def test_header_lines_skip_leading_blanks():
+    report = analyze('\n\n"""\nauthor: me\ndate: 01/01/2023\nhi\n"""\nx = 1\n')
+    assert report.header_lines == ['"""', "author: me", "date: 01/01/2023", "hi", '"""']
+
+
+def test_simple_and_augmented_assignment():
+    report = analyze("first_name = input()\ncount += 1\ntotal: int = 0\n")
+    assert report.variables == ["first_name", "count", "total"]
+
+
+def test_tuple_unpacking_and_chained_assignment():
+    report = analyze("a, (b, *c) = stuff\nx = y = 0\n")
+    assert report.variables == ["a", "b", "c", "x", "y"]
+
+
+def test_for_targets():
+    report = analyze("for i, item in enumerate(items):\n    pass\n")
+    assert report.variables == ["i", "item"]
+
+
+def test_no_false_positives():
+    source = (
+        'if x == y:\n'
+        '    print(x, sep=",", end="=")\n'
+        'value.attr = 3\n'
+        'things[0] = 4\n'
+        'check = a <= b != c\n'
+        '# note = 5\n'
+        'text = "a = b"\n'
+    )
+    assert analyze(source).variables == ["check", "text"]
+
+
+def test_only_line_leading_comments():
+    report = analyze("# Input\nx = 1  # processing\n    # OUTPUT\n")
+    assert report.comments == ["# input", "# output"]
+
+
+def test_normalize_ignores_comments_docstrings_and_formatting():
+    source = 'def add(a, b):\n    return a + b\n\nprint(add(1, 2))\n'
+    commented = (
+        '"""\nauthor: Ann\ndate: 01/02/2024\nAdds things\n"""\n\n'
+        "# input\n"
+        "def add(a,   b):\n"
+        '    """Add two numbers"""\n'
+        "    # processing / output\n"
+        "    return (a + b)\n"
+        "\n\n"
+        "print(add(1, 2))  # done\n"
+    )
+    assert normalize(source) == normalize(commented)
+    assert normalize(source) != normalize(source.replace("a + b", "a - b"))
+    assert normalize(source) != normalize(source.replace("(1, 2)", "('1', '2')"))
+    assert normalize("def add(a, b)\n    return a + b\n") is None
+
+
+def test_syntax_error_points_at_the_line_and_column():
+    error = syntax_error("x = 1\ndef add(a, b)\n    return a + b\n", "hello.py")
+    assert 'File "hello.py", line 2' in error
+    assert "SyntaxError: expected ':'" in error
+    assert error.splitlines()[2].strip() == "^"
+    assert "IndentationError" in syntax_error("if x:\nprint(x)\n", "hello.py")
+    assert syntax_error("print('\\d')\n", "hello.py") is None
+
+
+def test_one_line_compound_statements():
+    source = (
+        "if x: BadName = 1\n"
+        "while c: Other_Bad = 2\n"
+        "else: z = 3\n"
+        'if s == ":": y = 4\n'
+        "if d[1:2]: w = 5\n"
+        "for i in r: total += i\n"
+        "f = lambda a: a\n"
+        "if (n := 3): m = n\n"
+    )
+    variables = ["BadName", "Other_Bad", "z", "y", "w", "i", "total", "f", "m"]
+    assert analyze(source).variables == variables
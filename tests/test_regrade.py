@@ -0,0 +1,137 @@
+from pathlib import Path
+import threading
+
+from pycs.controllers import assignment as ass_controller
+from pycs.regrade import get_regrade, start_regrade
+
+STUDENT_CODE = '''"""
+author: Tester
+date: 01/01/2023
+Says hello
+"""
+
+
+def hello():
+    return "hello"
+'''
+
+PASSING_TEST = '''from hello import hello
+
+
+def test_hello():
+    assert hello() == "hello"
+'''
+
+FAILING_TEST = '''from hello import hello
+
+
+def test_hello():
+    assert hello() == "goodbye"
+'''
+
+
+def _submit(app, test_code=PASSING_TEST):
+    upload_folder = Path(app.config["UPLOAD_FOLDER"])
+    student_dir = upload_folder / "999999999"
+    student_dir.mkdir(parents=True, exist_ok=True)
+    (student_dir / "hello.py").write_text(STUDENT_CODE)
+    if test_code is not None:
+        (upload_folder / "tests").mkdir(parents=True, exist_ok=True)
+        (upload_folder / "tests" / "test_hello.py").write_text(test_code)
+
+
+def test_regrade_command_updates_stale_scores(app, runner):
+    """A new test file changes the score of every stored submission"""
+    _submit(app)
+    with app.app_context():
+        assignment = ass_controller.get_assignment_by_id(1)
+        ass_controller.save_score(2, assignment, 4, "old")
+
+    _submit(app, FAILING_TEST)
+    result = runner.invoke(args=["regrade", "1", "--workers", "0"])
+    assert result.exit_code == 0, result.output
+    assert "Graded 1/1" in result.output
+    assert "Regraded 1 submissions" in result.output
+
+    with app.app_context():
+        ua = ass_controller.get_user_assignment(2, 1)
+        assert "1 failed" in ua.comments
+
+
+def test_regrade_in_process_pool(app, runner):
+    _submit(app)
+    result = runner.invoke(args=["regrade", "1", "--workers", "2"])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        assert "1 passed" in ass_controller.get_user_assignment(2, 1).comments
+
+
+def test_regrade_without_test_file_keeps_scores(app, runner):
+    _submit(app, test_code=None)
+    with app.app_context():
+        assignment = ass_controller.get_assignment_by_id(1)
+        ass_controller.save_score(2, assignment, 3, "old")
+
+    result = runner.invoke(args=["regrade", "1", "--workers", "0"])
+    assert result.exit_code != 0
+    assert "Upload a test file" in result.output
+    with app.app_context():
+        assert ass_controller.get_user_assignment(2, 1).score == 3
+
+
+def test_regrade_button(app, client):
+    _submit(app)
+    client.post("/login", data={"student_number": "001310455", "password": "teacherpass"})
+    response = client.post("/teacher/assignments/1/regrade")
+    assert response.status_code == 302
+
+    with app.app_context():
+        assert "1 passed" in ass_controller.get_user_assignment(2, 1).comments
+    response = client.get("/teacher/assignments/1")
+    assert b"Last regrade: 1 submissions" in response.data
+
+
+def test_regrade_keeps_going_past_a_failed_submission(app, runner, monkeypatch):
+    """A submission the grader chokes on keeps its score, the regrade still finishes"""
+    _submit(app)
+    with app.app_context():
+        assignment = ass_controller.get_assignment_by_id(1)
+        ass_controller.save_score(2, assignment, 3, "old")
+
+    def crash(*_, **__):
+        raise RuntimeError("grader crashed")
+
+    monkeypatch.setattr("pycs.regrade._regrades", {})
+    monkeypatch.setattr("pycs.regrade._grade", crash)
+    result = runner.invoke(args=["regrade", "1", "--workers", "0"])
+    assert result.exit_code == 0, result.output
+    assert "Failed 999999999: grader crashed" in result.output
+    assert "Regraded 0 submissions" in result.output
+
+    regrade = get_regrade(1)
+    assert regrade.status == "done"
+    assert regrade.failed == [("999999999", "grader crashed")]
+    with app.app_context():
+        assert ass_controller.get_user_assignment(2, 1).score == 3
+
+
+def test_start_regrade_starts_one_at_a_time(app, monkeypatch):
+    """A second click while a regrade is starting gets the running one"""
+    app.config["GRADING_WORKERS"] = 1
+    started = []
+    release = threading.Event()
+
+    def slow_regrade(assignment_id, *, regrade):
+        started.append(regrade)
+        release.wait(5)
+        regrade.status = "done"
+
+    monkeypatch.setattr("pycs.regrade._regrades", {})
+    monkeypatch.setattr("pycs.regrade.regrade_assignment", slow_regrade)
+    with app.app_context():
+        assert start_regrade(1) is None
+        running = start_regrade(1)
+    release.set()
+    assert running is get_regrade(1)
+    assert len(started) <= 1 and all(regrade is running for regrade in started)
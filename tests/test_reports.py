@@ -0,0 +1,44 @@
+from pycs.grader.reports import parse_junit_xml, parse_reports_dir, summarize
+
+PYTEST_REPORT = """<?xml version="1.0" encoding="utf-8"?>
+<testsuites><testsuite name="pytest" errors="0" failures="1" skipped="0" tests="2">
+<testcase classname="test_hello" name="test_hello" time="0.012" />
+<testcase classname="test_hello" name="test_goodbye" time="0.003">
+<failure message="AssertionError: assert 'hello' == 'goodbye'">def test_goodbye():
+&gt;       assert hello() == "goodbye"</failure>
+</testcase>
+</testsuite></testsuites>
+"""
+
+JUNIT_REPORT = """<?xml version="1.0" encoding="UTF-8"?>
+<testsuite name="JUnit Jupiter" tests="3" skipped="1" failures="1" errors="0">
+<testcase name="testAdd()" classname="TestCalc" time="0.02"><system-out>ok</system-out></testcase>
+<testcase name="testDivide()" classname="TestCalc" time="0.01">
+<failure message="expected: &lt;2&gt; but was: &lt;3&gt;" type="org.opentest4j.AssertionFailedError">trace</failure>
+</testcase>
+<testcase name="testLater()" classname="TestCalc" time="0"><skipped/></testcase>
+</testsuite>
+"""
+
+
+def test_parse_pytest_junitxml(tmp_path):
+    report = tmp_path / "report.xml"
+    report.write_text(PYTEST_REPORT)
+
+    passed, failed = parse_junit_xml(report)
+    assert (passed.name, passed.outcome, passed.duration) == ("test_hello", "passed", 0.012)
+    assert failed.outcome == "failed"
+    assert failed.message == "AssertionError: assert 'hello' == 'goodbye'"
+
+
+def test_parse_junit_reports_dir(tmp_path):
+    (tmp_path / "TEST-junit-jupiter.xml").write_text(JUNIT_REPORT)
+    (tmp_path / "not-a-report.txt").write_text("nope")
+
+    results = list(parse_reports_dir(tmp_path))
+    assert [r.name for r in results] == ["testAdd()", "testDivide()", "testLater()"]
+    assert results[1].message == "expected: <2> but was: <3>"
+
+    summary = summarize(results)
+    assert (summary.passed, summary.failed, summary.skipped) == (1, 1, 1)
+    assert summary.total == 3
@@ -0,0 +1,95 @@
+import os
+
+from pycs.grader import ICS3UGrader, build_test_artifacts
+from pycs.grader.sandbox import WorkspacePool, copy, temporary_workspace
+
+STUDENT_CODE = '''def hello():
+    return "hello"
+'''
+
+TEST_CODE = '''from hello import hello
+
+
+def test_hello():
+    assert hello() == "hello"
+'''
+
+
+def test_pool_hands_out_empty_workspaces_and_tears_them_down(tmp_path):
+    pool = WorkspacePool(tmp_path, size=2)
+    try:
+        with pool.workspace() as workspace:
+            assert list(workspace.iterdir()) == []
+            (workspace / "left_behind.class").write_text("")
+        with pool.workspace() as other:
+            assert other != workspace
+            assert list(other.iterdir()) == []
+    finally:
+        pool.close()
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_copy_keeps_the_modification_time(tmp_path):
+    src = tmp_path / "hello.py"
+    src.write_text(STUDENT_CODE)
+    os.utime(src, ns=(0, 1_000_000_000))
+    with temporary_workspace(tmp_path) as workspace:
+        copied = copy(workspace, src)
+        assert not copied.is_symlink()
+        assert copied.read_text() == STUDENT_CODE
+        assert copied.stat().st_mtime_ns == src.stat().st_mtime_ns
+    assert not workspace.exists()
+
+
+def test_grading_leaves_the_student_directory_alone(tmp_path):
+    (tmp_path / "tests").mkdir()
+    (tmp_path / "tests" / "test_hello.py").write_text(TEST_CODE)
+    student_dir = tmp_path / "999999999"
+    student_dir.mkdir()
+    (student_dir / "hello.py").write_text(STUDENT_CODE)
+
+    runs = tmp_path / "runs"
+    runs.mkdir()
+    pool = WorkspacePool(runs, size=1)
+    try:
+        grader = ICS3UGrader(student_dir / "hello.py", workspaces=pool)
+        score, output = grader.grade_unit_test()
+    finally:
+        pool.close()
+    assert score == 4, output
+    assert [p.name for p in student_dir.iterdir()] == ["hello.py"]
+    assert list(runs.iterdir()) == []
+
+
+OVERWRITING_CODE = """open("test_hello.py", "w").write("def test_hello():\\n    pass\\n")
+for pyc in __import__("pathlib").Path("__pycache__").glob("*"):
+    pyc.write_bytes(b"")
+open(__file__, "w").write("")
+
+
+def hello():
+    return "goodbye"
+"""
+
+
+def test_submission_cannot_overwrite_the_test_file(tmp_path):
+    """The student's code runs next to the test file, but only ever a copy of it"""
+    test_path = tmp_path / "tests" / "test_hello.py"
+    test_path.parent.mkdir()
+    test_path.write_text(TEST_CODE)
+    student_dir = tmp_path / "999999999"
+    student_dir.mkdir()
+    (student_dir / "hello.py").write_text(OVERWRITING_CODE)
+
+    for prebuilt in (False, True):
+        if prebuilt:
+            artifacts = build_test_artifacts(test_path)
+            pycs = {pyc: pyc.read_bytes() for pyc in artifacts.path.rglob("*.pyc")}
+        grader = ICS3UGrader(student_dir / "hello.py")
+        score, output = grader.grade_unit_test()
+        assert score == 0, output
+        assert test_path.read_text() == TEST_CODE
+        assert (student_dir / "hello.py").read_text() == OVERWRITING_CODE
+        if prebuilt:
+            assert artifacts.test_file.read_text() == TEST_CODE
+            assert {pyc: pyc.read_bytes() for pyc in pycs} == pycs
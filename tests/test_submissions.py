@@ -0,0 +1,95 @@
+import io
+from pathlib import Path
+import zlib
+
+from pycs.blobs import BlobStore
+from pycs.controllers import assignment as ass_controller
+from pycs.grader.trace import Trace
+
+
+class EchoGrader:
+    """Scores a submission by what is in it"""
+
+    def __init__(self, code_path):
+        self.code = Path(code_path).read_text()
+        self.test_results = []
+        self.usage = None
+        self.trace = Trace()
+
+    def grade_student(self):
+        return (4 if "v1" in self.code else 2), self.code
+
+
+def test_blob_store_dedups_and_compresses(tmp_path):
+    store = BlobStore(tmp_path)
+    data = b"print('hello')\n" * 100
+
+    digest = store.put(data)
+
+    assert store.put(data) == digest
+    path = store.path(digest)
+    assert path.parent.name == digest[:2] and path.name == digest[2:]
+    assert zlib.decompress(path.read_bytes()) == data
+    assert len(path.read_bytes()) < len(data)
+    assert store.get(digest) == data
+    # No temporary files left behind
+    assert [p.name for p in path.parent.iterdir()] == [digest[2:]]
+
+
+def _upload(client, code: bytes):
+    return client.post(
+        "/app/1/assignment/1",
+        data={"code": (io.BytesIO(code), "hello.py")},
+        content_type="multipart/form-data",
+    )
+
+
+def test_every_upload_is_kept(app, client, auth, monkeypatch):
+    monkeypatch.setattr(
+        "pycs.grader.get_grader", lambda _, code_path, **__: EchoGrader(code_path)
+    )
+    auth.login()
+    for code in (b"# v1\n", b"# v2\n", b"# v2\n"):
+        _upload(client, code)
+
+    with app.app_context():
+        submissions = list(ass_controller.get_submissions(2, 1))
+        # Newest first
+        assert [ass_controller.read_submission(s) for s in submissions] == [
+            b"# v2\n",
+            b"# v2\n",
+            b"# v1\n",
+        ]
+        # The same file uploaded twice is stored once
+        assert submissions[0].blob == submissions[1].blob
+        blobs = Path(app.config["UPLOAD_FOLDER"]) / "blobs"
+        assert len([p for p in blobs.rglob("*") if p.is_file()]) == 2
+    upload = Path(app.config["UPLOAD_FOLDER"]) / "999999999" / "hello.py"
+    assert upload.read_bytes() == b"# v2\n"
+
+
+def test_teacher_downloads_and_regrades_an_old_version(app, client, auth, monkeypatch):
+    monkeypatch.setattr(
+        "pycs.grader.get_grader", lambda _, code_path, **__: EchoGrader(code_path)
+    )
+    auth.login()
+    _upload(client, b"# v1\n")
+    _upload(client, b"# v2\n")
+    auth.logout()
+    with app.app_context():
+        assert ass_controller.get_user_assignment(2, 1).score == 2
+        first = list(ass_controller.get_submissions(2, 1))[-1].id
+
+    auth.login("001310455", "teacherpass")
+    page = client.get("/teacher/students/999999999/course/1/assignment/1")
+    assert b"Submission history" in page.data
+    download = client.get(f"/teacher/submissions/{first}")
+    assert download.data == b"# v1\n"
+    assert "hello.py" in download.headers["Content-Disposition"]
+
+    client.post(f"/teacher/submissions/{first}/regrade")
+
+    upload = Path(app.config["UPLOAD_FOLDER"]) / "999999999" / "hello.py"
+    assert upload.read_bytes() == b"# v1\n"
+    with app.app_context():
+        assert ass_controller.get_user_assignment(2, 1).score == 4
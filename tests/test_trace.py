@@ -0,0 +1,85 @@
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from pycs.controllers import assignment as ass_controller
+from pycs.extensions import db, grading_queue
+from pycs.grader import ICS3UGrader
+from pycs.grader.trace import Trace
+from pycs.models import GradingTiming
+
+resources = Path(__file__).parent / "resources"
+
+
+def test_trace_adds_up_repeated_stages():
+    trace = Trace()
+    trace.add("compile", 0.25)
+    trace.add("compile", 0.5)
+    with trace.stage("parse"):
+        pass
+    assert trace.timings["compile"] == 0.75
+    assert trace.timings["parse"] >= 0
+
+
+def test_grader_times_every_stage(monkeypatch):
+    monkeypatch.setattr(ICS3UGrader, "_run_pytest", lambda self: ("output", []))
+    grader = ICS3UGrader(resources / "hello.py")
+    grader.grade_student()
+    # The unit tests run alongside the style checks, so they may finish first
+    assert set(grader.trace.timings) == {
+        "header",
+        "ipo",
+        "variables",
+        "unit_test",
+        "precheck",
+    }
+
+
+def test_timings_are_stored_and_summarized(app, client, monkeypatch):
+    class TimedGrader:
+        test_results = []
+        usage = None
+
+        def __init__(self, seconds):
+            self.trace = Trace()
+            self.trace.add("unit_test", seconds)
+
+        def grade_student(self):
+            return 4, "nice"
+
+    for seconds in (0.1, 0.2, 0.3, 0.4, 2.0):
+        monkeypatch.setattr(
+            "pycs.grader.get_grader", lambda *_, **__: TimedGrader(seconds)
+        )
+        grading_queue.submit(2, 1, 1, Path("hello.py"))
+
+    with app.app_context():
+        assert db.session.scalar(db.select(db.func.count(GradingTiming.id))) == 5
+        (stats,) = ass_controller.get_stage_percentiles()
+        assert stats["stage"] == "unit_test"
+        assert stats["runs"] == 5
+        assert stats["p50"] == 0.3
+        assert stats["p95"] == 2.0
+
+    client.post("/login", data={"student_number": "001310455", "password": "teacherpass"})
+    response = client.get("/teacher/timings")
+    assert b"300 ms / 2000 ms" in response.data
+
+
+def test_old_timings_are_not_counted_and_pruned(app, monkeypatch):
+    monkeypatch.setattr("pycs.controllers.assignment._timings_pruned_at", float("-inf"))
+    old = datetime.now() - app.config["GRADING_TIMINGS_WINDOW"] - timedelta(days=1)
+    with app.app_context():
+        db.session.add(
+            GradingTiming(
+                user_id=2, assignment_id=1, stage="unit_test", seconds=9.0, graded_at=old
+            )
+        )
+        db.session.commit()
+        assert ass_controller.get_stage_percentiles() == []
+
+        assignment = ass_controller.get_assignment_by_id(1)
+        ass_controller.save_score(2, assignment, 4, "nice", timings={"unit_test": 0.5})
+        (stats,) = ass_controller.get_stage_percentiles()
+        assert stats["runs"] == 1 and stats["p50"] == 0.5
+        # Gone from the table, not just skipped
+        assert db.session.scalar(db.select(db.func.count(GradingTiming.id))) == 1
@@ -0,0 +1,205 @@
+from datetime import datetime, timedelta
+import multiprocessing
+import os
+from pathlib import Path
+import threading
+import time
+
+import pytest
+
+from pycs.controllers import assignment as ass_controller
+from pycs.events import DONE, GRADING, QUEUED
+from pycs.extensions import db, grading_queue
+from pycs.grader.trace import Trace
+from pycs.jobs import GRADING_FAILED_COMMENT
+from pycs.models import GradingJob, User
+
+
+@pytest.fixture
+def queue_only(app):
+    """Jobs go into the table, nothing in this process grades them"""
+    app.config["GRADING_QUEUE_ONLY"] = True
+    return grading_queue
+
+
+class SlowGrader:
+    def __init__(self, log: Path):
+        self.log = log
+        self.test_results = []
+        self.usage = None
+        self.trace = Trace()
+
+    def grade_student(self):
+        time.sleep(0.05)
+        with open(self.log, "a") as f:
+            f.write(f"{os.getpid()}\n")
+        return 4, "graded"
+
+
+def _add_job(app, **overrides) -> int:
+    with app.app_context():
+        job = GradingJob(
+            user_id=2, assignment_id=1, class_id=1, code_path="hello.py", **overrides
+        )
+        db.session.add(job)
+        db.session.commit()
+        return job.id
+
+
+def _worker_process(app):
+    # Connections don't survive a fork, open new ones
+    with app.app_context():
+        db.engine.dispose(close=False)
+    grading_queue.run_workers(2, until_idle=True)
+
+
+def test_worker_processes_share_one_sqlite_file(app, queue_only, tmp_path, monkeypatch):
+    """Every job is graded exactly once, whichever process claims it"""
+    log = tmp_path / "graded.log"
+    monkeypatch.setattr("pycs.grader.get_grader", lambda *_, **__: SlowGrader(log))
+    with app.app_context():
+        students = [
+            User(
+                student_number=f"10000000{n}",
+                first_name="Student",
+                password_hash="x",
+                role="Student",
+            )
+            for n in range(5)
+        ]
+        db.session.add_all(students)
+        db.session.commit()
+        user_ids = [2] + [student.id for student in students]
+    keys = [(user_id, a_id) for user_id in user_ids for a_id in (1, 3)]
+    for user_id, a_id in keys:
+        queue_only.submit(user_id, a_id, 1, Path("hello.py"))
+    assert queue_only.depth == len(keys)
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=_worker_process, args=(app,)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+        assert process.exitcode == 0
+
+    assert len(log.read_text().split()) == len(keys)
+    assert queue_only.depth == 0 and queue_only.running == 0
+    with app.app_context():
+        for user_id, a_id in keys:
+            assert ass_controller.get_user_assignment(user_id, a_id).score == 4
+
+
+def test_expired_lease_is_claimed_again(app, queue_only):
+    """A job whose worker died is picked up by another worker"""
+    job_id = _add_job(
+        app,
+        status="running",
+        attempts=1,
+        lease_owner="dead-node:1:grader-0",
+        lease_expires=datetime.now() - timedelta(seconds=1),
+    )
+
+    job = queue_only._claim("live-node:1:grader-0")
+
+    assert job.id == job_id
+    with app.app_context():
+        row = db.session.get(GradingJob, job_id)
+        assert (row.lease_owner, row.attempts) == ("live-node:1:grader-0", 2)
+        assert row.lease_expires > datetime.now()
+
+
+def test_live_lease_is_left_alone(app, queue_only):
+    _add_job(
+        app,
+        status="running",
+        lease_owner="busy-node:1:grader-0",
+        lease_expires=datetime.now() + timedelta(seconds=30),
+    )
+
+    assert queue_only._claim("live-node:1:grader-0") is None
+
+
+def test_job_that_keeps_crashing_is_given_up(app, queue_only):
+    job_id = _add_job(
+        app,
+        status="running",
+        attempts=app.config["GRADING_MAX_ATTEMPTS"],
+        lease_owner="dead-node:1:grader-0",
+        lease_expires=datetime.now() - timedelta(seconds=1),
+    )
+
+    with queue_only.events.subscribe(2, 1) as events:
+        assert queue_only._claim("live-node:1:grader-0") is None
+        # The student's page stops waiting for it
+        assert events.get_nowait() == {"event": DONE, "score": 0}
+    with app.app_context():
+        assert db.session.get(GradingJob, job_id) is None
+        ua = ass_controller.get_user_assignment(2, 1)
+        assert (ua.score, ua.comments) == (0, GRADING_FAILED_COMMENT)
+
+
+def test_lease_is_renewed_while_grading(app, queue_only):
+    app.config["GRADING_LEASE_SECONDS"] = 0.3
+    _add_job(app)
+    job = queue_only._claim("me")
+    with app.app_context():
+        first_expiry = db.session.get(GradingJob, job.id).lease_expires
+
+    done = threading.Event()
+    heartbeat = threading.Thread(
+        target=queue_only._renew_lease, args=(job, "me", done)
+    )
+    heartbeat.start()
+    time.sleep(0.5)
+    done.set()
+    heartbeat.join()
+
+    with app.app_context():
+        assert db.session.get(GradingJob, job.id).lease_expires > first_expiry
+
+
+def test_failed_grading_is_retried(app, queue_only, monkeypatch):
+    calls = []
+    original = queue_only._grade
+
+    def _grade(job):
+        calls.append(job.attempts)
+        if len(calls) == 1:
+            raise OSError("upload folder went away for a moment")
+        return original(job)
+
+    monkeypatch.setattr(queue_only, "_grade", _grade)
+    monkeypatch.setattr(
+        "pycs.grader.get_grader", lambda *_, **__: SlowGrader(Path(os.devnull))
+    )
+    queue_only.submit(2, 1, 1, Path("hello.py"))
+
+    with queue_only.events.subscribe(2, 1) as events:
+        queue_only.run_workers(1, until_idle=True)
+        seen = [events.get_nowait()["event"] for _ in range(events.qsize())]
+
+    assert calls == [1, 2]
+    assert seen == [GRADING, QUEUED, GRADING, DONE]
+    assert queue_only.depth == 0 and queue_only.running == 0
+    with app.app_context():
+        assert ass_controller.get_user_assignment(2, 1).score == 4
+
+
+def test_grading_that_keeps_failing_is_recorded(app, queue_only, monkeypatch):
+    calls = []
+
+    def _grade(job):
+        calls.append(job.attempts)
+        raise OSError("broken for good")
+
+    monkeypatch.setattr(queue_only, "_grade", _grade)
+    queue_only.submit(2, 1, 1, Path("hello.py"))
+
+    queue_only.run_workers(1, until_idle=True)
+
+    assert calls == list(range(1, app.config["GRADING_MAX_ATTEMPTS"] + 1))
+    assert queue_only.depth == 0 and queue_only.running == 0
+    with app.app_context():
+        ua = ass_controller.get_user_assignment(2, 1)
+        assert (ua.score, ua.comments) == (0, GRADING_FAILED_COMMENT)
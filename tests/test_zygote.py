@@ -0,0 +1,79 @@
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+import pytest
+
+from pycs.grader import PytestZygote
+from pycs.grader.limits import ResourceLimits
+
+
+@pytest.fixture
+def zygote():
+    zygote = PytestZygote()
+    yield zygote
+    zygote.close()
+
+
+def test_zygote_runs_pytest(zygote, tmp_path):
+    """The zygote reports the same pytest output as a pytest subprocess"""
+    (tmp_path / "test_thing.py").write_text(
+        "def test_pass():\n    assert True\n\ndef test_fail():\n    assert False\n"
+    )
+    returncode, output, usage = zygote.run(["-v", "test_thing.py"], tmp_path, timeout=5)
+    assert returncode == 1
+    assert usage.cpu_time > 0 and usage.max_rss > 0
+    assert "test_thing.py::test_pass PASSED" in output
+    assert "test_thing.py::test_fail FAILED" in output
+
+
+def test_zygote_timeout(zygote, tmp_path):
+    """Runs longer than the timeout are killed and reported as None"""
+    (tmp_path / "test_loop.py").write_text("def test_loop():\n    while True:\n        pass\n")
+    assert zygote.run(["test_loop.py"], tmp_path, timeout=0.5) is None
+
+    # The zygote is still usable afterwards
+    (tmp_path / "test_ok.py").write_text("def test_ok():\n    pass\n")
+    returncode, _, _ = zygote.run(["test_ok.py"], tmp_path, timeout=5)
+    assert returncode == 0
+
+
+def test_zygote_times_out_children_that_close_their_output(zygote, tmp_path):
+    """A child that closes its output and sleeps is still timed out, and doesn't
+    hold up the other children meanwhile"""
+    (tmp_path / "test_quiet.py").write_text(
+        "import os, time\n\ndef test_quiet():\n"
+        "    os.closerange(0, 4096)\n    time.sleep(30)\n"
+    )
+    (tmp_path / "test_ok.py").write_text("def test_ok():\n    pass\n")
+    with ThreadPoolExecutor(2) as pool:
+        quiet = pool.submit(zygote.run, ["test_quiet.py"], tmp_path, timeout=2)
+        time.sleep(0.5)
+        start = time.monotonic()
+        returncode, _, _ = zygote.run(["test_ok.py"], tmp_path, timeout=5)
+        assert returncode == 0
+        assert time.monotonic() - start < 1.5
+        assert quiet.result(timeout=10) is None
+
+
+def test_zygote_limits(zygote, tmp_path):
+    """Forked children run under the rlimits they are given"""
+    (tmp_path / "test_big.py").write_text(
+        "def test_big():\n    open('big', 'wb').write(b'x' * 2_000_000)\n"
+    )
+    limits = ResourceLimits(file_size=1_000_000)
+    returncode, output, _ = zygote.run(["test_big.py"], tmp_path, timeout=5, limits=limits)
+    assert returncode == 1
+    assert "File too large" in output
+
+
+def test_zygote_cuts_long_output(zygote, tmp_path):
+    """Only the head and tail of a chatty run come back, pytest's summary included"""
+    (tmp_path / "test_spam.py").write_text(
+        "def test_spam():\n    for _ in range(50_000):\n        print('spam' * 100)\n"
+        "    assert False\n"
+    )
+    limits = ResourceLimits(output_bytes=4000)
+    _, output, _ = zygote.run(["-s", "test_spam.py"], tmp_path, timeout=10, limits=limits)
+    assert "bytes of output cut" in output
+    assert "1 failed" in output
+    assert len(output) < 4100